@@ -0,0 +1,109 @@
+# Copyright (C) 2024 Intel Corporation
+# SPDX-License-Identifier: Apache-2.0
+
+"""Per-request JSON cost of the app-backend request path, per codec and sample workflow.
+
+Replays the bodies app-backend serializes and parses for one request of every workflow in
+sample-workflows/ (client request, each hop's request and response, one streamed chunk per
+LLM token in align_generator) with every installed JSON codec of the orchestrator. Run it
+where the patched orchestrator is importable, e.g. in the app-backend image:
+
+    PYTHONPATH=/home/user/GenAIComps python benchmarks/bench_json.py
+"""
+
+import argparse
+import glob
+import json
+import os
+import random
+import timeit
+
+from comps.cores.mega.orchestrator import JSON_CODECS
+
+SAMPLE_WORKFLOWS_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))), "sample-workflows")
+WORDS = ["the", "model", "returned", "an", "answer", "with", "context", "from", "retrieval", "Intel", "OPEA"]
+
+
+def text(rng, chars):
+    return " ".join(rng.choice(WORDS) for _ in range(chars // 6 + 1))
+
+
+def hop_bodies(microservice, args, rng):
+    """(objects app-backend dumps, bodies it loads) for one call of a microservice."""
+    prompt = text(rng, args.prompt_chars)
+    if "embedding" in microservice:
+        embedding = [rng.uniform(-1, 1) for _ in range(args.embedding_dim)]
+        return [{"input": prompt, "inputs": prompt}], [{"data": [{"index": 0, "embedding": embedding}]}]
+    if "retriever" in microservice:
+        embedding = [rng.uniform(-1, 1) for _ in range(args.embedding_dim)]
+        docs = [{"id": str(i), "text": text(rng, args.doc_chars)} for i in range(args.retrieved_docs)]
+        return [{"text": prompt, "embedding": embedding, "search_type": "similarity", "k": args.retrieved_docs}], [
+            {"retrieved_docs": docs, "initial_query": prompt}
+        ]
+    if "rerank" in microservice:
+        docs = [text(rng, args.doc_chars) for _ in range(args.retrieved_docs)]
+        return [{"initial_query": prompt, "texts": docs}], [{"query": prompt, "documents": docs[:1]}]
+    if "asr" in microservice:
+        return [{"audio": "A" * args.doc_chars}], [{"text": prompt}]
+    # llm, codegen, docsum and agents: the chat request, then one parsed chunk per streamed token
+    chunks = [
+        {"id": "chatcmpl", "choices": [{"index": 0, "delta": {"content": rng.choice(WORDS) + " "}, "finish_reason": None}]}
+        for _ in range(args.output_tokens)
+    ]
+    request = {"model": "NA", "messages": [{"role": "user", "content": prompt}], "max_tokens": 1024, "stream": True}
+    return [request], chunks
+
+
+def workflow_bodies(path, args):
+    with open(path, "r") as f:
+        flow = json.load(f)
+    rng = random.Random(0)
+    dumps_objects = []
+    # the client request itself
+    loads_bodies = [json.dumps({"messages": text(rng, args.prompt_chars), "stream": True})]
+    for node in flow["nodes"]:
+        if node["data"].get("inMegaservice") and "@" in node["data"]["name"]:
+            objects, bodies = hop_bodies(node["data"]["name"].split("@")[1], args, rng)
+            dumps_objects.extend(objects)
+            loads_bodies.extend(json.dumps(body) for body in bodies)
+    return dumps_objects, loads_bodies
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--workflows", nargs="+", default=sorted(glob.glob(os.path.join(SAMPLE_WORKFLOWS_DIR, "*.json"))))
+    parser.add_argument("--repeat", type=int, default=200)
+    parser.add_argument("--prompt-chars", type=int, default=256)
+    parser.add_argument("--output-tokens", type=int, default=256)
+    parser.add_argument("--embedding-dim", type=int, default=768)
+    parser.add_argument("--retrieved-docs", type=int, default=4)
+    parser.add_argument("--doc-chars", type=int, default=1024)
+    args = parser.parse_args()
+
+    codecs = []
+    for name, make_codec in JSON_CODECS.items():
+        try:
+            codecs.append(make_codec())
+        except ImportError:
+            print(f"{name} not installed, skipped")
+
+    print(f"{'workflow':>28} {'codec':>7} {'us/request':>11} {'vs stdlib':>9}")
+    for path in args.workflows:
+        workflow = os.path.splitext(os.path.basename(path))[0]
+        dumps_objects, loads_bodies = workflow_bodies(path, args)
+        timings = {}
+        for codec in codecs:
+
+            def run(codec=codec):
+                for obj in dumps_objects:
+                    codec.dumps(obj)
+                for body in loads_bodies:
+                    codec.loads(body)
+
+            timings[codec.name] = min(timeit.repeat(run, number=args.repeat, repeat=3)) / args.repeat * 1e6
+        for name, us in timings.items():
+            print(f"{workflow:>28} {name:>7} {us:>11.1f} {timings['stdlib'] / us:>8.2f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,101 @@
+# Copyright (C) 2024 Intel Corporation
+# SPDX-License-Identifier: Apache-2.0
+
+"""Microbenchmark for the post-processed stream re-chunking in the orchestrator.
+
+Compares the previous ``re.findall`` + ``repr(token.encode())`` implementation of
+``ServiceOrchestrator.token_generator`` / ``extract_chunk_str`` with the current one
+on multi-KB outputs. Run it where the patched orchestrator is importable, e.g. in
+the app-backend image:
+
+    PYTHONPATH=/home/user/GenAIComps python benchmarks/bench_token_generator.py
+"""
+
+import argparse
+import itertools
+import random
+import re
+import timeit
+
+from comps.cores.mega.orchestrator import ServiceOrchestrator
+
+WORDS = ["the", "model", "returned", "an", "answer,", "with", "context", "from", "retrieval.", "Intel", "OPEA"]
+# words that force the escaping path (quotes, escaped newlines, non-ASCII)
+ESCAPED_WORDS = WORDS + ["it's", "\\n", "naïve", "\"quoted\""]
+
+
+def legacy_extract_chunk_str(chunk_str):
+    if chunk_str == "data: [DONE]\n\n":
+        return ""
+    prefix = "data: b'"
+    prefix_2 = 'data: b"'
+    suffix = "'\n\n"
+    suffix_2 = '"\n\n'
+    if chunk_str.startswith(prefix) or chunk_str.startswith(prefix_2):
+        chunk_str = chunk_str[len(prefix) :]
+    if chunk_str.endswith(suffix) or chunk_str.endswith(suffix_2):
+        chunk_str = chunk_str[: -len(suffix)]
+    return chunk_str
+
+
+def legacy_token_generator(sentence, is_last):
+    prefix = "data: "
+    suffix = "\n\n"
+    tokens = re.findall(r"\s?\S+\s?", sentence, re.UNICODE)
+    for token in tokens:
+        # StreamingResponse encodes every str chunk before writing it
+        yield (prefix + repr(token.replace("\\n", "\n").encode("utf-8")) + suffix).encode("utf-8")
+    if is_last:
+        yield b"data: [DONE]\n\n"
+
+
+def make_sentence(size, words_pool, seed=0):
+    rng = random.Random(seed)
+    words = []
+    length = 0
+    while length < size:
+        word = rng.choice(words_pool)
+        words.append(word)
+        length += len(word) + 1
+    return " ".join(words)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sizes", type=int, nargs="+", default=[1024, 4096, 16384])
+    parser.add_argument("--repeat", type=int, default=200)
+    args = parser.parse_args()
+
+    orchestrator = ServiceOrchestrator()
+    # keep prometheus out of the measurement, only the re-chunking is compared
+    orchestrator.metrics = type("NoMetrics", (), {"token_update": staticmethod(lambda start, is_first: start)})()
+
+    print(f"{'corpus':>8} {'size':>8} {'legacy ms':>10} {'current ms':>11} {'speedup':>8}")
+    corpora = {"plain": WORDS, "escaped": ESCAPED_WORDS}
+    for corpus, size in itertools.product(corpora, args.sizes):
+        sentence = make_sentence(size, corpora[corpus])
+        chunks = [f"data: b'{word} '\n\n" for word in sentence.split(" ")]
+
+        legacy_frames = list(legacy_token_generator(sentence, True))
+        current_frames = list(orchestrator.token_generator(sentence, 0.0, is_first=True, is_last=True))
+        assert legacy_frames == current_frames, "re-chunked output differs from the legacy implementation"
+
+        def run_legacy():
+            for chunk in chunks:
+                legacy_extract_chunk_str(chunk)
+            for _ in legacy_token_generator(sentence, True):
+                pass
+
+        def run_current():
+            for chunk in chunks:
+                orchestrator.extract_chunk_str(chunk)
+            for _ in orchestrator.token_generator(sentence, 0.0, is_first=True, is_last=True):
+                pass
+
+        legacy = min(timeit.repeat(run_legacy, number=args.repeat, repeat=3)) / args.repeat * 1000
+        current = min(timeit.repeat(run_current, number=args.repeat, repeat=3)) / args.repeat * 1000
+        print(f"{corpus:>8} {size:>8} {legacy:>10.3f} {current:>11.3f} {legacy / current:>7.2f}x")
+
+
+if __name__ == "__main__":
+    main()
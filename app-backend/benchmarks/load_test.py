@@ -0,0 +1,326 @@
+# Copyright (C) 2024 Intel Corporation
+# SPDX-License-Identifier: Apache-2.0
+
+"""End-to-end load test for the app-backend megaservice.
+
+For every workflow in sample-workflows/ this boots megaservice.py against in-process
+stub microservices (embedding, retriever, reranking, LLM/agent, docsum, asr) with
+configurable latency, token rate and payload sizes, drives concurrent chat or docsum
+requests at /v1/app-backend and reports throughput, time to first token and
+p50/p95/p99 latencies. Run it from app-backend where comps (with the patched
+orchestrator) is importable, e.g.:
+
+    PYTHONPATH=/home/user/GenAIComps python benchmarks/load_test.py --concurrency 1 8 32
+"""
+
+import argparse
+import asyncio
+import glob
+import json
+import math
+import os
+import random
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+import uuid
+
+import aiohttp
+from aiohttp import web
+
+APP_BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+SAMPLE_WORKFLOWS_DIR = os.path.join(os.path.dirname(APP_BACKEND_DIR), "sample-workflows")
+# the workflows are converted by studio-backend, as for a deployment
+sys.path.insert(0, os.path.join(os.path.dirname(APP_BACKEND_DIR), "studio-backend"))
+
+from app.services.workflow_info_service import WorkflowInfo  # noqa: E402
+APP_BACKEND_PORT = 8899
+APP_BACKEND_ENDPOINT = f"http://127.0.0.1:{APP_BACKEND_PORT}/v1/app-backend"
+
+WORDS = ["the", "model", "returned", "an", "answer", "with", "context", "from", "retrieval", "Intel", "OPEA"]
+
+
+def load_sample_workflow(path):
+    """The workflow-info.json studio-backend exports for a Flowise export from sample-workflows/."""
+    with open(path, "r") as f:
+        flow = json.load(f)
+    name = os.path.splitext(os.path.basename(path))[0]
+    pipeline = {
+        "id": name,
+        "name": name,
+        "flowData": {"nodes": [node["data"] for node in flow["nodes"]], "edges": flow["edges"]},
+    }
+    return json.loads(WorkflowInfo(pipeline).export_to_json())
+
+
+class StubMicroservices:
+    """One aiohttp app serving every microservice endpoint the templates point at."""
+
+    def __init__(self, args):
+        self.args = args
+        self.rng = random.Random(0)
+        self.app = web.Application(client_max_size=64 * 1024 * 1024)
+        self.app.router.add_post("/v1/embeddings", self.embeddings)
+        self.app.router.add_post("/v1/retrieval", self.retrieval)
+        self.app.router.add_post("/v1/reranking", self.reranking)
+        self.app.router.add_post("/v1/chat/completions", self.chat_completions)
+        self.app.router.add_post("/v1/docsum", self.chat_completions)
+        self.app.router.add_post("/v1/asr", self.asr)
+        self.runner = None
+        self.port = None
+
+    async def start(self, host="127.0.0.1", port=0):
+        self.runner = web.AppRunner(self.app, access_log=None)
+        await self.runner.setup()
+        site = web.TCPSite(self.runner, host, port)
+        await site.start()
+        self.port = self.runner.addresses[0][1]
+        return self.port
+
+    async def stop(self):
+        if self.runner:
+            await self.runner.cleanup()
+
+    def text(self, chars):
+        words = []
+        length = 0
+        while length < chars:
+            word = self.rng.choice(WORDS)
+            words.append(word)
+            length += len(word) + 1
+        return " ".join(words)
+
+    async def embeddings(self, request):
+        await request.json()
+        await asyncio.sleep(self.args.embedding_latency_ms / 1000)
+        embedding = [self.rng.random() for _ in range(self.args.embedding_dim)]
+        return web.json_response({"object": "list", "data": [{"index": 0, "object": "embedding", "embedding": embedding}]})
+
+    async def retrieval(self, request):
+        data = await request.json()
+        await asyncio.sleep(self.args.retriever_latency_ms / 1000)
+        docs = [{"id": str(i), "text": self.text(self.args.doc_chars)} for i in range(self.args.retrieved_docs)]
+        return web.json_response({"id": str(uuid.uuid4()), "retrieved_docs": docs, "initial_query": data.get("text", "")})
+
+    async def reranking(self, request):
+        data = await request.json()
+        await asyncio.sleep(self.args.rerank_latency_ms / 1000)
+        documents = data.get("texts", [])[: self.args.rerank_top_n]
+        return web.json_response({"id": str(uuid.uuid4()), "query": data.get("initial_query", ""), "documents": documents})
+
+    async def asr(self, request):
+        await request.json()
+        await asyncio.sleep(self.args.asr_latency_ms / 1000)
+        return web.json_response({"text": self.text(self.args.prompt_chars)})
+
+    async def chat_completions(self, request):
+        data = await request.json()
+        await asyncio.sleep(self.args.llm_ttft_ms / 1000)
+        tokens = [self.rng.choice(WORDS) + " " for _ in range(self.args.output_tokens)]
+        if not data.get("stream", True):
+            await asyncio.sleep(len(tokens) / self.args.token_rate)
+            return web.json_response(
+                {
+                    "id": str(uuid.uuid4()),
+                    "object": "chat.completion",
+                    "choices": [{"index": 0, "message": {"role": "assistant", "content": "".join(tokens)}, "finish_reason": "stop"}],
+                }
+            )
+        response = web.StreamResponse(headers={"Content-Type": "text/event-stream"})
+        await response.prepare(request)
+        completion_id = str(uuid.uuid4())
+        for token in tokens:
+            chunk = {
+                "id": completion_id,
+                "object": "chat.completion.chunk",
+                "choices": [{"index": 0, "delta": {"content": token}, "finish_reason": None}],
+            }
+            await response.write(f"data: {json.dumps(chunk)}\n\n".encode("utf-8"))
+            await asyncio.sleep(1 / self.args.token_rate)
+        await response.write(b"data: [DONE]\n\n")
+        await response.write_eof()
+        return response
+
+
+def percentile(sorted_values, p):
+    """Nearest-rank percentile of an already sorted list."""
+    if not sorted_values:
+        return float("nan")
+    return sorted_values[max(0, math.ceil(p / 100 * len(sorted_values)) - 1)]
+
+
+def start_app_backend(workflow_info, stub_port, args, workdir):
+    """Launch megaservice.py against the stubs, the way the app-backend container does."""
+    os.makedirs(os.path.join(workdir, "config"), exist_ok=True)
+    with open(os.path.join(workdir, "config", "workflow-info.json"), "w") as f:
+        json.dump(workflow_info, f, indent=4)
+    env = dict(os.environ)
+    env["HOST_IP"] = "127.0.0.1"
+    env["APP_BACKEND_WORKERS"] = str(args.workers)
+    env["PYTHONUNBUFFERED"] = "1"
+    for node_id, node in workflow_info["nodes"].items():
+        if node["inMegaservice"] and "@" in node_id:
+            env[f"{node_id.split('@')[1]}_port"] = str(stub_port)
+    log_file = open(os.path.join(workdir, "app-backend.log"), "w")
+    process = subprocess.Popen(
+        [sys.executable, os.path.join(APP_BACKEND_DIR, "megaservice.py")],
+        cwd=workdir,
+        env=env,
+        stdout=log_file,
+        stderr=subprocess.STDOUT,
+    )
+    deadline = time.monotonic() + args.startup_timeout
+    while time.monotonic() < deadline:
+        if process.poll() is not None:
+            break
+        try:
+            socket.create_connection(("127.0.0.1", APP_BACKEND_PORT), timeout=1).close()
+            return process, log_file
+        except OSError:
+            time.sleep(0.2)
+    stop_app_backend(process, log_file)
+    with open(log_file.name, "r") as f:
+        tail = f.readlines()[-20:]
+    raise RuntimeError(f"app-backend did not come up, last log lines:\n{''.join(tail)}")
+
+
+def stop_app_backend(process, log_file):
+    if process.poll() is None:
+        process.terminate()
+        try:
+            process.wait(timeout=10)
+        except subprocess.TimeoutExpired:
+            process.kill()
+            process.wait()
+    log_file.close()
+
+
+def build_payload(workflow_info, args):
+    prompt = " ".join(WORDS[i % len(WORDS)] for i in range(args.prompt_chars // 6 + 1))
+    payload = {"messages": prompt, "max_tokens": args.output_tokens, "stream": not args.no_stream}
+    if workflow_info["file_input_ids"]:
+        # text-only docsum skips the ASR node
+        payload["type"] = "text"
+    if args.deadline_ms:
+        payload["deadline_ms"] = args.deadline_ms
+    return payload
+
+
+async def send_request(session, payload):
+    start = time.perf_counter()
+    ttft = None
+    frames = 0
+    async with session.post(APP_BACKEND_ENDPOINT, json=payload) as response:
+        async for chunk in response.content.iter_any():
+            if ttft is None and chunk:
+                ttft = time.perf_counter() - start
+            frames += chunk.count(b"data:") - chunk.count(b"data: [DONE]")
+        ok = response.status == 200
+    return ok, ttft, time.perf_counter() - start, frames
+
+
+async def run_level(payload, concurrency, num_requests, timeout):
+    remaining = iter(range(num_requests))
+    results = []
+    errors = 0
+
+    async def client(session):
+        nonlocal errors
+        for _ in remaining:
+            try:
+                ok, ttft, latency, frames = await send_request(session, payload)
+            except (aiohttp.ClientError, asyncio.TimeoutError):
+                ok = False
+            if ok:
+                results.append((ttft, latency, frames))
+            else:
+                errors += 1
+
+    connector = aiohttp.TCPConnector(limit=concurrency)
+    async with aiohttp.ClientSession(connector=connector, timeout=aiohttp.ClientTimeout(total=timeout)) as session:
+        start = time.perf_counter()
+        await asyncio.gather(*(client(session) for _ in range(concurrency)))
+        elapsed = time.perf_counter() - start
+
+    ttfts = sorted(result[0] for result in results if result[0] is not None)
+    latencies = sorted(result[1] for result in results)
+    frames = sum(result[2] for result in results)
+    report = {"requests": num_requests, "errors": errors, "rps": len(results) / elapsed, "tokens_per_s": frames / elapsed}
+    for p in (50, 95, 99):
+        report[f"ttft_p{p}_ms"] = percentile(ttfts, p) * 1000
+        report[f"latency_p{p}_ms"] = percentile(latencies, p) * 1000
+    return report
+
+
+def print_report(workflow, concurrency, report):
+    print(
+        f"{workflow:>28} {concurrency:>5} {report['requests']:>6} {report['errors']:>6} {report['rps']:>8.1f} "
+        f"{report['tokens_per_s']:>9.0f} "
+        f"{report['ttft_p50_ms']:>8.1f} {report['ttft_p95_ms']:>8.1f} {report['ttft_p99_ms']:>8.1f} "
+        f"{report['latency_p50_ms']:>8.1f} {report['latency_p95_ms']:>8.1f} {report['latency_p99_ms']:>8.1f}"
+    )
+
+
+async def run(args):
+    stubs = StubMicroservices(args)
+    stub_port = await stubs.start(port=args.stub_port)
+    print(f"stub microservices listening on 127.0.0.1:{stub_port}")
+    print(
+        f"{'workflow':>28} {'conc':>5} {'reqs':>6} {'errors':>6} {'req/s':>8} {'tokens/s':>9} "
+        f"{'ttft p50':>8} {'ttft p95':>8} {'ttft p99':>8} {'lat p50':>8} {'lat p95':>8} {'lat p99':>8}"
+    )
+    reports = {}
+    try:
+        for path in args.workflows:
+            workflow = os.path.splitext(os.path.basename(path))[0]
+            workflow_info = load_sample_workflow(path)
+            payload = build_payload(workflow_info, args)
+            with tempfile.TemporaryDirectory(prefix="app-backend-load-") as workdir:
+                # the megaservice process is started from a thread so the stubs keep serving meanwhile
+                process, log_file = await asyncio.to_thread(start_app_backend, workflow_info, stub_port, args, workdir)
+                try:
+                    for concurrency in args.concurrency:
+                        report = await run_level(payload, concurrency, args.requests or concurrency * 10, args.timeout)
+                        reports.setdefault(workflow, {})[concurrency] = report
+                        print_report(workflow, concurrency, report)
+                finally:
+                    stop_app_backend(process, log_file)
+    finally:
+        await stubs.stop()
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(reports, f, indent=4)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--workflows", nargs="+", default=sorted(glob.glob(os.path.join(SAMPLE_WORKFLOWS_DIR, "*.json"))))
+    parser.add_argument("--concurrency", type=int, nargs="+", default=[1, 8, 32])
+    parser.add_argument("--requests", type=int, default=0, help="requests per concurrency level (default: 10x concurrency)")
+    parser.add_argument("--workers", type=int, default=1, help="APP_BACKEND_WORKERS for the megaservice")
+    parser.add_argument("--no-stream", action="store_true", help="request non-streaming completions")
+    parser.add_argument("--deadline-ms", type=float, default=0, help="per-request latency budget sent as deadline_ms")
+    parser.add_argument("--prompt-chars", type=int, default=256)
+    parser.add_argument("--output-tokens", type=int, default=128)
+    parser.add_argument("--token-rate", type=float, default=50.0, help="stub LLM tokens per second per request")
+    parser.add_argument("--llm-ttft-ms", type=float, default=100.0)
+    parser.add_argument("--embedding-latency-ms", type=float, default=10.0)
+    parser.add_argument("--embedding-dim", type=int, default=768)
+    parser.add_argument("--retriever-latency-ms", type=float, default=20.0)
+    parser.add_argument("--retrieved-docs", type=int, default=4)
+    parser.add_argument("--doc-chars", type=int, default=1024)
+    parser.add_argument("--rerank-latency-ms", type=float, default=20.0)
+    parser.add_argument("--rerank-top-n", type=int, default=1)
+    parser.add_argument("--asr-latency-ms", type=float, default=50.0)
+    parser.add_argument("--stub-port", type=int, default=0, help="port for the stub microservices (default: any free port)")
+    parser.add_argument("--startup-timeout", type=float, default=120.0)
+    parser.add_argument("--timeout", type=float, default=300.0, help="per-request timeout in seconds")
+    parser.add_argument("--output", help="also write the report as JSON to this file")
+    args = parser.parse_args()
+    asyncio.run(run(args))
+
+
+if __name__ == "__main__":
+    main()
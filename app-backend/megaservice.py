@@ -1,22 +1,56 @@
 # Copyright (C) 2024 Intel Corporation
 # SPDX-License-Identifier: Apache-2.0
 
+import array
+import asyncio
+import atexit
+import base64
 import os
 import json
 import importlib
+import multiprocessing
 import re
+import shutil
+import signal
+import socket
+import sys
+import tempfile
+import time
 import uuid
 import aiofiles
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
 from copy import deepcopy
+from functools import lru_cache
 
 # library import
 from typing import List
-from fastapi import Request, UploadFile, File
+from fastapi import HTTPException, Request, UploadFile, File
 from fastapi.responses import StreamingResponse
 from dotenv import load_dotenv
 
+# Number of pre-forked worker processes, each with its own orchestrator graph and event loop
+APP_BACKEND_WORKERS = int(os.getenv("APP_BACKEND_WORKERS", "1"))
+# Let the kernel balance connections across workers instead of sharing one accept queue
+APP_BACKEND_REUSEPORT = os.getenv("APP_BACKEND_REUSEPORT", "true").lower() == "true" and hasattr(socket, "SO_REUSEPORT")
+if APP_BACKEND_WORKERS > 1 and __name__ == "__main__" and "PROMETHEUS_MULTIPROC_DIR" not in os.environ:
+    # Must be set before prometheus_client is imported (through comps) so /metrics aggregates all workers
+    os.environ["PROMETHEUS_MULTIPROC_DIR"] = tempfile.mkdtemp(prefix="app-backend-metrics-")
+    # removed when the supervisor exits, forked workers leave without running atexit handlers
+    atexit.register(shutil.rmtree, os.environ["PROMETHEUS_MULTIPROC_DIR"], ignore_errors=True)
+
 # comps import
-from comps import MicroService, ServiceOrchestrator, ServiceRoleType, ServiceType
+from comps import CustomLogger, MicroService, ServiceOrchestrator, ServiceRoleType, ServiceType
+from comps.cores.mega import micro_service
+from comps.cores.mega.orchestrator import (
+    DEADLINE_HEADER,
+    ClosingStreamingResponse,
+    JSON_SERIALIZES_NUMPY,
+    bypass_node,
+    client_session,
+    json_codec,
+)
 from comps.cores.mega.utils import handle_message
 from comps.cores.proto.api_protocol import (
     ChatCompletionRequest,
@@ -29,6 +63,12 @@ from comps.cores.proto.api_protocol import (
 from comps.cores.proto.docarray import LLMParams, RerankerParms, RetrieverParms
 from langchain_core.prompts import PromptTemplate
 
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+logger = CustomLogger("app-backend-megaservice")
 
 category_params_map = {
     'LLM': LLMParams,
@@ -39,6 +79,15 @@ category_params_map = {
 
 HOST_IP = os.getenv("HOST_IP", "0.0.0.0")
 USE_NODE_ID_AS_IP = os.getenv("USE_NODE_ID_AS_IP","").lower() == 'true'
+# Latency budget applied to requests that don't carry their own, 0 disables it
+DEFAULT_DEADLINE_MS = float(os.getenv("DEFAULT_DEADLINE_MS", 0))
+# "base64" asks embedding services for little-endian float32 vectors instead of JSON float lists
+EMBEDDING_ENCODING_FORMAT = os.getenv("EMBEDDING_ENCODING_FORMAT", "float")
+# Formats of the per-node result stream, see AppService.stream_node_results
+NODE_STREAM_MEDIA_TYPES = {
+    'ndjson': 'application/x-ndjson',
+    'sse': 'text/event-stream',
+}
 
 def encode_file_to_base64(file_path):
     """Encode the content of a file to a base64 string.
@@ -103,36 +152,179 @@ If you don't know the answer to a question, please don't share false information
 """
         return template.format(context=context_str, question=question)
 
+def request_deadline(request, data):
+    """time.monotonic() deadline from the X-Request-Deadline-Ms header or the "deadline_ms" body field."""
+    budget_ms = request.headers.get(DEADLINE_HEADER) or data.get("deadline_ms") or DEFAULT_DEADLINE_MS
+    try:
+        budget_ms = float(budget_ms)
+    except (TypeError, ValueError):
+        logger.warning(f"ignoring invalid request deadline {budget_ms!r}")
+        return None
+    return time.monotonic() + budget_ms / 1000 if budget_ms > 0 else None
+
+def decode_embedding(embedding, keep_array=False):
+    """Return an embedding as a float list, decoding it if the service answered in base64 float32.
+
+    Services that ignore encoding_format keep answering with a float list, which is returned as is.
+    With keep_array the decoded numpy vector is kept as is, for hops whose JSON encoder writes it directly.
+    """
+    if not isinstance(embedding, str):
+        return embedding
+    raw = base64.b64decode(embedding)
+    if np is not None:
+        vector = np.frombuffer(raw, dtype="<f4")
+        return vector if keep_array else vector.tolist()
+    vector = array.array("f", raw)
+    if sys.byteorder == "big":
+        vector.byteswap()
+    return vector.tolist()
+
+def node_stream_format(request, data):
+    """'ndjson' or 'sse' if the client asked for node results as they complete, via "node_stream" or Accept."""
+    fmt = data.get("node_stream")
+    if fmt is None and "application/x-ndjson" in request.headers.get("accept", ""):
+        fmt = "ndjson"
+    return fmt if fmt in NODE_STREAM_MEDIA_TYPES else None
+
+@lru_cache(maxsize=64)
+def parse_chat_template(chat_template):
+    """Parse a chat template once and return it with its sorted input variables."""
+    prompt_template = PromptTemplate.from_template(chat_template)
+    return prompt_template, tuple(sorted(prompt_template.input_variables))
+
+def _passthrough_inputs(inputs, llm_parameters_dict, **kwargs):
+    return inputs
+
+def _passthrough_outputs(data, *args, **kwargs):
+    # e.g. rerank results are forwarded to the next node as they are
+    return data
+
+def route_setting(name, key, default):
+    """ROUTE_<name>_<KEY> for one megaservice route, else ROUTE_<name> for all of them."""
+    return float(os.getenv(f"ROUTE_{name}_{key.upper()}", os.getenv(f"ROUTE_{name}", default)))
+
+class RouteIsolation:
+    """Resources owned by one megaservice route, so a slow route (e.g. a RAG sub-agent) can't starve the others.
+
+    Each route gets its own concurrency limit (ROUTE_MAX_CONCURRENCY, 0 = unlimited, waiting up to
+    ROUTE_QUEUE_TIMEOUT seconds before a 503), aiohttp connection pool (ROUTE_MAX_CONNECTIONS) and,
+    with ROUTE_STREAM_THREADS > 0, its own threads driving streamed responses instead of the
+    threadpool shared by the whole app.
+    """
+
+    def __init__(self, key):
+        self.key = key
+        self.max_concurrency = int(route_setting("MAX_CONCURRENCY", key, 0))
+        self.queue_timeout = route_setting("QUEUE_TIMEOUT", key, 30)
+        self.max_connections = int(route_setting("MAX_CONNECTIONS", key, 100))
+        stream_threads = int(route_setting("STREAM_THREADS", key, 0))
+        self.limiter = asyncio.Semaphore(self.max_concurrency) if self.max_concurrency > 0 else None
+        self.executor = ThreadPoolExecutor(stream_threads, thread_name_prefix=f"route-{key}") if stream_threads > 0 else None
+        self.session = None
+
+    def client_session(self):
+        # created on first use, in the event loop serving the route
+        if self.session is None or self.session.closed:
+            self.session = client_session(self.max_connections)
+        return self.session
+
+    async def run(self, handler):
+        """Await handler() within the route's concurrency limit."""
+        if self.limiter is not None:
+            try:
+                await asyncio.wait_for(self.limiter.acquire(), self.queue_timeout)
+            except asyncio.TimeoutError:
+                raise HTTPException(status_code=503, detail=f"Route {self.key} is at its concurrency limit")
+        try:
+            response = await handler()
+        except BaseException:
+            self.release()
+            raise
+        if isinstance(response, StreamingResponse):
+            # the slot is held until the stream is sent, also if it is never started
+            return ClosingStreamingResponse.of(response, self.release)
+        self.release()
+        return response
+
+    def release(self):
+        if self.limiter is not None:
+            self.limiter.release()
+
+    def wrap_generator(self, gen):
+        """Drive a sync stream generator on the route's own threads, if it has any."""
+        if self.executor is None:
+            return gen
+        return self._iterate_in_executor(gen)
+
+    async def _iterate_in_executor(self, gen):
+        loop = asyncio.get_running_loop()
+        done = object()
+        step = None
+        try:
+            while True:
+                # shielded, so a cancelled read is still known to be running on its thread
+                step = loop.run_in_executor(self.executor, next, gen, done)
+                chunk = await asyncio.shield(step)
+                if chunk is done:
+                    break
+                yield chunk
+        finally:
+            # an abandoned stream still closes its generator and connections, after the read in flight
+            if step is None or step.done():
+                gen.close()
+            else:
+                step.add_done_callback(lambda _: gen.close())
+
+    async def close(self):
+        if self.session is not None:
+            await self.session.close()
+        if self.executor is not None:
+            self.executor.shutdown(wait=False)
+
 class AppService:
     def __init__(self, host="0.0.0.0", port=8000):
         self.host = host
         self.port = port
         self.endpoint = "/v1/app-backend"
         self.is_docsum = False
-        with open('config/workflow-info.json', 'r') as f:
-            self.workflow_info = json.load(f)
-            
-        
-    def import_all_microservices_from_template(self):
-        template_dir = os.path.join(os.path.dirname(__file__), 'templates', 'microservices')
-        modules = {}
-        for filename in os.listdir(template_dir):
-            if filename.endswith('.py') and filename != '__init__.py':
-                module_name = filename[:-3]  # Remove the .py extension
-                module_path = f'templates.microservices.{module_name}'
-                modules[module_name] = importlib.import_module(module_path)
-        return modules
+        self.templates = {}
+        self.startup_timings = {}
+        self.routes = {}
+        with self.startup_phase('load_workflow_info'):
+            with open('config/workflow-info.json', 'r') as f:
+                self.workflow_info = json.load(f)
+
+    @contextmanager
+    def startup_phase(self, name):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.startup_timings[name] = time.perf_counter() - start
+            print(f"startup phase '{name}' took {self.startup_timings[name] * 1000:.1f} ms")
+
+    def import_microservice_from_template(self, microservice_name):
+        """Import templates/microservices/<microservice_name>.py on first use only."""
+        if microservice_name not in self.templates:
+            self.templates[microservice_name] = importlib.import_module(f'templates.microservices.{microservice_name}')
+        return self.templates[microservice_name]
 
     def add_remote_service(self):
         # Load environment variables from the .env file
-        dotenv_path = os.path.join(os.path.dirname(__file__), 'config', '.env')
-        print("dotenv_path", dotenv_path)
-        if os.path.exists(dotenv_path):
-            load_dotenv(dotenv_path)
+        with self.startup_phase('load_dotenv'):
+            dotenv_path = os.path.join(os.path.dirname(__file__), 'config', '.env')
+            print("dotenv_path", dotenv_path)
+            if os.path.exists(dotenv_path):
+                load_dotenv(dotenv_path)
         print("add_remote_service")
         for key, value in os.environ.items():
             print(f"{key}: {value}")
-        templates = self.import_all_microservices_from_template()
+        with self.startup_phase('build_graph'):
+            self._build_graph()
+        with self.startup_phase('compile_node_adapters'):
+            self.compile_node_adapters()
+
+    def _build_graph(self):
         # Get nodes from chat_input_ids or file_input_ids
         input_node_ids = []
         if 'chat_input_ids' in self.workflow_info:
@@ -141,14 +333,15 @@ class AppService:
             input_node_ids.extend(self.workflow_info['file_input_ids'])
         if not input_node_ids:
             raise Exception('No chat_input_ids or file_input_ids found in workflow_info')
-        nodes = input_node_ids.copy()
-        print('nodes', nodes)
+        nodes = deque(input_node_ids)
+        queued = set(input_node_ids)
+        print('nodes', list(nodes))
         self.processed_node_infos = {}
         self.services = {}
         self.megaservices = {}
         while nodes:
-            # BFS traversal of the graph
-            node_id = nodes.pop(0)
+            # BFS traversal of the graph, every node is queued at most once
+            node_id = nodes.popleft()
             node = self.workflow_info['nodes'][node_id]
             print('node', node)
             print('chat_input_ids', self.workflow_info['chat_input_ids'])
@@ -171,29 +364,99 @@ class AppService:
                 if "docsum" in microservice_name:
                     self.is_docsum = True
                 service_node_ip = f"opea-{node_id.split('@')[1].replace('_','-')}" if USE_NODE_ID_AS_IP else HOST_IP
-                microservice = templates[microservice_name].get_service(host_ip=service_node_ip, node_id_as_ip=USE_NODE_ID_AS_IP, port=os.getenv(f"{node_id.split('@')[1]}_port", None))
+                microservice = self.import_microservice_from_template(microservice_name).get_service(host_ip=service_node_ip, node_id_as_ip=USE_NODE_ID_AS_IP, port=os.getenv(f"{node_id.split('@')[1]}_port", None))
                 microservice.name = node_id
+                # optional replicas to fail over to, and the dependency probed by the wait-for-remote-service init container
+                microservice.alternate_endpoints = node.get('alternate_endpoints', [])
+                microservice.healthcheck_endpoint = node.get('healthcheck_endpoint')
                 self.services[node_id] = microservice
                 
 
-                megaservices = []
+                node['megaservices'] = []
                 for prev_node in node['connected_from']:
                     if prev_node in self.processed_node_infos:
-                        for megaservice in self.processed_node_infos[prev_node]['megaservices']:
-                            megaservices.append(megaservice)
-                            megaservice.add(microservice)
-                            if prev_node in self.services:
-                                megaservice.flow_to(self.services[prev_node], microservice)
-                node['megaservices'] = megaservices
+                        self._connect(prev_node, node_id)
     
-            for next_node in node['connected_to']:
-                nodes.append(next_node)
             self.processed_node_infos[node_id] = node
+            for next_node in node['connected_to']:
+                if next_node in self.processed_node_infos and next_node in self.services:
+                    # next_node was reached through a shorter path before this predecessor was processed
+                    self._connect(node_id, next_node)
+                elif next_node not in queued:
+                    queued.add(next_node)
+                    nodes.append(next_node)
             # print("processed_node_infos", self.processed_node_infos)
         print('\n\n\n', '-'*20, 'self.services', self.services)
         print('\n\n\n', '-'*20, 'self.megaservices', self.megaservices)
         print('\n\n\n', '-'*20, 'self.processed_node_infos', self.processed_node_infos)
     
+    def _connect(self, prev_node, node_id):
+        """Add service node_id after prev_node in the megaservices of prev_node."""
+        node = self.workflow_info['nodes'][node_id]
+        microservice = self.services[node_id]
+        joined = False
+        for megaservice in self.processed_node_infos[prev_node]['megaservices']:
+            if megaservice not in node['megaservices']:
+                node['megaservices'].append(megaservice)
+                megaservice.add(microservice)
+                joined = True
+            if prev_node in self.services:
+                megaservice.flow_to(self.services[prev_node], microservice)
+        if joined and node_id in self.processed_node_infos:
+            # a node joining a megaservice after it was processed brings the services after it along
+            for next_node in node['connected_to']:
+                if next_node in self.processed_node_infos and next_node in self.services:
+                    self._connect(node_id, next_node)
+
+    def compile_node_adapters(self):
+        """Resolve the input/output adapter of every service node once, at startup."""
+        input_adapters = {
+            ServiceType.EMBEDDING: self._align_embedding_inputs,
+            ServiceType.RETRIEVER: self._align_retriever_inputs,
+            ServiceType.LLM: self._align_llm_inputs,
+        }
+        output_adapters = {
+            ServiceType.EMBEDDING: self._align_embedding_outputs,
+            ServiceType.RETRIEVER: self._align_retriever_outputs,
+            ServiceType.LLM: self._align_llm_outputs,
+        }
+        self.input_adapters = {}
+        self.output_adapters = {}
+        for node_id, service in self.services.items():
+            self.input_adapters[node_id] = input_adapters.get(service.service_type, _passthrough_inputs)
+            self.output_adapters[node_id] = output_adapters.get(service.service_type, _passthrough_outputs)
+        # parse the chat templates configured on the nodes so requests hit the cache
+        for node in self.workflow_info['nodes'].values():
+            chat_template = node.get('params', {}).get('chat_template')
+            if chat_template:
+                parse_chat_template(chat_template)
+
+    def degradation_actions(self, node_id, node, megaservice):
+        """Return the actions of the node's degradation policy if one of its triggers fires.
+
+        A policy lives in workflow-info.json next to the node params, e.g.
+        "degradation": {"when": {"pending_requests": 32, "breaker_open": true, "latency_ewma_ms": 2000},
+                        "actions": {"skip": true}}
+        Triggers compare against ServiceOrchestrator.load_signals(), actions either skip the node
+        for the request or cap one of its params ("k", "top_n", "max_tokens", ...).
+        """
+        policy = node.get('degradation')
+        if not policy or node_id not in megaservice.services:
+            return {}
+        signals = megaservice.load_signals(node_id)
+        fired = [name for name, threshold in policy.get('when', {}).items() if name in signals and signals[name] >= threshold]
+        if not fired:
+            return {}
+        print(f"degrading {node_id} on {', '.join(fired)}: {policy.get('actions', {})}")
+        return policy.get('actions', {})
+
+    def degrade_params(self, params_dict, actions):
+        for key, cap in actions.items():
+            if key == 'skip':
+                continue
+            if key not in params_dict or float(params_dict[key]) > cap:
+                params_dict[key] = cap
+
     def align_inputs(self, inputs, *args, **kwargs):
         """Override this method in megaservice definition."""
         print('\n'*2,'align_inputs')
@@ -210,40 +473,47 @@ class AppService:
                 inputs.update(new_input)
             except Exception as e:
                 print('unable to parse input', e)
-        if self.services[node_id].service_type == ServiceType.EMBEDDING:
-            inputs["input"] = inputs["text"]
-            inputs["inputs"] = inputs["text"]
-            del inputs["text"]
-        elif self.services[node_id].service_type == ServiceType.RETRIEVER:
-            # prepare the retriever params
-            retriever_parameters = kwargs.get("retriever_parameters", None)
-            if retriever_parameters:
-                inputs.update(retriever_parameters.dict())
-        elif self.services[node_id].service_type == ServiceType.LLM:
-            # convert TGI/vLLM to unified OpenAI /v1/chat/completions format
-            next_inputs = {}
-            next_inputs["model"] = inputs.get("model") or "NA"
-            if inputs.get("inputs"):
-                next_inputs["messages"] = [{"role": "user", "content": inputs["inputs"]}]
-            elif inputs.get("query") and inputs.get("documents"):
-                # for rag case
-                next_inputs["query"] = inputs["query"]
-                next_inputs["documents"] = inputs.get("documents",[])
-            else:
-                # simple llm case
-                next_inputs["messages"] = [{"role": "user", "content": next(value for key in ["query", "text", "input", "inputs"] if (value := inputs.get(key)))}]
-            next_inputs["max_tokens"] = llm_parameters_dict["max_tokens"]
-            next_inputs["top_p"] = llm_parameters_dict["top_p"]
-            next_inputs["stream"] = inputs["stream"]
-            next_inputs["frequency_penalty"] = inputs["frequency_penalty"]
-            # next_inputs["presence_penalty"] = inputs["presence_penalty"]
-            # next_inputs["repetition_penalty"] = inputs["repetition_penalty"]
-            next_inputs["temperature"] = inputs["temperature"]
-            inputs = next_inputs
+        inputs = self.input_adapters[node_id](inputs, llm_parameters_dict, **kwargs)
         print('final_inputs', inputs)
         print('-'*20)
         return inputs
-    
+
+    def _align_embedding_inputs(self, inputs, llm_parameters_dict, **kwargs):
+        inputs["input"] = inputs["text"]
+        inputs["inputs"] = inputs.pop("text")
+        if EMBEDDING_ENCODING_FORMAT != "float":
+            inputs["encoding_format"] = EMBEDDING_ENCODING_FORMAT
+        return inputs
+
+    def _align_retriever_inputs(self, inputs, llm_parameters_dict, **kwargs):
+        # prepare the retriever params
+        retriever_parameters = kwargs.get("retriever_parameters", None)
+        if retriever_parameters:
+            inputs.update(retriever_parameters.dict())
+        return inputs
+
+    def _align_llm_inputs(self, inputs, llm_parameters_dict, **kwargs):
+        # convert TGI/vLLM to unified OpenAI /v1/chat/completions format
+        next_inputs = {}
+        next_inputs["model"] = inputs.get("model") or "NA"
+        if inputs.get("inputs"):
+            next_inputs["messages"] = [{"role": "user", "content": inputs["inputs"]}]
+        elif inputs.get("query") and inputs.get("documents"):
+            # for rag case
+            next_inputs["query"] = inputs["query"]
+            next_inputs["documents"] = inputs.get("documents",[])
+        else:
+            # simple llm case
+            next_inputs["messages"] = [{"role": "user", "content": next(value for key in ["query", "text", "input", "inputs"] if (value := inputs.get(key)))}]
+        next_inputs["max_tokens"] = llm_parameters_dict["max_tokens"]
+        next_inputs["top_p"] = llm_parameters_dict["top_p"]
+        next_inputs["stream"] = inputs["stream"]
+        next_inputs["frequency_penalty"] = inputs["frequency_penalty"]
+        # next_inputs["presence_penalty"] = inputs["presence_penalty"]
+        # next_inputs["repetition_penalty"] = inputs["repetition_penalty"]
+        next_inputs["temperature"] = inputs["temperature"]
+        return next_inputs
+
     def align_outputs(self, data, cur_node, inputs, runtime_graph, llm_parameters_dict, **kwargs):
         print('\n'*2,'align_outputs')
         print('cur_node', cur_node)
@@ -251,91 +521,62 @@ class AppService:
         print('-'*20)
         print('inputs', inputs)
         print('-'*20)
+        next_data = self.output_adapters[cur_node](data, cur_node, inputs, runtime_graph, llm_parameters_dict, **kwargs)
+        print('next_data', next_data)
+        print('-'*20)
+        return next_data
+
+    def _align_embedding_outputs(self, data, cur_node, inputs, runtime_graph, llm_parameters_dict, **kwargs):
+        # a numpy vector only travels to a downstream hop, results returned to the client stay lists
+        keep_array = JSON_SERIALIZES_NUMPY and bool(runtime_graph.downstream(cur_node))
+        return {"text": inputs["inputs"], "embedding": decode_embedding(data['data'][0]['embedding'], keep_array)}
+
+    def _align_retriever_outputs(self, data, cur_node, inputs, runtime_graph, llm_parameters_dict, **kwargs):
         next_data = {}
-        if self.services[cur_node].service_type == ServiceType.EMBEDDING:
-            # assert isinstance(data, dict)
-            next_data = {"text": inputs["inputs"], "embedding": data['data'][0]['embedding']}
-        elif self.services[cur_node].service_type == ServiceType.RETRIEVER:
-
-            docs = [doc["text"] for doc in data["retrieved_docs"]]
-
-            with_rerank = runtime_graph.downstream(cur_node)[0].startswith("opea_service@rerank")
-            if with_rerank and docs:
-                print("Rerank with docs")
-                # forward to rerank
-                # prepare inputs for rerank
-                next_data["initial_query"] = data["initial_query"]
-                next_data["texts"] = [doc["text"] for doc in data["retrieved_docs"]]
-                next_data["retrieved_docs"] = data["retrieved_docs"]
-            else:
-                print("No rerank")
-                # forward to llm
-                if not docs and with_rerank:
-                    # delete the rerank from retriever -> rerank -> llm
-                    for ds in reversed(runtime_graph.downstream(cur_node)):
-                        for nds in runtime_graph.downstream(ds):
-                            runtime_graph.add_edge(cur_node, nds)
-                        runtime_graph.delete_node_if_exists(ds)
-
-                # handle template
-                # if user provides template, then format the prompt with it
-                # otherwise, use the default template
-                prompt = data["initial_query"]
-                chat_template = llm_parameters_dict["chat_template"]
-                if chat_template:
-                    prompt_template = PromptTemplate.from_template(chat_template)
-                    input_variables = prompt_template.input_variables
-                    if sorted(input_variables) == ["context", "question"]:
-                        prompt = prompt_template.format(question=data["initial_query"], context="\n".join(docs))
-                    elif input_variables == ["question"]:
-                        prompt = prompt_template.format(question=data["initial_query"])
-                    else:
-                        print(f"{prompt_template} not used, we only support 2 input variables ['question', 'context']")
-                        prompt = ChatTemplate.generate_rag_prompt(data["initial_query"], docs)
+        docs = [doc["text"] for doc in data["retrieved_docs"]]
+
+        downstream = runtime_graph.downstream(cur_node)
+        with_rerank = bool(downstream) and downstream[0].startswith("opea_service@rerank")
+        if with_rerank and docs:
+            print("Rerank with docs")
+            # forward to rerank
+            # prepare inputs for rerank
+            next_data["initial_query"] = data["initial_query"]
+            next_data["texts"] = docs
+            next_data["retrieved_docs"] = data["retrieved_docs"]
+        else:
+            print("No rerank")
+            # forward to llm
+            if not docs and with_rerank:
+                # delete the rerank from retriever -> rerank -> llm
+                for ds in reversed(runtime_graph.downstream(cur_node)):
+                    bypass_node(runtime_graph, ds)
+
+            # handle template
+            # if user provides template, then format the prompt with it
+            # otherwise, use the default template
+            prompt = data["initial_query"]
+            chat_template = llm_parameters_dict["chat_template"]
+            if chat_template:
+                prompt_template, input_variables = parse_chat_template(chat_template)
+                if input_variables == ("context", "question"):
+                    prompt = prompt_template.format(question=data["initial_query"], context="\n".join(docs))
+                elif input_variables == ("question",):
+                    prompt = prompt_template.format(question=data["initial_query"])
                 else:
+                    print(f"{prompt_template} not used, we only support 2 input variables ['question', 'context']")
                     prompt = ChatTemplate.generate_rag_prompt(data["initial_query"], docs)
+            else:
+                prompt = ChatTemplate.generate_rag_prompt(data["initial_query"], docs)
 
-                next_data["inputs"] = prompt
-            
-        elif self.services[cur_node].service_type == ServiceType.RERANK:
-            # rerank the inputs with the scores
-            # reranker_parameters = kwargs.get("reranker_parameters", None)
-            # top_n = reranker_parameters.top_n if reranker_parameters else 1
-            # docs = inputs["texts"]
-            # reranked_docs = []
-            # for best_response in data['documents'][:top_n]:
-            #     reranked_docs.append(docs[best_response["index"]])
-
-            # # handle template
-            # # if user provides template, then format the prompt with it
-            # # otherwise, use the default template
-            # prompt = inputs["query"]
-            # chat_template = llm_parameters_dict["chat_template"]
-            # if chat_template:
-            #     prompt_template = PromptTemplate.from_template(chat_template)
-            #     input_variables = prompt_template.input_variables
-            #     if sorted(input_variables) == ["context", "question"]:
-            #         prompt = prompt_template.format(question=prompt, context="\n".join(reranked_docs))
-            #     elif input_variables == ["question"]:
-            #         prompt = prompt_template.format(question=prompt)
-            #     else:
-            #         print(f"{prompt_template} not used, we only support 2 input variables ['question', 'context']")
-            #         prompt = ChatTemplate.generate_rag_prompt(prompt, reranked_docs)
-            # else:
-            #     prompt = ChatTemplate.generate_rag_prompt(prompt, reranked_docs)
-
-            # next_data["inputs"] = prompt
-            next_data = data
-
-        elif self.services[cur_node].service_type == ServiceType.LLM and not llm_parameters_dict["stream"]:
-            next_data["text"] = data["choices"][0]["message"]["content"]
-        else:
-            next_data = data
-            
-        print('next_data', next_data)
-        print('-'*20)
+            next_data["inputs"] = prompt
         return next_data
-    
+
+    def _align_llm_outputs(self, data, cur_node, inputs, runtime_graph, llm_parameters_dict, **kwargs):
+        if llm_parameters_dict["stream"]:
+            return data
+        return {"text": data["choices"][0]["message"]["content"]}
+
     def align_generator(self, gen, **kwargs):
         print('\n'*2,'align_generator')
         
@@ -349,7 +590,7 @@ class AppService:
 
             json_str = line[start:end]
             try:
-                json_data = json.loads(json_str)
+                json_data = json_codec.loads(json_str)
                 if json_data["choices"][0]["finish_reason"] != "eos_token":
                     choice = json_data["choices"][0]
                     # without word buffer
@@ -386,14 +627,20 @@ class AppService:
 
     
     
-    async def handle_request(self, request: Request, megaservice=None):
-        data = await request.json()
+    async def handle_request(self, request: Request, megaservice=None, route=None):
+        data = json_codec.loads(await request.body())
         print('\n'*5, '====== handle_request ======\n', data)
+        deadline = request_deadline(request, data)
         if 'chat_completion_ids' in self.workflow_info:
             prompt = handle_message(data.get("messages") or data.get("query") or data.get("text") or data.get("input") or data.get("inputs"))
             params = {}
-            llm_parameters = None
+            # graphs without an LLM/Agent node (e.g. retriever or ASR only) run with the defaults
+            llm_parameters = LLMParams()
+            skip_nodes = []
             for id, node in self.workflow_info['nodes'].items():
+                actions = self.degradation_actions(id, node, megaservice)
+                if actions.get('skip'):
+                    skip_nodes.append(id)
                 if node['category'] in category_params_map:
                     param_class = category_params_map[node['category']]()
                     param_keys = [key for key in dir(param_class) if not key.startswith('__') and not callable(getattr(param_class, key))]
@@ -407,15 +654,23 @@ class AppService:
                                 params_dict[key] = data.get('stream', True) and data.get('streaming', True)
                         elif key in node['params']:
                             params_dict[key] = node['params'][key]
+                    self.degrade_params(params_dict, actions)
                     params[id] = params_dict
                 if node['category'] in ('LLM', 'Agent'):
                     params[id]['max_new_tokens'] = params[id].get('max_tokens', 500)
                     llm_parameters = LLMParams(**params[id])
-            result_dict, runtime_graph = await megaservice.schedule(
-                initial_inputs={'query':prompt, 'text': prompt},
-                llm_parameters=llm_parameters,
-                params=params,
-            )
+            schedule_kwargs = {
+                'initial_inputs': {'query':prompt, 'text': prompt},
+                'llm_parameters': llm_parameters,
+                'params': params,
+                'deadline': deadline,
+                'skip_nodes': skip_nodes,
+                'session': route.client_session() if route else None,
+            }
+            node_stream = node_stream_format(request, data)
+            if node_stream:
+                return self.schedule_node_stream(megaservice, schedule_kwargs, node_stream)
+            result_dict, runtime_graph = await megaservice.schedule(**schedule_kwargs)
             print('runtime_graph', runtime_graph.graph)
             for node, response in result_dict.items():
                 if isinstance(response, StreamingResponse):
@@ -441,10 +696,65 @@ class AppService:
                 # handle the non-llm response
                 return result_dict[last_node]
 
-    async def handle_request_docsum(self, request: Request, files: List[UploadFile] = File(default=None), megaservice=None):
+    def schedule_node_stream(self, megaservice, schedule_kwargs, fmt):
+        """Run the graph in the background and answer with its node results as they complete."""
+        node_results = asyncio.Queue()
+        task = asyncio.create_task(megaservice.schedule(**schedule_kwargs, node_results=node_results))
+        task.add_done_callback(lambda _: node_results.put_nowait(None))
+        return ClosingStreamingResponse(
+            self.stream_node_results(node_results, task, fmt),
+            media_type=NODE_STREAM_MEDIA_TYPES[fmt],
+            # also if the client is gone before the stream starts
+            on_close=(lambda: self.stop_node_stream(node_results, task),),
+        )
+
+    def stop_node_stream(self, node_results, task):
+        """Stop the graph of a node result stream nobody reads anymore, and release its unread streams."""
+        if not task.done():
+            task.cancel()
+        while not node_results.empty():
+            item = node_results.get_nowait()
+            if item is not None and isinstance(item[1], ClosingStreamingResponse):
+                item[1].release()
+
+    async def stream_node_results(self, node_results, task, fmt):
+        """Emit every node's result as soon as schedule() completes it, one NDJSON line or SSE event each.
+
+        Records are {"node", "elapsed_ms", "result"}; a streamed (LLM) result is forwarded as
+        {"node", "chunk"} records, and a failure of the graph ends the stream with {"error"}.
+        """
+        def frame(record):
+            # the codec also writes the numpy embeddings intermediate results can hold
+            line = json_codec.dumps(record)
+            return f"data: {line}\n\n" if fmt == 'sse' else line + "\n"
+
+        try:
+            while (item := await node_results.get()) is not None:
+                node, response, elapsed = item
+                if isinstance(response, StreamingResponse):
+                    try:
+                        async for chunk in response.body_iterator:
+                            yield frame({"node": node, "chunk": chunk.decode("utf-8") if isinstance(chunk, bytes) else chunk})
+                    finally:
+                        if isinstance(response, ClosingStreamingResponse):
+                            await response.close()
+                else:
+                    yield frame({"node": node, "elapsed_ms": round(elapsed * 1000, 1), "result": response})
+            try:
+                task.result()
+            except Exception as e:
+                print('node stream failed', e)
+                yield frame({"error": getattr(e, 'detail', str(e))})
+            if fmt == 'sse':
+                yield "data: [DONE]\n\n"
+        finally:
+            # the client may be gone, e.g. in the middle of the LLM stream
+            self.stop_node_stream(node_results, task)
+
+    async def handle_request_docsum(self, request: Request, files: List[UploadFile] = File(default=None), megaservice=None, route=None):
         """Accept pure text, or files .txt/.pdf.docx, audio/video base64 string."""
         if "application/json" in request.headers.get("content-type"):
-            data = await request.json()
+            data = json_codec.loads(await request.body())
             stream_opt = data.get("stream", True)
             summary_type = data.get("summary_type", "auto")
             chunk_size = data.get("chunk_size", -1)
@@ -508,6 +818,7 @@ class AppService:
 
         else:
             raise ValueError(f"Unknown request type: {request.headers.get('content-type')}")
+        deadline = request_deadline(request, data)
         
         docsum_parameters = DocSumChatCompletionRequest(
             messages="",
@@ -525,11 +836,18 @@ class AppService:
             chunk_overlap=chunk_overlap,
             chunk_size=chunk_size,
         )
+        schedule_kwargs = {
+            'initial_inputs': initial_inputs_data,
+            'docsum_parameters': docsum_parameters,
+            'deadline': deadline,
+            'session': route.client_session() if route else None,
+        }
+        node_stream = node_stream_format(request, data)
         text_only = "text" in initial_inputs_data
         if not text_only:
-            result_dict, runtime_graph = await megaservice.schedule(
-                initial_inputs=initial_inputs_data, docsum_parameters=docsum_parameters
-            )
+            if node_stream:
+                return self.schedule_node_stream(megaservice, schedule_kwargs, node_stream)
+            result_dict, runtime_graph = await megaservice.schedule(**schedule_kwargs)
 
             for node, response in result_dict.items():
                 # Here it suppose the last microservice in the megaservice is LLM.
@@ -543,16 +861,16 @@ class AppService:
             megaservice_text_only = ServiceOrchestrator()
             megaservice_text_only.align_inputs = self.align_inputs
             megaservice_text_only.align_outputs = self.align_outputs
-            megaservice_text_only.align_generator = self.align_generator
+            megaservice_text_only.align_generator = megaservice.align_generator
             megaservice_text_only.services = deepcopy(megaservice.services)
             megaservice_text_only.graph = deepcopy(megaservice.graph)
             asr_node = [node for node in megaservice_text_only.services if megaservice_text_only.services[node].service_type == ServiceType.ASR][0]
             llm_node = [node for node in megaservice_text_only.services if megaservice_text_only.services[node].service_type == ServiceType.LLM][0]
             # remove ASR node and its edges
             megaservice_text_only.delete_node_if_exists(asr_node)
-            result_dict, runtime_graph = await megaservice_text_only.schedule(
-                initial_inputs=initial_inputs_data, docsum_parameters=docsum_parameters
-            )
+            if node_stream:
+                return self.schedule_node_stream(megaservice_text_only, schedule_kwargs, node_stream)
+            result_dict, runtime_graph = await megaservice_text_only.schedule(**schedule_kwargs)
 
             for node, response in result_dict.items():
                 # Here it suppose the last microservice in the megaservice is LLM.
@@ -577,19 +895,34 @@ class AppService:
         )
         return ChatCompletionResponse(model="docsum", choices=choices, usage=usage)
     
-    def create_handle_request(self, megaservice):
+    def create_handle_request(self, megaservice, route):
         if self.is_docsum:
             async def handle_request_wrapper(request: Request, files: List[UploadFile] = File(default=None)):
-                return await self.handle_request_docsum(request, files, megaservice=megaservice)
+                return await route.run(lambda: self.handle_request_docsum(request, files, megaservice=megaservice, route=route))
         else:
             async def handle_request_wrapper(request: Request):
-                return await self.handle_request(request, megaservice=megaservice)
+                return await route.run(lambda: self.handle_request(request, megaservice=megaservice, route=route))
         return handle_request_wrapper
+
+    def isolate_route(self, key, megaservice):
+        route = RouteIsolation(key)
+        align_generator = self.align_generator
+        megaservice.align_generator = lambda gen, **kwargs: route.wrap_generator(align_generator(gen, **kwargs))
+        self.routes[key] = route
+        return route
+
+    async def close_routes(self):
+        for route in self.routes.values():
+            await route.close()
     
-    def start(self):
+    def start(self, sock=None):
+        with self.startup_phase('mount_routes'):
+            self._mount_routes(sock)
+        print('startup timings (ms):', {name: round(seconds * 1000, 1) for name, seconds in self.startup_timings.items()})
+        self.service.start()
 
-        self.service = MicroService(
-            self.__class__.__name__,
+    def _mount_routes(self, sock=None):
+        service_kwargs = dict(
             service_role=ServiceRoleType.MEGASERVICE,
             host=self.host,
             port=self.port,
@@ -597,17 +930,108 @@ class AppService:
             input_datatype=ChatCompletionRequest,
             output_datatype=ChatCompletionResponse,
         )
+        if sock is None:
+            self.service = MicroService(self.__class__.__name__, **service_kwargs)
+        else:
+            # worker mode: serve the routes on a socket bound by the worker or inherited from the supervisor
+            with shared_port():
+                self.service = WorkerMicroService(self.__class__.__name__, sock=sock, **service_kwargs)
         
         for key, megaservice in self.megaservices.items():
-            handle_request_wrapper = self.create_handle_request(megaservice)
+            handle_request_wrapper = self.create_handle_request(megaservice, self.isolate_route(key, megaservice))
             self.service.add_route(self.endpoint if key == 'default' else f'{self.endpoint}/{key}', handle_request_wrapper, methods=["POST"])
-        self.service.start()
+        self.service.app.router.on_shutdown.append(self.close_routes)
 
-if __name__ == "__main__":
-    print('pre initialize appService')
-    app = AppService(host="0.0.0.0", port=8899)
-    print('after initialize appService')
+class WorkerMicroService(MicroService):
+    """A MicroService that serves a listening socket instead of binding its port, so the workers can share the port.
+    The socket is handed to uvicorn as an fd, the server is set up and started like that of any MicroService."""
+
+    def __init__(self, *args, sock, **kwargs):
+        self.sock = sock
+        super().__init__(*args, **kwargs)
+
+    def _async_setup(self):
+        self.uvicorn_kwargs["fd"] = self.sock.fileno()
+        super()._async_setup()
+
+@contextmanager
+def shared_port():
+    """MicroService refuses a port that already accepts connections, which the port of the workers does."""
+    check_ports_availability = micro_service.check_ports_availability
+    micro_service.check_ports_availability = lambda host, port: True
+    try:
+        yield
+    finally:
+        micro_service.check_ports_availability = check_ports_availability
+
+def bind_socket(host, port, reuse_port=False):
+    sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+    sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+    if reuse_port:
+        sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEPORT, 1)
+    sock.bind((host, port))
+    sock.listen(2048)
+    sock.set_inheritable(True)
+    return sock
+
+def run_worker(host, port, sock=None):
+    """Build a shared-nothing AppService (own graph, breakers and event loop) and serve it."""
+    # drop the supervisor's handlers inherited on fork, a worker stops like the single process service
+    signal.signal(signal.SIGTERM, signal.SIG_DFL)
+    signal.signal(signal.SIGINT, signal.default_int_handler)
+    if sock is None:
+        sock = bind_socket(host, port, reuse_port=True)
+    app = AppService(host=host, port=port)
     app.add_remote_service()
-    print('after add_remote_service')
-    
-    app.start()
\ No newline at end of file
+    app.start(sock=sock)
+
+def run_workers(num_workers, host, port):
+    """Pre-fork supervisor: keeps num_workers worker processes alive on the same port."""
+    from prometheus_client import multiprocess
+
+    context = multiprocessing.get_context("fork")
+    # without SO_REUSEPORT the workers accept on one socket bound here and inherited on fork
+    shared_sock = None if APP_BACKEND_REUSEPORT else bind_socket(host, port)
+    workers = {}
+    stopping = False
+
+    def spawn_worker():
+        worker = context.Process(target=run_worker, args=(host, port, shared_sock), name="app-backend-worker")
+        worker.start()
+        workers[worker.pid] = worker
+        print(f"started worker {worker.pid}")
+
+    def stop(signum, frame):
+        nonlocal stopping
+        stopping = True
+        for worker in workers.values():
+            worker.terminate()
+
+    signal.signal(signal.SIGTERM, stop)
+    signal.signal(signal.SIGINT, stop)
+    for _ in range(num_workers):
+        spawn_worker()
+    while workers:
+        for pid, worker in list(workers.items()):
+            if worker.is_alive():
+                continue
+            worker.join()
+            del workers[pid]
+            multiprocess.mark_process_dead(pid)
+            if not stopping:
+                print(f"worker {pid} exited with code {worker.exitcode}, restarting")
+                spawn_worker()
+        time.sleep(1)
+
+if __name__ == "__main__":
+    if APP_BACKEND_WORKERS > 1:
+        print(f'starting {APP_BACKEND_WORKERS} app-backend workers (reuseport={APP_BACKEND_REUSEPORT})')
+        run_workers(APP_BACKEND_WORKERS, "0.0.0.0", 8899)
+    else:
+        print('pre initialize appService')
+        app = AppService(host="0.0.0.0", port=8899)
+        print('after initialize appService')
+        app.add_remote_service()
+        print('after add_remote_service')
+
+        app.start()
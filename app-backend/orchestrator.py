@@ -7,14 +7,18 @@ import copy
 import json
 import os
 import re
+import socket
 import threading
 import time
+from concurrent.futures import ThreadPoolExecutor
 from typing import Dict, List
+from urllib.parse import urlsplit
 
 import aiohttp
 import requests
+from fastapi import HTTPException
 from fastapi.responses import StreamingResponse
-from prometheus_client import Gauge, Histogram
+from prometheus_client import Counter, Gauge, Histogram
 from pydantic import BaseModel
 
 from ..proto.docarray import LLMParams
@@ -26,6 +30,94 @@ from .logger import CustomLogger
 logger = CustomLogger("comps-core-orchestrator")
 LOGFLAG = os.getenv("LOGFLAG", False)
 ENABLE_OPEA_TELEMETRY = bool(os.environ.get("TELEMETRY_ENDPOINT"))
+CIRCUIT_BREAKER_ENABLED = os.getenv("CIRCUIT_BREAKER_ENABLED", "true").lower() == "true"
+CIRCUIT_BREAKER_FAILURE_THRESHOLD = int(os.getenv("CIRCUIT_BREAKER_FAILURE_THRESHOLD", 5))
+CIRCUIT_BREAKER_RESET_TIMEOUT = float(os.getenv("CIRCUIT_BREAKER_RESET_TIMEOUT", 30))
+HEALTH_PROBE_INTERVAL = float(os.getenv("HEALTH_PROBE_INTERVAL", 5))
+# Connect timeout of one probe; all targets are probed at once, at most this many in parallel
+HEALTH_PROBE_TIMEOUT = float(os.getenv("HEALTH_PROBE_TIMEOUT", 2))
+HEALTH_PROBE_WORKERS = int(os.getenv("HEALTH_PROBE_WORKERS", 16))
+# same budget as the "nc -z -v -w30" wait-for-remote-service init containers
+CONNECT_TIMEOUT = float(os.getenv("CONNECT_TIMEOUT", 30))
+# Remaining request budget, in milliseconds, forwarded to every downstream OPEA service
+DEADLINE_HEADER = "X-Request-Deadline-Ms"
+# Optional stages (rerank) are bypassed once less than this many seconds of the budget are left
+OPTIONAL_STAGE_MIN_BUDGET = float(os.getenv("OPTIONAL_STAGE_MIN_BUDGET", 2))
+OPTIONAL_SERVICE_TYPES = (ServiceType.RERANK,)
+# Smoothing of the per-node latency average used as a load signal by degradation policies
+LATENCY_EWMA_ALPHA = float(os.getenv("LATENCY_EWMA_ALPHA", 0.2))
+
+# Re-chunking of post-processed streams: compiled once, shared by all orchestrators
+_TOKEN_PATTERN = re.compile(r"\s?\S+\s?", re.UNICODE)
+_TOKEN_PATTERN_BYTES = re.compile(rb"\s?\S+\s?")
+_CHUNK_PREFIXES = ("data: b'", 'data: b"')
+_CHUNK_SUFFIXES = ("'\n\n", '"\n\n')
+_SSE_DONE_FRAME = b"data: [DONE]\n\n"
+
+
+class JSONCodec:
+    """The dumps/loads pair used for every JSON body on the request path.
+
+    ``dumps`` returns str, ``loads`` accepts str or bytes. ``serializes_numpy`` tells whether
+    numpy arrays can be handed to ``dumps`` as they are.
+    """
+
+    def __init__(self, name, dumps, loads, serializes_numpy=False):
+        self.name = name
+        self.dumps = dumps
+        self.loads = loads
+        self.serializes_numpy = serializes_numpy
+
+
+def _orjson_codec():
+    import orjson
+
+    def dumps(obj):
+        # float32 vectors are written in their shortest form
+        return orjson.dumps(obj, option=orjson.OPT_SERIALIZE_NUMPY).decode("utf-8")
+
+    return JSONCodec("orjson", dumps, orjson.loads, serializes_numpy=True)
+
+
+def _ujson_codec():
+    import ujson
+
+    return JSONCodec("ujson", ujson.dumps, ujson.loads)
+
+
+def _stdlib_codec():
+    return JSONCodec("stdlib", json.dumps, json.loads)
+
+
+JSON_CODECS = {"orjson": _orjson_codec, "ujson": _ujson_codec, "stdlib": _stdlib_codec}
+
+
+def load_json_codec(name: str = "auto") -> JSONCodec:
+    """Return the named codec; "auto" picks the fastest installed one, falling back to the stdlib."""
+    if name != "auto":
+        return JSON_CODECS[name]()
+    for candidate in ("orjson", "ujson"):
+        try:
+            return JSON_CODECS[candidate]()
+        except ImportError:
+            continue
+    return _stdlib_codec()
+
+
+json_codec = load_json_codec(os.getenv("APP_BACKEND_JSON_CODEC", "auto"))
+JSON_SERIALIZES_NUMPY = json_codec.serializes_numpy
+
+
+def _is_repr_safe(text: str) -> bool:
+    """True if ``repr(text.encode())`` is just ``b'<text>'`` (printable ASCII, no quote/backslash)."""
+    return text.isascii() and text.isprintable() and "'" not in text and "\\" not in text
+
+
+def _sse_token_frame(token: str) -> bytes:
+    """Build the ``data: b'...'`` SSE frame the UI expects for a single token."""
+    if _is_repr_safe(token):
+        return b"data: b'" + token.encode("ascii") + b"'\n\n"
+    return b"data: " + repr(token.replace("\\n", "\n").encode("utf-8")).encode("ascii") + b"\n\n"
 
 
 class OrchestratorMetrics:
@@ -39,6 +131,8 @@ class OrchestratorMetrics:
         self.inter_token_latency = None
         self.request_latency = None
         self.request_pending = None
+        # in-process count of pending requests, readable without going through prometheus
+        self.pending = 0
 
         # initial methods to create the metrics
         self.token_update = self._token_update_create
@@ -73,7 +167,9 @@ class OrchestratorMetrics:
             # in case another thread already got here
             if self.pending_update == self._pending_update_create:
                 self.request_pending = Gauge(
-                    "megaservice_request_pending", "Count of currently pending requests (gauge)"
+                    "megaservice_request_pending",
+                    "Count of currently pending requests (gauge)",
+                    multiprocess_mode="livesum",
                 )
                 self.pending_update = self._pending_update_real
         self.pending_update(increase)
@@ -91,8 +187,10 @@ class OrchestratorMetrics:
 
     def _pending_update_real(self, increase: bool) -> None:
         if increase:
+            self.pending += 1
             self.request_pending.inc()
         else:
+            self.pending -= 1
             self.request_pending.dec()
 
 
@@ -100,18 +198,253 @@ class OrchestratorMetrics:
 _metrics = OrchestratorMetrics()
 
 
+def client_session(connection_limit: int = 100) -> aiohttp.ClientSession:
+    """aiohttp session with the timeouts and JSON codec of the orchestrator hops."""
+    return aiohttp.ClientSession(
+        trust_env=True,
+        timeout=aiohttp.ClientTimeout(total=2000, sock_connect=CONNECT_TIMEOUT),
+        json_serialize=json_codec.dumps,
+        connector=aiohttp.TCPConnector(limit=connection_limit),
+    )
+
+
+def bypass_node(runtime_graph: DAG, node: str) -> None:
+    """Remove ``node`` from the runtime graph, connecting its predecessors straight to its downstreams."""
+    for prev in runtime_graph.predecessors(node):
+        for nds in runtime_graph.downstream(node):
+            runtime_graph.add_edge(prev, nds)
+    runtime_graph.delete_node_if_exists(node)
+
+
+class ClosingStreamingResponse(StreamingResponse):
+    """StreamingResponse that runs its ``on_close`` callbacks once it is sent, has failed or was abandoned.
+
+    Cleanup in the ``finally`` of a body generator is not enough: Starlette never starts the
+    generator when the client is gone before the first chunk.
+    """
+
+    def __init__(self, *args, on_close=(), **kwargs):
+        super().__init__(*args, **kwargs)
+        self.on_close = tuple(on_close)
+
+    @classmethod
+    def of(cls, response: StreamingResponse, callback) -> "ClosingStreamingResponse":
+        """``response`` as a ClosingStreamingResponse that also calls ``callback`` when closed."""
+        if not isinstance(response, cls):
+            closing = cls.__new__(cls)
+            closing.__dict__.update(response.__dict__)
+            closing.on_close = ()
+            response = closing
+        response.on_close += (callback,)
+        return response
+
+    def release(self) -> None:
+        """Run the ``on_close`` callbacks, latest first, once."""
+        callbacks, self.on_close = self.on_close, ()
+        for callback in reversed(callbacks):
+            callback()
+
+    async def close(self) -> None:
+        """Close the body iterator, so the cleanup of its generators runs, and release the response."""
+        try:
+            aclose = getattr(self.body_iterator, "aclose", None)
+            if aclose is not None:
+                await aclose()
+        finally:
+            self.release()
+
+    async def __call__(self, scope, receive, send) -> None:
+        try:
+            await super().__call__(scope, receive, send)
+        finally:
+            await self.close()
+
+
+class CircuitBreaker:
+    """Circuit breaker for one remote endpoint (host:port).
+
+    CLOSED lets requests through and opens after ``failure_threshold``
+    consecutive failed requests or health probes. OPEN rejects requests
+    until a health probe succeeds, which closes it again, or until
+    ``reset_timeout`` elapsed, after which HALF_OPEN lets a single trial
+    request decide whether to close again.
+    """
+
+    CLOSED, HALF_OPEN, OPEN = 0, 1, 2
+
+    def __init__(self, endpoint: str, failure_threshold: int, reset_timeout: float, on_change) -> None:
+        self.endpoint = endpoint
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.probe_targets = {endpoint}  # host:port pairs checked by the health probes
+        self.state = self.CLOSED
+        self._on_change = on_change
+        self._lock = threading.Lock()
+        self._failures = 0
+        self._probe_failures = 0
+        self._opened_at = 0.0
+        self._trial_in_flight = False
+        self._trial_started = 0.0
+
+    def _set_state(self, state: int) -> None:
+        if state != self.state:
+            logger.info(f"circuit breaker for {self.endpoint}: {self.state} -> {state}")
+            self.state = state
+            self._on_change(self)
+
+    def allow_request(self) -> bool:
+        with self._lock:
+            if self.state == self.OPEN and time.monotonic() - self._opened_at >= self.reset_timeout:
+                self._set_state(self.HALF_OPEN)
+            if self.state == self.CLOSED:
+                return True
+            # a trial that never reported back must not keep the circuit half-open forever
+            if self.state == self.HALF_OPEN and (
+                not self._trial_in_flight or time.monotonic() - self._trial_started >= self.reset_timeout
+            ):
+                self._trial_in_flight = True
+                self._trial_started = time.monotonic()
+                return True
+            return False
+
+    def record_success(self) -> None:
+        with self._lock:
+            self._failures = 0
+            self._trial_in_flight = False
+            self._set_state(self.CLOSED)
+
+    def record_failure(self) -> None:
+        with self._lock:
+            self._failures += 1
+            self._trial_in_flight = False
+            if self.state == self.HALF_OPEN or self._failures >= self.failure_threshold:
+                self._open()
+
+    def record_status(self, status_code: int) -> None:
+        # 5xx means the endpoint is reachable but failing, 4xx is the caller's problem
+        if status_code >= 500:
+            self.record_failure()
+        else:
+            self.record_success()
+
+    def probe_result(self, healthy: bool) -> None:
+        with self._lock:
+            if not healthy:
+                # like failed requests, only consecutive failed probes open a closed circuit,
+                # a single blip must not reject the traffic of a healthy endpoint
+                self._probe_failures += 1
+                if self.state != self.CLOSED or self._probe_failures >= self.failure_threshold:
+                    self._open()
+                return
+            self._probe_failures = 0
+            if self.state != self.CLOSED:
+                # the endpoint is reachable again, let all traffic through instead of a single trial
+                self._failures = 0
+                self._trial_in_flight = False
+                self._set_state(self.CLOSED)
+
+    def _open(self) -> None:
+        self._opened_at = time.monotonic()
+        self._set_state(self.OPEN)
+
+
+class CircuitBreakerRegistry:
+    """Process-wide circuit breakers keyed by host:port, with background TCP health probes."""
+
+    def __init__(self) -> None:
+        self._lock = threading.Lock()
+        self._breakers = {}
+        self._probe_thread = None
+        self.state_gauge = None
+        self.rejected_counter = None
+
+    def get(self, endpoint: str) -> CircuitBreaker:
+        breaker = self._breakers.get(endpoint)
+        if breaker is None:
+            with self._lock:
+                if self.state_gauge is None:
+                    self.state_gauge = Gauge(
+                        "megaservice_circuit_breaker_state",
+                        "Circuit breaker state per remote endpoint (0=closed, 1=half-open, 2=open)",
+                        ["endpoint"],
+                        multiprocess_mode="livemax",
+                    )
+                    self.rejected_counter = Counter(
+                        "megaservice_circuit_breaker_rejected",
+                        "Requests rejected because the endpoint circuit was open",
+                        ["endpoint"],
+                    )
+                breaker = self._breakers.setdefault(
+                    endpoint,
+                    CircuitBreaker(
+                        endpoint, CIRCUIT_BREAKER_FAILURE_THRESHOLD, CIRCUIT_BREAKER_RESET_TIMEOUT, self._update_gauge
+                    ),
+                )
+                self._update_gauge(breaker)
+        return breaker
+
+    def register(self, service) -> None:
+        """Create the breakers of a service (primary and alternates) and start probing them."""
+        try:
+            primary = urlsplit(service.endpoint_path(None)).netloc
+        except Exception as e:
+            logger.error(f"cannot resolve endpoint of {service.name} for health probes: {e}")
+            return
+        healthcheck_endpoint = getattr(service, "healthcheck_endpoint", None)
+        for endpoint in [primary, *getattr(service, "alternate_endpoints", [])]:
+            breaker = self.get(endpoint)
+            if healthcheck_endpoint and endpoint == primary:
+                breaker.probe_targets.add(healthcheck_endpoint)
+        self._start_probes()
+
+    def _update_gauge(self, breaker: CircuitBreaker) -> None:
+        self.state_gauge.labels(endpoint=breaker.endpoint).set(breaker.state)
+
+    def _start_probes(self) -> None:
+        with self._lock:
+            if self._probe_thread is None and HEALTH_PROBE_INTERVAL > 0:
+                self._probe_thread = threading.Thread(target=self._probe_loop, name="health-probes", daemon=True)
+                self._probe_thread.start()
+
+    def _probe_loop(self) -> None:
+        with ThreadPoolExecutor(HEALTH_PROBE_WORKERS, thread_name_prefix="health-probe") as executor:
+            while True:
+                # concurrently, so dead endpoints don't stretch the cycle to one timeout each
+                breakers = [(breaker, list(breaker.probe_targets)) for breaker in list(self._breakers.values())]
+                targets = list({target for _, probe_targets in breakers for target in probe_targets})
+                healthy = dict(zip(targets, executor.map(self._probe, targets)))
+                for breaker, probe_targets in breakers:
+                    breaker.probe_result(all(healthy[target] for target in probe_targets))
+                time.sleep(HEALTH_PROBE_INTERVAL)
+
+    @staticmethod
+    def _probe(target: str) -> bool:
+        host, _, port = target.rpartition(":")
+        try:
+            with socket.create_connection((host or target, int(port) if host else 80), timeout=HEALTH_PROBE_TIMEOUT):
+                return True
+        except (OSError, ValueError):
+            return False
+
+
+_breakers = CircuitBreakerRegistry()
+
+
 class ServiceOrchestrator(DAG):
     """Manage 1 or N micro services in a DAG through Python API."""
 
     def __init__(self) -> None:
         self.metrics = _metrics
         self.services = {}  # all services, id -> service
+        self.latency_ewma = {}  # id -> smoothed response latency in seconds
         super().__init__()
 
     def add(self, service):
         if service.name not in self.services:
             self.services[service.name] = service
             self.add_node_if_not_exists(service.name)
+            if CIRCUIT_BREAKER_ENABLED:
+                _breakers.register(service)
         else:
             raise Exception(f"Service {service.name} already exists!")
         return self
@@ -125,83 +458,147 @@ class ServiceOrchestrator(DAG):
             return False
 
     @opea_telemetry
-    async def schedule(self, initial_inputs: Dict | BaseModel, llm_parameters: LLMParams = LLMParams(), **kwargs):
+    async def schedule(
+        self,
+        initial_inputs: Dict | BaseModel,
+        llm_parameters: LLMParams = LLMParams(),
+        deadline: float | None = None,
+        skip_nodes: List[str] = (),
+        node_results: asyncio.Queue | None = None,
+        session: aiohttp.ClientSession | None = None,
+        **kwargs,
+    ):
+        """Run the graph; ``deadline`` is an optional ``time.monotonic()`` instant the whole request must finish by.
+
+        ``skip_nodes`` are bypassed for this request only, e.g. by a degradation policy.
+        If ``node_results`` is given, ``(node, response, seconds since start)`` is put on it as every node completes.
+        A caller-owned ``session`` (e.g. a per-route connection pool) is used as is instead of a per-request one.
+        """
         req_start = time.monotonic()
         self.metrics.pending_update(True)
+        # a streamed answer releases the request itself once it is sent, read or abandoned
+        release_pending = self.pending_release()
+        stream_returned = False
+        try:
+            result_dict = {}
+            runtime_graph = DAG()
+            runtime_graph.graph = copy.deepcopy(self.graph)
+            for node in skip_nodes:
+                if node in runtime_graph.graph and runtime_graph.predecessors(node):
+                    bypass_node(runtime_graph, node)
+                else:
+                    logger.error(f"Cannot skip {node}: only nodes with predecessors can be bypassed")
+            if LOGFLAG:
+                logger.info(initial_inputs)
+
+            streamed = False
+            async with contextlib.nullcontext(session) if session is not None else client_session() as session:
+                pending = {
+                    asyncio.create_task(
+                        self.execute(
+                            session,
+                            req_start,
+                            node,
+                            initial_inputs,
+                            runtime_graph,
+                            llm_parameters,
+                            deadline,
+                            release_pending,
+                            **kwargs,
+                        )
+                    )
+                    for node in self.ind_nodes()
+                }
+                ind_nodes = self.ind_nodes()
+                try:
+                    while pending:
+                        done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                        for done_task in done:
+                            response, node = await done_task
+                            result_dict[node] = response
+                            # only the streams of execute() release the pending request, not fake_stream
+                            streamed = streamed or isinstance(response, StreamingResponse)
+
+                            # traverse the current node's downstream nodes and execute if all one's predecessors are finished
+                            downstreams = runtime_graph.downstream(node)
+
+                            # remove all the black nodes that are skipped to be forwarded to
+                            if not isinstance(response, StreamingResponse) and "downstream_black_list" in response:
+                                for black_node in response["downstream_black_list"]:
+                                    for downstream in reversed(downstreams):
+                                        try:
+                                            if re.findall(black_node, downstream):
+                                                if LOGFLAG:
+                                                    logger.info(f"skip forwardding to {downstream}...")
+                                                runtime_graph.delete_edge(node, downstream)
+                                                downstreams.remove(downstream)
+                                        except re.error as e:
+                                            logger.error("Pattern invalid! Operation cancelled.")
+                                    if len(downstreams) == 0 and llm_parameters.stream:
+                                        # turn the response to a StreamingResponse
+                                        # to make the response uniform to UI
+                                        def fake_stream(text):
+                                            yield "data: b'" + text + "'\n\n"
+                                            yield "data: [DONE]\n\n"
+
+                                        result_dict[node] = StreamingResponse(
+                                            fake_stream(response["text"]), media_type="text/event-stream"
+                                        )
 
-        result_dict = {}
-        runtime_graph = DAG()
-        runtime_graph.graph = copy.deepcopy(self.graph)
-        if LOGFLAG:
-            logger.info(initial_inputs)
-
-        timeout = aiohttp.ClientTimeout(total=2000)
-        async with aiohttp.ClientSession(trust_env=True, timeout=timeout) as session:
-            pending = {
-                asyncio.create_task(
-                    self.execute(session, req_start, node, initial_inputs, runtime_graph, llm_parameters, **kwargs)
-                )
-                for node in self.ind_nodes()
-            }
-            ind_nodes = self.ind_nodes()
-
-            while pending:
-                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
-                for done_task in done:
-                    response, node = await done_task
-                    result_dict[node] = response
-
-                    # traverse the current node's downstream nodes and execute if all one's predecessors are finished
-                    downstreams = runtime_graph.downstream(node)
-
-                    # remove all the black nodes that are skipped to be forwarded to
-                    if not isinstance(response, StreamingResponse) and "downstream_black_list" in response:
-                        for black_node in response["downstream_black_list"]:
-                            for downstream in reversed(downstreams):
-                                try:
-                                    if re.findall(black_node, downstream):
-                                        if LOGFLAG:
-                                            logger.info(f"skip forwardding to {downstream}...")
-                                        runtime_graph.delete_edge(node, downstream)
-                                        downstreams.remove(downstream)
-                                except re.error as e:
-                                    logger.error("Pattern invalid! Operation cancelled.")
-                            if len(downstreams) == 0 and llm_parameters.stream:
-                                # turn the response to a StreamingResponse
-                                # to make the response uniform to UI
-                                def fake_stream(text):
-                                    yield "data: b'" + text + "'\n\n"
-                                    yield "data: [DONE]\n\n"
-
-                                result_dict[node] = StreamingResponse(
-                                    fake_stream(response["text"]), media_type="text/event-stream"
-                                )
-
-                    for d_node in downstreams:
-                        if all(i in result_dict for i in runtime_graph.predecessors(d_node)):
-                            inputs = self.process_outputs(runtime_graph.predecessors(d_node), result_dict)
-                            pending.add(
-                                asyncio.create_task(
-                                    self.execute(
-                                        session, req_start, d_node, inputs, runtime_graph, llm_parameters, **kwargs
+                            if node_results is not None:
+                                node_results.put_nowait((node, result_dict[node], time.monotonic() - req_start))
+
+                            for d_node in downstreams:
+                                if all(i in result_dict for i in runtime_graph.predecessors(d_node)):
+                                    inputs = self.process_outputs(runtime_graph.predecessors(d_node), result_dict)
+                                    pending.add(
+                                        asyncio.create_task(
+                                            self.execute(
+                                                session,
+                                                req_start,
+                                                d_node,
+                                                inputs,
+                                                runtime_graph,
+                                                llm_parameters,
+                                                deadline,
+                                                release_pending,
+                                                **kwargs,
+                                            )
+                                        )
                                     )
-                                )
-                            )
-        nodes_to_keep = []
-        for i in ind_nodes:
-            nodes_to_keep.append(i)
-            nodes_to_keep.extend(runtime_graph.all_downstreams(i))
-
-        all_nodes = list(runtime_graph.graph.keys())
-
-        for node in all_nodes:
-            if node not in nodes_to_keep:
-                runtime_graph.delete_node_if_exists(node)
-
-        if not llm_parameters.stream:
+                finally:
+                    # on errors (e.g. 503 of an open circuit, 504 past the deadline) or cancellation
+                    for task in pending:
+                        task.cancel()
+            nodes_to_keep = []
+            for i in ind_nodes:
+                nodes_to_keep.append(i)
+                nodes_to_keep.extend(runtime_graph.all_downstreams(i))
+
+            all_nodes = list(runtime_graph.graph.keys())
+
+            for node in all_nodes:
+                if node not in nodes_to_keep:
+                    runtime_graph.delete_node_if_exists(node)
+
+            stream_returned = streamed
+            return result_dict, runtime_graph
+        finally:
+            if not stream_returned:
+                release_pending()
+
+    def pending_release(self):
+        """A function taking a request off the pending count once, however often it is called."""
+        held = [True]
+
+        def release():
+            try:
+                held.pop()
+            except IndexError:
+                return
             self.metrics.pending_update(False)
 
-        return result_dict, runtime_graph
+        return release
 
     def process_outputs(self, prev_nodes: List, result_dict: Dict) -> Dict:
         all_outputs = {}
@@ -239,10 +636,14 @@ class ServiceOrchestrator(DAG):
         inputs: Dict,
         runtime_graph: DAG,
         llm_parameters: LLMParams = LLMParams(),
+        deadline: float | None = None,
+        release_pending=None,
         **kwargs,
     ):
         # send the cur_node request/reply
 
+        budget = self.remaining_budget(cur_node, deadline)
+        deadline_headers = {DEADLINE_HEADER: str(int(budget * 1000))} if budget is not None else {}
         llm_parameters_dict = llm_parameters.dict()
 
         is_llm_vlm = self.services[cur_node].service_type in (ServiceType.LLM, ServiceType.LVM)
@@ -258,6 +659,7 @@ class ServiceOrchestrator(DAG):
             endpoint = self.services[cur_node].endpoint_path(inputs["model"])
         else:
             endpoint = self.services[cur_node].endpoint_path(None)
+        endpoint, breaker = self.select_endpoint(cur_node, endpoint)
         if is_llm_vlm and llm_parameters.stream:
             # Still leave to sync requests.post for StreamingResponse
             if LOGFLAG:
@@ -267,24 +669,42 @@ class ServiceOrchestrator(DAG):
                 if ENABLE_OPEA_TELEMETRY
                 else contextlib.nullcontext()
             ):
-                if access_token:
-                    response = requests.post(
-                        url=endpoint,
-                        data=json.dumps(inputs),
-                        headers={"Content-type": "application/json", "Authorization": f"Bearer {access_token}"},
-                        stream=True,
-                        timeout=2000,
-                    )
-                else:
-                    response = requests.post(
-                        url=endpoint,
-                        data=json.dumps(inputs),
-                        headers={
-                            "Content-type": "application/json",
-                        },
-                        stream=True,
-                        timeout=2000,
-                    )
+                post_start = time.monotonic()
+                try:
+                    if access_token:
+                        response = requests.post(
+                            url=endpoint,
+                            data=json_codec.dumps(inputs),
+                            headers={
+                                "Content-type": "application/json",
+                                "Authorization": f"Bearer {access_token}",
+                                **deadline_headers,
+                            },
+                            stream=True,
+                            timeout=self.requests_timeout(budget),
+                        )
+                    else:
+                        response = requests.post(
+                            url=endpoint,
+                            data=json_codec.dumps(inputs),
+                            headers={
+                                "Content-type": "application/json",
+                                **deadline_headers,
+                            },
+                            stream=True,
+                            timeout=self.requests_timeout(budget),
+                        )
+                except (requests.exceptions.ConnectionError, requests.exceptions.Timeout):
+                    if self.deadline_exceeded(deadline):
+                        # the request ran out of budget, not the endpoint
+                        raise HTTPException(status_code=504, detail=f"Request deadline exceeded in {cur_node}")
+                    if breaker:
+                        breaker.record_failure()
+                    raise
+                if breaker:
+                    breaker.record_status(response.status_code)
+                # time to response headers, the stream itself is not included
+                self.record_latency(cur_node, time.monotonic() - post_start)
 
             downstream = runtime_graph.downstream(cur_node)
             if downstream:
@@ -293,39 +713,41 @@ class ServiceOrchestrator(DAG):
                 hitted_ends = [".", "?", "!", "。", "，", "！"]
                 downstream_endpoint = self.services[downstream[0]].endpoint_path()
 
-            def generate():
+            def stream_tokens():
                 token_start = req_start
                 if response:
                     # response.elapsed = time until first headers received
                     buffered_chunk_str = ""
                     is_first = True
                     for chunk in self.wrap_iterable(response.iter_content(chunk_size=None)):
+                        # the read timeout applies to every read, the deadline to the whole stream
+                        if self.deadline_exceeded(deadline):
+                            response.close()
+                            raise HTTPException(status_code=504, detail=f"Request deadline exceeded in {cur_node}")
                         if chunk:
                             if downstream:
                                 chunk = chunk.decode("utf-8")
                                 buffered_chunk_str += self.extract_chunk_str(chunk)
                                 is_last = chunk.endswith("[DONE]\n\n")
                                 if (buffered_chunk_str and buffered_chunk_str[-1] in hitted_ends) or is_last:
+                                    post_budget = self.remaining_budget(cur_node, deadline)
+                                    post_headers = {"Content-type": "application/json"}
                                     if access_token:
+                                        post_headers["Authorization"] = f"Bearer {access_token}"
+                                    if post_budget is not None:
+                                        post_headers[DEADLINE_HEADER] = str(int(post_budget * 1000))
+                                    try:
                                         res = requests.post(
                                             url=downstream_endpoint,
-                                            data=json.dumps({"text": buffered_chunk_str}),
-                                            headers={
-                                                "Content-type": "application/json",
-                                                "Authorization": f"Bearer {access_token}",
-                                            },
-                                            timeout=2000,
-                                        )
-                                    else:
-                                        res = requests.post(
-                                            url=downstream_endpoint,
-                                            data=json.dumps({"text": buffered_chunk_str}),
-                                            headers={
-                                                "Content-type": "application/json",
-                                            },
-                                            timeout=2000,
+                                            data=json_codec.dumps({"text": buffered_chunk_str}),
+                                            headers=post_headers,
+                                            timeout=self.requests_timeout(post_budget),
                                         )
-                                    res_json = res.json()
+                                    except requests.exceptions.Timeout:
+                                        if self.deadline_exceeded(deadline):
+                                            raise HTTPException(status_code=504, detail=f"Request deadline exceeded in {cur_node}")
+                                        raise
+                                    res_json = json_codec.loads(res.content)
                                     if "text" in res_json:
                                         res_txt = res_json["text"]
                                     else:
@@ -342,10 +764,22 @@ class ServiceOrchestrator(DAG):
                                 yield chunk
 
                     self.metrics.request_update(req_start)
-                    self.metrics.pending_update(False)
+
+            def generate():
+                try:
+                    yield from stream_tokens()
+                finally:
+                    # when the stream is read directly, e.g. by a node result stream
+                    if release_pending is not None:
+                        release_pending()
 
             return (
-                StreamingResponse(self.align_generator(generate(), **kwargs), media_type="text/event-stream"),
+                # released once sent, also if the client is gone before the generator starts
+                ClosingStreamingResponse(
+                    self.align_generator(generate(), **kwargs),
+                    media_type="text/event-stream",
+                    on_close=(release_pending,) if release_pending is not None else (),
+                ),
                 cur_node,
             )
         else:
@@ -364,22 +798,100 @@ class ServiceOrchestrator(DAG):
                 else contextlib.nullcontext()
                 as span # studio update
             ):
-                response = await session.post(endpoint, json=input_data)
+                post_start = time.monotonic()
+                try:
+                    if budget is not None:
+                        response = await session.post(
+                            endpoint,
+                            json=input_data,
+                            headers=deadline_headers,
+                            timeout=aiohttp.ClientTimeout(total=budget, sock_connect=min(CONNECT_TIMEOUT, budget)),
+                        )
+                    else:
+                        response = await session.post(endpoint, json=input_data)
+                except (aiohttp.ClientConnectionError, asyncio.TimeoutError):
+                    if self.deadline_exceeded(deadline):
+                        raise HTTPException(status_code=504, detail=f"Request deadline exceeded in {cur_node}")
+                    if breaker:
+                        breaker.record_failure()
+                    raise
+                if breaker:
+                    breaker.record_status(response.status)
+                self.record_latency(cur_node, time.monotonic() - post_start)
                 if ENABLE_OPEA_TELEMETRY and span is not None: # studio update
                     span.set_attribute("llm.input", str(input_data))
                     span.set_attribute("llm.output", await response.text())
 
+            if budget is not None and self.remaining_budget(cur_node, deadline) < OPTIONAL_STAGE_MIN_BUDGET:
+                # before align_outputs, so it prepares the inputs of whatever now follows cur_node
+                self.bypass_optional_downstreams(cur_node, runtime_graph)
+
             if response.content_type == "audio/wav":
                 audio_data = await response.read()
                 data = self.align_outputs(audio_data, cur_node, inputs, runtime_graph, llm_parameters_dict, **kwargs)
             else:
                 # Parse as JSON
-                data = await response.json()
+                data = await response.json(loads=json_codec.loads)
                 # post process
                 data = self.align_outputs(data, cur_node, inputs, runtime_graph, llm_parameters_dict, **kwargs)
 
             return data, cur_node
 
+    def remaining_budget(self, cur_node: str, deadline: float | None):
+        """Seconds left until ``deadline`` (None without one); 504 if it already passed before ``cur_node``."""
+        if deadline is None:
+            return None
+        budget = deadline - time.monotonic()
+        if budget <= 0:
+            raise HTTPException(status_code=504, detail=f"Request deadline exceeded before {cur_node}")
+        return budget
+
+    def deadline_exceeded(self, deadline: float | None):
+        return deadline is not None and time.monotonic() >= deadline
+
+    def requests_timeout(self, budget: float | None):
+        """(connect, read) timeout of the sync streaming call, capped by the remaining budget."""
+        if budget is None:
+            return (CONNECT_TIMEOUT, 2000)
+        return (min(CONNECT_TIMEOUT, budget), budget)
+
+    def bypass_optional_downstreams(self, cur_node: str, runtime_graph: DAG):
+        """Drop optional stages (e.g. rerank) right after ``cur_node``, connecting it to their downstreams."""
+        for ds in reversed(runtime_graph.downstream(cur_node)):
+            if self.services[ds].service_type in OPTIONAL_SERVICE_TYPES:
+                logger.info(f"Request budget nearly exhausted, skipping {ds}")
+                bypass_node(runtime_graph, ds)
+
+    def record_latency(self, cur_node: str, seconds: float):
+        prev = self.latency_ewma.get(cur_node)
+        self.latency_ewma[cur_node] = seconds if prev is None else prev + LATENCY_EWMA_ALPHA * (seconds - prev)
+
+    def load_signals(self, cur_node: str) -> Dict:
+        """Load signals degradation policies can trigger on for ``cur_node``."""
+        signals = {
+            "pending_requests": self.metrics.pending,
+            "latency_ewma_ms": self.latency_ewma.get(cur_node, 0.0) * 1000,
+        }
+        if CIRCUIT_BREAKER_ENABLED:
+            breaker = _breakers.get(urlsplit(self.services[cur_node].endpoint_path(None)).netloc)
+            signals["breaker_open"] = breaker.state != CircuitBreaker.CLOSED
+        return signals
+
+    def select_endpoint(self, cur_node: str, endpoint: str):
+        """Return the endpoint to call and its breaker, moving to an alternate replica if the circuit is open.
+
+        Alternates come from the ``alternate_endpoints`` (host:port list) attribute of the service.
+        """
+        if not CIRCUIT_BREAKER_ENABLED:
+            return endpoint, None
+        url = urlsplit(endpoint)
+        for netloc in [url.netloc, *getattr(self.services[cur_node], "alternate_endpoints", [])]:
+            breaker = _breakers.get(netloc)
+            if breaker.allow_request():
+                return url._replace(netloc=netloc).geturl(), breaker
+            _breakers.rejected_counter.labels(endpoint=netloc).inc()
+        raise HTTPException(status_code=503, detail=f"{cur_node} is unavailable: circuit open for all its endpoints")
+
     def align_inputs(self, inputs, *args, **kwargs):
         """Override this method in megaservice definition."""
         return inputs
@@ -401,23 +913,25 @@ class ServiceOrchestrator(DAG):
     def extract_chunk_str(self, chunk_str):
         if chunk_str == "data: [DONE]\n\n":
             return ""
-        prefix = "data: b'"
-        prefix_2 = 'data: b"'
-        suffix = "'\n\n"
-        suffix_2 = '"\n\n'
-        if chunk_str.startswith(prefix) or chunk_str.startswith(prefix_2):
-            chunk_str = chunk_str[len(prefix) :]
-        if chunk_str.endswith(suffix) or chunk_str.endswith(suffix_2):
-            chunk_str = chunk_str[: -len(suffix)]
+        # both prefixes are 8 chars and both suffixes 3 chars long
+        if chunk_str.startswith(_CHUNK_PREFIXES):
+            chunk_str = chunk_str[8:]
+        if chunk_str.endswith(_CHUNK_SUFFIXES):
+            chunk_str = chunk_str[:-3]
         return chunk_str
 
-    def token_generator(self, sentence: str, token_start: float, is_first: bool, is_last: bool) -> str:
-        prefix = "data: "
-        suffix = "\n\n"
-        tokens = re.findall(r"\s?\S+\s?", sentence, re.UNICODE)
-        for token in tokens:
-            token_start = self.metrics.token_update(token_start, is_first)
-            yield prefix + repr(token.replace("\\n", "\n").encode("utf-8")) + suffix
-            is_first = False
+    def token_generator(self, sentence: str, token_start: float, is_first: bool, is_last: bool) -> bytes:
+        if _is_repr_safe(sentence):
+            # common case: tokenize the encoded sentence once and frame the bytes directly
+            for token in _TOKEN_PATTERN_BYTES.findall(sentence.encode("ascii")):
+                token_start = self.metrics.token_update(token_start, is_first)
+                yield b"data: b'" + token + b"'\n\n"
+                is_first = False
+        else:
+            sse_token_frame = _sse_token_frame
+            for token in _TOKEN_PATTERN.findall(sentence):
+                token_start = self.metrics.token_update(token_start, is_first)
+                yield sse_token_frame(token)
+                is_first = False
         if is_last:
-            yield "data: [DONE]\n\n"
\ No newline at end of file
+            yield _SSE_DONE_FRAME
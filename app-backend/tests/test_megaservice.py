@@ -0,0 +1,262 @@
+# Copyright (C) 2024 Intel Corporation
+# SPDX-License-Identifier: Apache-2.0
+
+# Runs where GenAIComps with the patched orchestrator is importable, e.g. in the app-backend image:
+#   PYTHONPATH=/home/user/GenAIComps python -m pytest tests
+
+import asyncio
+import copy
+import json
+import os
+import sys
+
+import pytest
+from fastapi.responses import StreamingResponse
+from starlette.requests import ClientDisconnect
+
+APP_BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, APP_BACKEND_DIR)
+# no health probes against the fake endpoints
+os.environ["CIRCUIT_BREAKER_ENABLED"] = "false"
+
+import megaservice  # noqa: E402
+
+RETRIEVER_ID = "opea_service@retriever_redis_0"
+RERANKER_ID = "opea_service@reranking_tei_0"
+
+RETRIEVER_ONLY_WORKFLOW = {
+    "chat_completion_ids": ["chat_completion_0"],
+    "chat_input_ids": ["chat_input_0"],
+    "nodes": {
+        "chat_input_0": {
+            "category": "Controls",
+            "connected_from": [],
+            "connected_to": [RETRIEVER_ID],
+            "inMegaservice": False,
+            "name": "chat_input",
+            "params": {},
+        },
+        RETRIEVER_ID: {
+            "category": "Retreiver",
+            "connected_from": ["chat_input_0"],
+            "connected_to": ["chat_completion_0"],
+            "inMegaservice": True,
+            "name": "opea_service@retriever_redis",
+            "params": {},
+        },
+        "chat_completion_0": {
+            "category": "Controls",
+            "connected_from": [RETRIEVER_ID],
+            "connected_to": [],
+            "inMegaservice": False,
+            "name": "chat_completion",
+            "params": {},
+        },
+    },
+}
+
+
+class FakeResponse:
+    status = 200
+    content_type = "application/json"
+
+    def __init__(self, body):
+        self.body = body
+
+    async def json(self, loads=json.loads):
+        return self.body
+
+
+class FakeSession:
+    """Answers every hop like the retriever does."""
+
+    def __init__(self):
+        self.requests = []
+
+    async def post(self, endpoint, json=None, **kwargs):
+        self.requests.append((endpoint, json))
+        return FakeResponse({"retrieved_docs": [{"text": "OPEA is open"}], "initial_query": json["text"]})
+
+
+class FakeRoute:
+    def __init__(self):
+        self.session = FakeSession()
+
+    def client_session(self):
+        return self.session
+
+
+class FakeRequest:
+    def __init__(self, data):
+        self.data = data
+        self.headers = {}
+
+    async def body(self):
+        return json.dumps(self.data).encode("utf-8")
+
+
+def with_reranker(degradation):
+    """The retriever-only workflow with a reranker after the retriever, under the given degradation policy."""
+    workflow = copy.deepcopy(RETRIEVER_ONLY_WORKFLOW)
+    nodes = workflow["nodes"]
+    nodes[RETRIEVER_ID]["connected_to"] = [RERANKER_ID]
+    nodes["chat_completion_0"]["connected_from"] = [RERANKER_ID]
+    nodes[RERANKER_ID] = {
+        "category": "Reranking",
+        "connected_from": [RETRIEVER_ID],
+        "connected_to": ["chat_completion_0"],
+        "inMegaservice": True,
+        "name": "opea_service@reranking_tei",
+        "params": {},
+        "degradation": degradation,
+    }
+    return workflow
+
+
+def chain(services, shortcuts=()):
+    """A workflow calling (name, category) services one after another, plus (from, to) edges skipping some of them."""
+    ids = ["chat_input_0"] + [f"opea_service@{name}_0" for name, _ in services] + ["chat_completion_0"]
+    edges = [(ids[i], ids[i + 1]) for i in range(len(ids) - 1)] + [(ids[a + 1], ids[b + 1]) for a, b in shortcuts]
+    nodes = {
+        "chat_input_0": {"category": "Controls", "inMegaservice": False, "name": "chat_input", "params": {}},
+        "chat_completion_0": {"category": "Controls", "inMegaservice": False, "name": "chat_completion", "params": {}},
+    }
+    for (name, category), node_id in zip(services, ids[1:-1]):
+        nodes[node_id] = {"category": category, "inMegaservice": True, "name": f"opea_service@{name}", "params": {}}
+    for node_id, node in nodes.items():
+        node["connected_from"] = [a for a, b in edges if b == node_id]
+        node["connected_to"] = [b for a, b in edges if a == node_id]
+    return {"chat_completion_ids": ["chat_completion_0"], "chat_input_ids": ["chat_input_0"], "nodes": nodes}
+
+
+def start_app_service(tmp_path, monkeypatch, workflow):
+    (tmp_path / "config").mkdir()
+    (tmp_path / "config" / "workflow-info.json").write_text(json.dumps(workflow))
+    monkeypatch.chdir(tmp_path)
+    service = megaservice.AppService()
+    service.add_remote_service()
+    return service
+
+
+@pytest.fixture
+def app_service(tmp_path, monkeypatch):
+    return start_app_service(tmp_path, monkeypatch, RETRIEVER_ONLY_WORKFLOW)
+
+
+async def collect(response):
+    return [chunk async for chunk in response.body_iterator]
+
+
+def test_retriever_only_graph(app_service):
+    route = FakeRoute()
+    request = FakeRequest({"messages": "What is OPEA?", "stream": False})
+
+    result = asyncio.run(app_service.handle_request(request, megaservice=app_service.megaservices["default"], route=route))
+
+    assert len(route.session.requests) == 1
+    assert "OPEA is open" in result["inputs"]
+
+
+def test_retriever_only_graph_node_stream(app_service):
+    route = FakeRoute()
+    request = FakeRequest({"messages": "What is OPEA?", "node_stream": "ndjson"})
+
+    async def run():
+        response = await app_service.handle_request(request, megaservice=app_service.megaservices["default"], route=route)
+        return await collect(response)
+
+    records = [json.loads(line) for line in asyncio.run(run())]
+
+    assert [record.get("node") for record in records] == [RETRIEVER_ID]
+    assert "error" not in records[0]
+    assert "OPEA is open" in records[0]["result"]["inputs"]
+
+
+def test_node_stream_stops_the_graph_when_the_client_is_gone(app_service):
+    route = FakeRoute()
+    request = FakeRequest({"messages": "What is OPEA?", "node_stream": "ndjson"})
+    posted = asyncio.Event()
+
+    async def post(endpoint, json=None, **kwargs):
+        posted.set()
+        await asyncio.Event().wait()
+
+    route.session.post = post
+
+    async def client_gone(message):
+        raise OSError("client disconnected")
+
+    async def run():
+        response = await app_service.handle_request(request, megaservice=app_service.megaservices["default"], route=route)
+        await posted.wait()
+        graph_tasks = asyncio.all_tasks() - {asyncio.current_task()}
+        with pytest.raises(ClientDisconnect):
+            await response({"type": "http", "asgi": {"spec_version": "2.4"}}, None, client_gone)
+        return await asyncio.wait_for(asyncio.gather(*graph_tasks, return_exceptions=True), 5)
+
+    assert all(isinstance(result, asyncio.CancelledError) for result in asyncio.run(run()))
+
+
+def test_graph_keeps_the_edges_of_predecessors_reached_later(tmp_path, monkeypatch):
+    services = [("embedding_tei_langchain", "Embeddings"), ("retriever_redis", "Retreiver"), ("reranking_tei", "Reranking"), ("llm_tgi", "LLM")]
+    # the shortcut reaches the llm before the reranker is processed
+    service = start_app_service(tmp_path, monkeypatch, chain(services, shortcuts=[(0, 3)]))
+
+    graph = service.megaservices["default"].graph
+    assert graph["opea_service@embedding_tei_langchain_0"] == {RETRIEVER_ID, "opea_service@llm_tgi_0"}
+    assert graph[RERANKER_ID] == {"opea_service@llm_tgi_0"}
+
+
+def test_degradation_policy_thresholds(tmp_path, monkeypatch):
+    policy = {"when": {"pending_requests": 8, "latency_ewma_ms": 500}, "actions": {"top_n": 1}}
+    service = start_app_service(tmp_path, monkeypatch, with_reranker(policy))
+    orchestrator = service.megaservices["default"]
+    node = service.workflow_info["nodes"][RERANKER_ID]
+    signals = {}
+    monkeypatch.setattr(orchestrator, "load_signals", lambda node_id: signals)
+
+    signals.update(pending_requests=7, latency_ewma_ms=499)
+    assert service.degradation_actions(RERANKER_ID, node, orchestrator) == {}
+    signals.update(pending_requests=8)
+    assert service.degradation_actions(RERANKER_ID, node, orchestrator) == {"top_n": 1}
+    signals.update(pending_requests=0, latency_ewma_ms=500)
+    assert service.degradation_actions(RERANKER_ID, node, orchestrator) == {"top_n": 1}
+
+    # actions only ever lower a param
+    for params, degraded in (({"top_n": 5}, {"top_n": 1}), ({}, {"top_n": 1}), ({"top_n": 0}, {"top_n": 0})):
+        service.degrade_params(params, {"skip": False, "top_n": 1})
+        assert params == degraded
+
+
+def test_skipped_node_is_bypassed(tmp_path, monkeypatch):
+    service = start_app_service(tmp_path, monkeypatch, with_reranker({"when": {"pending_requests": 0}, "actions": {"skip": True}}))
+    route = FakeRoute()
+    request = FakeRequest({"messages": "What is OPEA?", "stream": False})
+
+    result = asyncio.run(service.handle_request(request, megaservice=service.megaservices["default"], route=route))
+
+    # only the retriever is called, its answer is the answer of the graph
+    assert len(route.session.requests) == 1
+    assert "OPEA is open" in result["inputs"]
+    assert RERANKER_ID in service.megaservices["default"].graph
+
+
+def test_route_slot_is_released_when_the_stream_never_starts(monkeypatch):
+    monkeypatch.setenv("ROUTE_MAX_CONCURRENCY", "1")
+    monkeypatch.setenv("ROUTE_QUEUE_TIMEOUT", "0.1")
+
+    async def answer():
+        return StreamingResponse(iter([b"data: [DONE]\n\n"]))
+
+    async def client_gone(message):
+        raise OSError("client disconnected")
+
+    async def run():
+        route = megaservice.RouteIsolation("default")
+        # more disconnects than the route has slots
+        for _ in range(3):
+            response = await route.run(answer)
+            with pytest.raises(ClientDisconnect):
+                await response({"type": "http", "asgi": {"spec_version": "2.4"}}, None, client_gone)
+
+    asyncio.run(run())
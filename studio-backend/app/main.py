@@ -1,3 +1,4 @@
+from contextlib import asynccontextmanager
 from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
 
@@ -8,6 +9,8 @@ ensure_urllib3_getheaders()
 
 from kubernetes import config
 
+from app.utils.template_utils import template_registry
+
 # Load the kubeconfig file
 try:
     # Try to load in-cluster configuration
@@ -18,7 +21,13 @@ except config.ConfigException:
     config.load_kube_config()
     print("Loaded kube-config file")
 
-app = FastAPI()
+@asynccontextmanager
+async def lifespan(app):
+    # Read and parse the service templates once, exports only fill them in
+    template_registry.load()
+    yield
+
+app = FastAPI(lifespan=lifespan)
 
 @app.get("/studio-backend/health")
 def read_health():
@@ -39,4 +48,4 @@ app.include_router(download_router.router, prefix="/studio-backend")
 app.include_router(sandbox_router.router, prefix="/studio-backend")
 app.include_router(llmtraces_router.router, prefix="/studio-backend")
 app.include_router(debuglog_router.router, prefix="/studio-backend")
-app.include_router(clickdeploy_router.router, prefix="/studio-backend")
\ No newline at end of file
+app.include_router(clickdeploy_router.router, prefix="/studio-backend")
@@ -1,18 +1,88 @@
-from fastapi import APIRouter, HTTPException
-from kubernetes import client
+import asyncio
+import concurrent.futures
+import os
+import threading
+from collections import defaultdict
+from datetime import datetime, timezone
+from fastapi import APIRouter, HTTPException, WebSocket, WebSocketDisconnect
+from kubernetes import client, watch
+from kubernetes.client.rest import ApiException
+from urllib3.exceptions import MaxRetryError, TimeoutError as Urllib3TimeoutError
 import re
 
 router = APIRouter()
 
-def find_pod_dependencies(pod, all_pods, services, namespace, core_v1_api):
+# Pod log reads of a /podlogs request run concurrently on this bounded pool, each bounded by the timeout
+POD_LOG_WORKERS = int(os.getenv("POD_LOG_WORKERS", 8))
+POD_LOG_TIMEOUT = float(os.getenv("POD_LOG_TIMEOUT", 10))
+kube_executor = concurrent.futures.ThreadPoolExecutor(max_workers=POD_LOG_WORKERS, thread_name_prefix="podlogs")
+# Delay before a live log or event stream that ended or failed is resumed
+LOG_STREAM_RETRY = float(os.getenv("LOG_STREAM_RETRY", 5))
+# Pod logs followed at the same time by all /ws/podlogs connections, each by its own thread
+LOG_STREAM_FOLLOWERS = int(os.getenv("LOG_STREAM_FOLLOWERS", 128))
+log_followers = threading.BoundedSemaphore(LOG_STREAM_FOLLOWERS)
+
+# Hostname-like runs of env values; service names are looked up among their '-'-separated spans
+NAME_RUN_PATTERN = re.compile(r'[A-Za-z0-9_-]+')
+# "tei-0:9003" style endpoints probed by wait-for-remote-service init containers
+SERVICE_PORT_PATTERN = re.compile(r'([a-zA-Z0-9-]+):\d+')
+
+class ServiceIndex:
+    """
+    Lookups shared by the dependency analysis of every pod in a namespace, built once per request:
+    service name -> names of the pods its selector matches.
+    """
+    def __init__(self, all_pods, services):
+        pod_order = {}
+        pods_by_label = defaultdict(set)
+        for target_pod in all_pods.items:
+            pod_order[target_pod.metadata.name] = len(pod_order)
+            for label in (target_pod.metadata.labels or {}).items():
+                pods_by_label[label].add(target_pod.metadata.name)
+
+        self.service_pods = {}
+        for service in services.items:
+            if service.spec.selector:
+                matched = set.intersection(*(pods_by_label.get(label, set()) for label in service.spec.selector.items()))
+                self.service_pods[service.metadata.name] = sorted(matched, key=pod_order.get)
+        # longest service name, in '-'-separated parts
+        self.max_parts = max((name.count('-') + 1 for name in self.service_pods), default=0)
+
+    def referenced_services(self, text):
+        """
+        Names of the services that appear in text as whole words, i.e. where
+        re.search(r'\b' + re.escape(name) + r'\b', text) matches, in order of appearance.
+        """
+        found = []
+        for run in NAME_RUN_PATTERN.findall(text):
+            parts = run.split('-')
+            for i in range(len(parts)):
+                for j in range(i + 1, min(len(parts), i + self.max_parts) + 1):
+                    name = '-'.join(parts[i:j])
+                    if name in self.service_pods and name not in found:
+                        found.append(name)
+        return found
+
+def find_pod_dependencies(pod, all_pods, services, namespace, core_v1_api, service_index=None, configmaps=None):
     """
     Analyze pod dependencies by checking:
     1. Environment variables pointing to other services
     2. Service selectors matching pod labels
     3. ConfigMaps and Secrets that might reference other pods
     4. Init containers waiting for remote services
+
+    Pass the ServiceIndex and the ConfigMap data (name -> data) of the namespace when analyzing
+    several pods, so they are only built and fetched once.
     """
+    if service_index is None:
+        service_index = ServiceIndex(all_pods, services)
     dependencies = []
+
+    def add_service_pods(service_name):
+        # Add the pods targeted by the service
+        for target_pod_name in service_index.service_pods.get(service_name, []):
+            if target_pod_name != pod.metadata.name and target_pod_name not in dependencies:
+                dependencies.append(target_pod_name)
     
     # Get pod environment variables from main containers
     env_vars = []
@@ -52,35 +122,28 @@ def find_pod_dependencies(pod, all_pods, services, namespace, core_v1_api):
             # Check init container commands for wait-for-remote-service patterns
             if init_container.name == "wait-for-remote-service" or "wait-for" in init_container.name.lower():
                 if init_container.command:
-                    command_str = " ".join(init_container.command)
                     # Look for service endpoints in commands like "nc -z -v -w30 $HEALTHCHECK_ENDPOINT"
                     # Extract service names from HEALTHCHECK_ENDPOINT or similar patterns
                     for env_var in init_env_vars:
                         # Pattern like "tei-0:9003" or "redis-vector-store-0:9001"
-                        service_match = re.search(r'([a-zA-Z0-9-]+):\d+', env_var)
+                        service_match = SERVICE_PORT_PATTERN.search(env_var)
                         if service_match:
-                            service_name = service_match.group(1)
-                            # Find pods that this service targets
-                            for service in services.items:
-                                if service.metadata.name == service_name and service.spec.selector:
-                                    for target_pod in all_pods.items:
-                                        if target_pod.metadata.name != pod.metadata.name:
-                                            target_labels = target_pod.metadata.labels or {}
-                                            if all(target_labels.get(k) == v for k, v in service.spec.selector.items()):
-                                                if target_pod.metadata.name not in dependencies:
-                                                    dependencies.append(target_pod.metadata.name)
+                            add_service_pods(service_match.group(1))
     
     # Fetch ConfigMap data to analyze environment variables
     configmap_env_vars = []
     for configmap_name in configmap_refs:
-        try:
-            configmap = core_v1_api.read_namespaced_config_map(name=configmap_name, namespace=namespace)
-            if configmap.data:
-                for key, value in configmap.data.items():
-                    if value:
-                        configmap_env_vars.append(value)
-        except Exception as e:
-            pass
+        if configmaps is not None:
+            configmap_data = configmaps.get(configmap_name)
+        else:
+            try:
+                configmap_data = core_v1_api.read_namespaced_config_map(name=configmap_name, namespace=namespace).data
+            except Exception as e:
+                configmap_data = None
+        if configmap_data:
+            for key, value in configmap_data.items():
+                if value:
+                    configmap_env_vars.append(value)
     
     # Combine all environment variables for further analysis
     all_env_vars = env_vars + init_env_vars + configmap_env_vars
@@ -120,137 +183,129 @@ def find_pod_dependencies(pod, all_pods, services, namespace, core_v1_api):
     # if all_env_vars:
     #     print(f"Sample env vars: {all_env_vars[:3]}")  # Show first 3 for debugging
     
-    # Check if environment variables reference other services
-    for service in services.items:
-        service_name = service.metadata.name
-        # Check if service name is referenced in environment variables
-        for env_val in all_env_vars:
-            if service_name in env_val:
-                # Find pods that this service targets
-                if service.spec.selector:
-                    for target_pod in all_pods.items:
-                        if target_pod.metadata.name != pod.metadata.name:
-                            target_labels = target_pod.metadata.labels or {}
-                            if all(target_labels.get(k) == v for k, v in service.spec.selector.items()):
-                                if target_pod.metadata.name not in dependencies:
-                                    dependencies.append(target_pod.metadata.name)
-    
-    # Check for service endpoint patterns in environment variables
-    # Pattern like "http://service-name:port" or "service-name:port"
+    # Check if environment variables reference other services, as a URL ("http://service-name:port"),
+    # an endpoint ("service-name:port"), a DNS name ("service-name.namespace.svc.cluster.local")
+    # or simply by name
     for env_val in all_env_vars:
-        # HTTP URL pattern
-        http_matches = re.findall(r'https?://([a-zA-Z0-9-]+):\d+', env_val)
-        for service_name in http_matches:
-            for service in services.items:
-                if service.metadata.name == service_name and service.spec.selector:
-                    for target_pod in all_pods.items:
-                        if target_pod.metadata.name != pod.metadata.name:
-                            target_labels = target_pod.metadata.labels or {}
-                            if all(target_labels.get(k) == v for k, v in service.spec.selector.items()):
-                                if target_pod.metadata.name not in dependencies:
-                                    dependencies.append(target_pod.metadata.name)
-        
-        # Direct service:port pattern
-        service_port_matches = re.findall(r'([a-zA-Z0-9-]+):\d+', env_val)
-        for service_name in service_port_matches:
-            for service in services.items:
-                if service.metadata.name == service_name and service.spec.selector:
-                    for target_pod in all_pods.items:
-                        if target_pod.metadata.name != pod.metadata.name:
-                            target_labels = target_pod.metadata.labels or {}
-                            if all(target_labels.get(k) == v for k, v in service.spec.selector.items()):
-                                if target_pod.metadata.name not in dependencies:
-                                    dependencies.append(target_pod.metadata.name)
-    
-    # Check DNS-based dependencies (common pattern: service-name.namespace.svc.cluster.local)
-    dns_pattern = r'([a-zA-Z0-9-]+)\.(' + re.escape(namespace) + r')\.svc\.cluster\.local'
-    for env_val in all_env_vars:
-        matches = re.findall(dns_pattern, env_val)
-        for match in matches:
-            service_name = match[0]
-            # Find the service and its target pods
-            for service in services.items:
-                if service.metadata.name == service_name and service.spec.selector:
-                    for target_pod in all_pods.items:
-                        if target_pod.metadata.name != pod.metadata.name:
-                            target_labels = target_pod.metadata.labels or {}
-                            if all(target_labels.get(k) == v for k, v in service.spec.selector.items()):
-                                if target_pod.metadata.name not in dependencies:
-                                    dependencies.append(target_pod.metadata.name)
-    
-    # Additional pattern matching for service names that might not include ports
-    # Look for patterns where service names appear in environment variable values
-    service_names = [service.metadata.name for service in services.items]
-    for env_val in all_env_vars:
-        for service_name in service_names:
-            # More flexible matching - look for service name as whole word
-            if re.search(r'\b' + re.escape(service_name) + r'\b', env_val):
-                for service in services.items:
-                    if service.metadata.name == service_name and service.spec.selector:
-                        for target_pod in all_pods.items:
-                            if target_pod.metadata.name != pod.metadata.name:
-                                target_labels = target_pod.metadata.labels or {}
-                                if all(target_labels.get(k) == v for k, v in service.spec.selector.items()):
-                                    if target_pod.metadata.name not in dependencies:
-                                        dependencies.append(target_pod.metadata.name)
+        for service_name in service_index.referenced_services(env_val):
+            add_service_pods(service_name)
     
     return dependencies
 
-@router.get("/podlogs/{namespace}", summary="Fetch all pods in a namespace")
-async def get_all_pods_in_namespace(namespace: str):
-    core_v1_api = client.CoreV1Api()
-    
+def list_pods(core_v1_api, namespace):
     # Fetch pods with include_uninitialized to catch terminating pods
     try:
-        pods = core_v1_api.list_namespaced_pod(namespace=namespace, include_uninitialized=True)
+        return core_v1_api.list_namespaced_pod(namespace=namespace, include_uninitialized=True)
     except Exception:
         # Fallback to standard call if include_uninitialized is not supported
-        pods = core_v1_api.list_namespaced_pod(namespace=namespace)
-
-    if not pods.items:
-        return {"namespace": namespace, "pods": []}
+        return core_v1_api.list_namespaced_pod(namespace=namespace)
 
+def list_namespace_resources(core_v1_api, namespace):
+    """
+    Fetch the services, events and ConfigMaps of the namespace once, instead of once per pod.
+    Returns (services, events grouped by involved object name, ConfigMap data by name).
+    """
     # Fetch all services in the namespace for dependency analysis
     try:
         services = core_v1_api.list_namespaced_service(namespace=namespace)
     except Exception as e:
         services = None
 
-    pod_list = []
-    for pod in pods.items:
-        pod_name = pod.metadata.name
-
-        # Initialize log_entries and event_entries
-        log_entries = []
-        event_entries = []
+    events_by_pod = defaultdict(list)
+    try:
+        for event in core_v1_api.list_namespaced_event(namespace=namespace).items:
+            events_by_pod[event.involved_object.name].append(event)
+    except Exception as e:
+        pass
 
-        # Fetch logs related to the pod
+    configmaps = {}
+    if services:
         try:
-            pod_logs = core_v1_api.read_namespaced_pod_log(name=pod_name, namespace=namespace, tail_lines=200)
-            if pod_logs and pod_logs.strip():
-                for line in pod_logs.splitlines():
-                    log_entries.append(line)
-            else:
-                log_entries.append("** Pod has no logs available")
+            for configmap in core_v1_api.list_namespaced_config_map(namespace=namespace).items:
+                configmaps[configmap.metadata.name] = configmap.data
         except Exception as e:
-            pass
+            # Fall back to reading the referenced ConfigMaps one by one
+            configmaps = None
 
-        # Fetch events related to the pod
-        try:
-            pod_events = core_v1_api.list_namespaced_event(namespace=namespace)
-            event_entries = [
-                f"[{event.type}] {event.reason}: {event.message} (at {event.last_timestamp})"
-                for event in pod_events.items
-                if event.involved_object.name == pod_name
-            ]
-        except Exception as e:
-            pass
+    return services, events_by_pod, configmaps
+
+def pod_log_api():
+    """
+    CoreV1Api for the pod log reads of /podlogs. urllib3 retries a timed out read three times,
+    so they are off here to keep POD_LOG_TIMEOUT the bound of a whole read.
+    """
+    configuration = client.Configuration.get_default_copy()
+    configuration.retries = 0
+    return client.CoreV1Api(client.ApiClient(configuration))
+
+def read_pod_log_lines(core_v1_api, pod_name, namespace):
+    log_entries = []
+    try:
+        # (connect, read): a single float timeout is silently ignored by the kubernetes client
+        pod_logs = core_v1_api.read_namespaced_pod_log(
+            name=pod_name, namespace=namespace, tail_lines=200, _request_timeout=(POD_LOG_TIMEOUT, POD_LOG_TIMEOUT)
+        )
+        if pod_logs and pod_logs.strip():
+            for line in pod_logs.splitlines():
+                log_entries.append(line)
+        else:
+            log_entries.append("** Pod has no logs available")
+    except (Urllib3TimeoutError, MaxRetryError) as e:
+        if isinstance(e, Urllib3TimeoutError) or isinstance(e.reason, Urllib3TimeoutError):
+            log_entries.append(f"** Timed out fetching pod logs after {POD_LOG_TIMEOUT:g}s")
+    except Exception as e:
+        pass
+    return log_entries
+
+async def fetch_pod_logs(core_v1_api, pods, namespace):
+    """
+    Read the logs of all pods concurrently on the kubernetes thread pool. A pod whose logs
+    take longer than POD_LOG_TIMEOUT gets a note instead, so the other pods are still returned.
+    The timeout bounds the read itself, not the time it waits for a free worker.
+    """
+    loop = asyncio.get_running_loop()
+    pod_names = [pod.metadata.name for pod in pods.items]
+    log_entries = await asyncio.gather(*(
+        loop.run_in_executor(kube_executor, read_pod_log_lines, core_v1_api, pod_name, namespace)
+        for pod_name in pod_names
+    ))
+    return dict(zip(pod_names, log_entries))
+
+@router.get("/podlogs/{namespace}", summary="Fetch all pods in a namespace")
+async def get_all_pods_in_namespace(namespace: str):
+    core_v1_api = client.CoreV1Api()
+    loop = asyncio.get_running_loop()
+
+    # The kubernetes client is synchronous, keep its calls off the event loop
+    pods = await loop.run_in_executor(kube_executor, list_pods, core_v1_api, namespace)
+
+    if not pods.items:
+        return {"namespace": namespace, "pods": []}
+
+    logs_by_pod = asyncio.ensure_future(fetch_pod_logs(pod_log_api(), pods, namespace))
+    services, events_by_pod, configmaps = await loop.run_in_executor(
+        kube_executor, list_namespace_resources, core_v1_api, namespace
+    )
+    logs_by_pod = await logs_by_pod
+
+    service_index = ServiceIndex(pods, services) if services else None
+
+    pod_list = []
+    for pod in pods.items:
+        pod_name = pod.metadata.name
+
+        # Logs and events related to the pod
+        log_entries = logs_by_pod[pod_name]
+        event_entries = [
+            f"[{event.type}] {event.reason}: {event.message} (at {event.last_timestamp})"
+            for event in events_by_pod.get(pod_name, [])
+        ]
 
         # Analyze pod dependencies
         dependencies = []
         if services:
             try:
-                dependencies = find_pod_dependencies(pod, pods, services, namespace, core_v1_api)
+                dependencies = find_pod_dependencies(pod, pods, services, namespace, core_v1_api, service_index, configmaps)
                 # print(f"Pod {pod_name} dependencies: {dependencies}")
             except Exception as e:
                 print(f"Error analyzing dependencies for pod {pod_name}: {str(e)}")
@@ -362,4 +417,240 @@ async def get_all_pods_in_namespace(namespace: str):
             "dependencies": dependencies,
         })
 
-    return {"namespace": namespace, "pods": pod_list}
\ No newline at end of file
+    return {"namespace": namespace, "pods": pod_list}
+
+def log_timestamp_key(timestamp):
+    """
+    Sortable form of the RFC 3339 timestamp kubernetes prefixes log lines with (timestamps=True);
+    the fraction is trimmed of trailing zeros, so the strings themselves do not compare in order.
+    """
+    base, _, fraction = timestamp.rstrip("Z").partition(".")
+    return base, fraction.ljust(9, "0")
+
+def seconds_since(timestamp):
+    base = log_timestamp_key(timestamp)[0]
+    then = datetime.strptime(base, "%Y-%m-%dT%H:%M:%S").replace(tzinfo=timezone.utc)
+    return max(1, int((datetime.now(timezone.utc) - then).total_seconds()) + 1)
+
+def valid_since_times(since_time):
+    """The resume tokens of a client that are log timestamps; the pods of invalid ones start over."""
+    valid = {}
+    for pod_name, timestamp in (since_time.items() if isinstance(since_time, dict) else ()):
+        try:
+            seconds_since(timestamp)
+        except (AttributeError, TypeError, ValueError):
+            print(f"Ignoring invalid resume token of pod {pod_name}: {timestamp!r}")
+            continue
+        valid[pod_name] = timestamp
+    return valid
+
+class NamespaceLogStream:
+    """
+    Live logs and events of the pods of a namespace, for one /ws/podlogs connection.
+
+    A thread per pod follows its log (follow=True) and a thread watches the events of the
+    namespace; both push what is new onto an asyncio queue that next_batch() drains. Once
+    LOG_STREAM_FOLLOWERS logs are followed, further pods are reported as unfollowed instead.
+    Batches carry resume tokens for what they contain: the timestamp of the last line of each
+    pod and the resource version of the last event. A client that reconnects with the latest
+    ones only receives what it has not seen yet.
+    """
+    def __init__(self, core_v1_api, namespace, loop):
+        self.core_v1_api = core_v1_api
+        self.namespace = namespace
+        self.loop = loop
+        self.queue = asyncio.Queue()
+        self.stopped = threading.Event()
+        self.lock = threading.Lock()
+        self.followed = set()
+        self.unfollowed = set()
+        self.responses = {}  # pod name -> open log stream, closed on stop()
+
+    def push(self, item):
+        self.loop.call_soon_threadsafe(self.queue.put_nowait, item)
+
+    def start_thread(self, target, *args):
+        threading.Thread(target=target, args=args, name=f"podlogs-{self.namespace}", daemon=True).start()
+
+    def start(self, pod_names, since_time, resource_version):
+        for pod_name in pod_names:
+            self.follow(pod_name, since_time.get(pod_name))
+        self.start_thread(self.watch_events, resource_version)
+
+    def follow(self, pod_name, since_time=None):
+        with self.lock:
+            if pod_name in self.followed or self.stopped.is_set():
+                return
+            if not log_followers.acquire(blocking=False):
+                # Tried again on the next event of the pod, reported once
+                if pod_name not in self.unfollowed:
+                    self.unfollowed.add(pod_name)
+                    print(f"Not following the log of pod {pod_name}: {LOG_STREAM_FOLLOWERS} logs are followed already")
+                    self.push(("unfollowed", pod_name, None, None))
+                return
+            self.unfollowed.discard(pod_name)
+            self.followed.add(pod_name)
+        self.start_thread(self.follow_pod_log, pod_name, since_time)
+
+    def stop(self):
+        self.stopped.set()
+        with self.lock:
+            responses = list(self.responses.values())
+        # Unblock the threads waiting on a log line
+        for response in responses:
+            try:
+                response.close()
+            except Exception:
+                pass
+
+    def follow_pod_log(self, pod_name, since_time):
+        try:
+            self.follow_pod_log_until_stopped(pod_name, since_time)
+        finally:
+            log_followers.release()
+
+    def follow_pod_log_until_stopped(self, pod_name, since_time):
+        # Reconnect when the stream ends, e.g. because the container restarted
+        while not self.stopped.is_set():
+            if since_time:
+                # The python client has no since_time, ask for whole seconds and skip what was already sent
+                window = {"since_seconds": seconds_since(since_time)}
+            else:
+                window = {"tail_lines": 200}
+            try:
+                response = self.core_v1_api.read_namespaced_pod_log(
+                    name=pod_name, namespace=self.namespace, follow=True, timestamps=True,
+                    _preload_content=False, **window
+                )
+                with self.lock:
+                    if self.stopped.is_set():
+                        # stop() ran while the stream was being opened and could not close it
+                        response.close()
+                        return
+                    self.responses[pod_name] = response
+                for raw_line in response:
+                    if self.stopped.is_set():
+                        break
+                    timestamp, _, line = raw_line.decode("utf-8", errors="replace").rstrip("\n").partition(" ")
+                    if since_time and log_timestamp_key(timestamp) <= log_timestamp_key(since_time):
+                        continue
+                    since_time = timestamp
+                    self.push(("log", pod_name, timestamp, line))
+            except ApiException as e:
+                if e.status in (400, 404):
+                    # The pod is gone or its container is not running; its next event follows it again
+                    with self.lock:
+                        self.responses.pop(pod_name, None)
+                        self.followed.discard(pod_name)
+                    return
+                print(f"Log stream of pod {pod_name} failed: {str(e)}")
+            except Exception as e:
+                if not self.stopped.is_set():
+                    print(f"Log stream of pod {pod_name} failed: {str(e)}")
+            with self.lock:
+                self.responses.pop(pod_name, None)
+            self.stopped.wait(LOG_STREAM_RETRY)
+
+    def watch_events(self, resource_version):
+        while not self.stopped.is_set():
+            event_watch = watch.Watch()
+            try:
+                for item in event_watch.stream(
+                    self.core_v1_api.list_namespaced_event, namespace=self.namespace,
+                    resource_version=resource_version, timeout_seconds=60
+                ):
+                    if self.stopped.is_set():
+                        event_watch.stop()
+                        break
+                    event = item["object"]
+                    resource_version = event.metadata.resource_version
+                    if item["type"] in ("ADDED", "MODIFIED"):
+                        self.push(("event", event.involved_object.name, resource_version, event))
+                        # Pods created after the connection, e.g. by a redeploy
+                        if event.involved_object.kind == "Pod":
+                            self.follow(event.involved_object.name)
+                continue
+            except ApiException as e:
+                if e.status == 410:
+                    # Resource version too old, start over from the current events
+                    resource_version = None
+                else:
+                    print(f"Event watch of namespace {self.namespace} failed: {str(e)}")
+            except Exception as e:
+                print(f"Event watch of namespace {self.namespace} failed: {str(e)}")
+            self.stopped.wait(LOG_STREAM_RETRY)
+
+    async def next_batch(self):
+        """Wait for new log lines or events and return everything queued since, grouped by pod."""
+        batch = {
+            "logs": defaultdict(list), "events": defaultdict(list), "since_time": {}, "resource_version": None,
+            "unfollowed": [],
+        }
+        item = await self.queue.get()
+        while True:
+            kind, pod_name, token, payload = item
+            if kind == "unfollowed":
+                batch["unfollowed"].append(pod_name)
+            elif kind == "log":
+                batch["logs"][pod_name].append(payload)
+                batch["since_time"][pod_name] = token
+            else:
+                batch["events"][pod_name].append(
+                    f"[{payload.type}] {payload.reason}: {payload.message} (at {payload.last_timestamp})"
+                )
+                batch["resource_version"] = token
+            if self.queue.empty():
+                return batch
+            item = self.queue.get_nowait()
+
+@router.websocket("/ws/podlogs/{namespace}")
+async def stream_pod_logs(websocket: WebSocket, namespace: str):
+    """
+    Push new log lines and events of the pods in a namespace over one connection.
+
+    The client first sends the resume tokens of its previous connection, or {} to start with
+    the last 200 lines of every pod and only new events:
+    {"since_time": {"<pod>": "<timestamp>"}, "resource_version": "<version>"}
+    Pods whose log cannot be followed because of LOG_STREAM_FOLLOWERS are listed in "unfollowed".
+    """
+    await websocket.accept()
+    core_v1_api = client.CoreV1Api()
+    loop = asyncio.get_running_loop()
+    stream = NamespaceLogStream(core_v1_api, namespace, loop)
+    receive = batch = None
+    try:
+        data = await websocket.receive_json()
+        pods = await loop.run_in_executor(kube_executor, list_pods, core_v1_api, namespace)
+        resource_version = data.get("resource_version")
+        if not resource_version:
+            # Events up to now are part of the /podlogs snapshot
+            events = await loop.run_in_executor(
+                kube_executor, lambda: core_v1_api.list_namespaced_event(namespace=namespace)
+            )
+            resource_version = events.metadata.resource_version
+        stream.start([pod.metadata.name for pod in pods.items], valid_since_times(data.get("since_time")), resource_version)
+        # Also wait on the client, so that a disconnect stops the followers even when no logs come
+        receive = asyncio.ensure_future(websocket.receive())
+        batch = asyncio.ensure_future(stream.next_batch())
+        while True:
+            await asyncio.wait({receive, batch}, return_when=asyncio.FIRST_COMPLETED)
+            if receive.done():
+                if receive.result()["type"] == "websocket.disconnect":
+                    print("Client disconnected")
+                    break
+                # Nothing else is expected from the client after its resume tokens
+                receive = asyncio.ensure_future(websocket.receive())
+            if batch.done():
+                await websocket.send_json(batch.result())
+                batch = asyncio.ensure_future(stream.next_batch())
+    except WebSocketDisconnect:
+        print("Client disconnected")
+    finally:
+        for task in (receive, batch):
+            if task is not None:
+                task.cancel()
+        stream.stop()
+        try:
+            await websocket.close()
+        except Exception:
+            pass
@@ -1,12 +1,14 @@
 from fastapi import APIRouter, HTTPException, WebSocket, WebSocketDisconnect
 from fastapi.concurrency import run_in_threadpool
 from kubernetes import client
+import asyncio
 import json
 
 
 from app.models.pipeline_model import PipelineFlow, WorkflowId
 from app.services.workflow_info_service import WorkflowInfo
 from app.services.namespace_service import deploy_manifest_in_namespace, delete_namespace, check_ns_status
+from app.services.sandbox_status_service import sandbox_status_cache
 
 router = APIRouter()
 
@@ -45,7 +47,15 @@ async def check_sandbox_status(websocket: WebSocket):
     try:
         data = await websocket.receive_json()
         print("Received data: ", data)
-        response = await run_in_threadpool(check_ns_status, data["id"], data["status"], core_v1_api, apps_v1_api, None)
+        if await sandbox_status_cache.wait_synced():
+            # Pushed by the shared watches of the sandbox namespaces
+            response = await sandbox_status_cache.wait_for_status(data["id"], data["status"], websocket.send_json)
+        else:
+            loop = asyncio.get_running_loop()
+            # Readiness progress of the resources, sent from the polling thread
+            def progress(message):
+                asyncio.run_coroutine_threadsafe(websocket.send_json(message), loop).result()
+            response = await run_in_threadpool(check_ns_status, data["id"], data["status"], core_v1_api, apps_v1_api, None, progress)
         await websocket.send_json(response)
     except WebSocketDisconnect:
         print("Client disconnected")
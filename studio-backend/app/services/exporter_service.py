@@ -1,12 +1,59 @@
+import hashlib
+import json
 import os
+import threading
 import yaml
 from collections import OrderedDict
 import traceback
 
-from app.utils.exporter_utils import TEMPLATES_DIR, manifest_map, compose_map, process_opea_services
+from app.utils.exporter_utils import process_opea_services
 from app.utils.placeholders_utils import ordered_load_all, replace_manifest_placeholders, replace_dynamic_manifest_placeholder, replace_compose_placeholders, replace_dynamic_compose_placeholder
+from app.utils.template_utils import template_registry, add_healthcheck_endpoints
+
+# Generated manifests and compose files of the most recently exported workflows
+EXPORT_CACHE_SIZE = int(os.getenv("EXPORT_CACHE_SIZE", 64))
+# Environment variables the generated files depend on besides the workflow info
+EXPORT_ENV_VARS = ("REGISTRY", "TAG", "SBX_HTTP_PROXY", "SBX_NO_PROXY", "APP_FRONTEND_IMAGE", "APP_BACKEND_IMAGE", "TELEMETRY_ENDPOINT")
+
+_export_cache = OrderedDict()
+_export_cache_lock = threading.Lock()
+
+def export_cache_key(kind, proj_info_json, *variant):
+    """Content hash of everything a generated file depends on."""
+    content = json.dumps(
+        [kind, proj_info_json, [os.getenv(name) for name in EXPORT_ENV_VARS], variant],
+        sort_keys=True, separators=(",", ":"), default=str,
+    )
+    return hashlib.sha256(content.encode("utf-8")).hexdigest()
+
+def cached_export(key, render):
+    """Return the generated file cached under key, rendering and caching it (LRU) on a miss."""
+    with _export_cache_lock:
+        if key in _export_cache:
+            _export_cache.move_to_end(key)
+            return _export_cache[key]
+    content = render()
+    with _export_cache_lock:
+        _export_cache[key] = content
+        while len(_export_cache) > EXPORT_CACHE_SIZE:
+            _export_cache.popitem(last=False)
+    return content
 
 def convert_proj_info_to_manifest(proj_info_json, output_file=None):
+    # The nginx resources only go into exported files, not into sandboxes
+    key = export_cache_key("manifest", proj_info_json, output_file is None)
+    manifest_string = cached_export(key, lambda: render_manifest(proj_info_json, skip_nginx=output_file is None))
+
+    # If an output file is specified, write the manifest string to the file
+    if output_file:
+        with open(output_file, "w") as f:
+            f.write(manifest_string)
+        print(f"Manifest written to {output_file}")
+    else:
+        # Otherwise, return the manifest string
+        return manifest_string
+
+def render_manifest(proj_info_json, skip_nginx=True):
 
     print("Converting workflow info json to manifest.")
     try:
@@ -20,10 +67,16 @@ def convert_proj_info_to_manifest(proj_info_json, output_file=None):
 
     for service_name, service_info in opea_services["services"].items():
         # print(f"Importing {service_name} service into manifest")
-        service_file_path = os.path.join(TEMPLATES_DIR, manifest_map[service_info["service_type"]])
-        with open(service_file_path, "r") as service_file:
-            service_manifest_read = service_file.read()
-        service_manifest_raw = list(ordered_load_all(replace_dynamic_manifest_placeholder(service_manifest_read, service_info, proj_info_json), yaml.SafeLoader))
+        template = template_registry.manifest(service_info["service_type"])
+        if not template.dynamic:
+            output_manifest.extend((doc, service_name) for doc in template.render(service_info))
+            continue
+        if service_info.get('service_type') == 'app':
+            # app-backend probes the same dependencies as the wait-for-remote-service init containers
+            backend_proj_info_json = add_healthcheck_endpoints(proj_info_json, opea_services)
+        else:
+            backend_proj_info_json = proj_info_json
+        service_manifest_raw = list(ordered_load_all(replace_dynamic_manifest_placeholder(template.text, service_info, backend_proj_info_json), yaml.SafeLoader))
         # For app-backend, include all service endpoints in variables so it can connect to all services
         if service_info.get('service_type') == 'app':
             # Add only OPEA service endpoints to app-backend's variables
@@ -55,7 +108,7 @@ def convert_proj_info_to_manifest(proj_info_json, output_file=None):
             # Ensure metadata is an OrderedDict and contains the 'name' key
             if isinstance(metadata, OrderedDict) and 'name' in metadata:
                 # Check if the name is 'nginx'
-                if 'app-nginx' in metadata['name'] and output_file is None:
+                if 'app-nginx' in metadata['name'] and skip_nginx:
                     continue
                 print(f"Processing {metadata['name']} service")
 
@@ -74,17 +127,22 @@ def convert_proj_info_to_manifest(proj_info_json, output_file=None):
         manifest_string += "# Copyright (C) 2024 Intel Corporation\n"
         manifest_string += "# SPDX-License-Identifier: Apache-2.0\n"
         manifest_string += yaml.safe_dump(doc, default_flow_style=False, width=float("inf"), allow_unicode=True)
-    
-    # If an output file is specified, write the manifest string to the file
+
+    return manifest_string
+
+def convert_proj_info_to_compose(proj_info_json, output_file=None):
+    compose_string = cached_export(export_cache_key("compose", proj_info_json), lambda: render_compose(proj_info_json))
+
+    # If an output file is specified, write the compose string to the file
     if output_file:
         with open(output_file, "w") as f:
-            f.write(manifest_string)
-        print(f"Manifest written to {output_file}")
+            f.write(compose_string)
+        print(f"Compose written to {output_file}")
     else:
-        # Otherwise, return the manifest string
-        return manifest_string
+        # Otherwise, return the compose string
+        return compose_string
 
-def convert_proj_info_to_compose(proj_info_json, output_file=None):
+def render_compose(proj_info_json):
 
     print("Converting workflow info json to compose.")
 
@@ -95,11 +153,12 @@ def convert_proj_info_to_compose(proj_info_json, output_file=None):
 
     for service_name, service_info in opea_services["services"].items():
         # print(f"Importing {service_name} service into compose")
-        service_file_path = os.path.join(TEMPLATES_DIR, compose_map[service_info["service_type"]])
-        with open(service_file_path, "r") as service_file:
-            service_compose_read = service_file.read()
-        service_compose_raw = list(ordered_load_all(replace_dynamic_compose_placeholder(service_compose_read, service_info, proj_info_json), yaml.SafeLoader))
-        service_compose = [replace_compose_placeholders(doc, service_info) for doc in service_compose_raw]
+        template = template_registry.compose(service_info["service_type"])
+        if not template.dynamic:
+            service_compose = template.render(service_info)
+        else:
+            service_compose_raw = list(ordered_load_all(replace_dynamic_compose_placeholder(template.text, service_info, proj_info_json), yaml.SafeLoader))
+            service_compose = [replace_compose_placeholders(doc, service_info) for doc in service_compose_raw]
         output_compose.extend((doc, service_name) for doc in service_compose)
 
     # Initialize an empty string to hold the combined content
@@ -139,11 +198,4 @@ def convert_proj_info_to_compose(proj_info_json, output_file=None):
     networks_yaml = yaml.safe_dump(networks_data, default_flow_style=False, sort_keys=False)
     compose_string += networks_yaml
 
-    # If an output file is specified, write the compose string to the file
-    if output_file:
-        with open(output_file, "w") as f:
-            f.write(compose_string)
-        print(f"Compose written to {output_file}")
-    else:
-        # Otherwise, return the compose string
-        return compose_string
\ No newline at end of file
+    return compose_string
\ No newline at end of file
@@ -1,12 +1,224 @@
 from kubernetes import client
 from kubernetes.client.rest import ApiException
+import concurrent.futures
+import hashlib
+import json
+import os
 import time
 import yaml
 import traceback
 
 from app.services.exporter_service import convert_proj_info_to_manifest
 from app.services.dashboard_service import import_grafana_dashboards, delete_dashboard
-from app.utils.namespace_utils import wait_for_deployment, wait_for_service, wait_for_namespace_ready  
+from app.utils.namespace_utils import evaluate_readiness, report_failed_pods
+
+# Time a new sandbox gets for all its pods, deployments and services to become ready
+SANDBOX_READY_TIMEOUT = float(os.getenv("SANDBOX_READY_TIMEOUT", 1800))
+READY_POLL_INTERVAL = 2
+# Resources are applied tier by tier, so that what a tier refers to already exists; concurrently within a tier
+APPLY_TIERS = (("ConfigMap", "Secret", "PersistentVolumeClaim"), ("Service",), ("Deployment",))
+APPLY_WORKERS = int(os.getenv("APPLY_WORKERS", 8))
+# Owner of the fields set by server-side apply
+FIELD_MANAGER = "genai-studio"
+# "in-place" updates an existing sandbox with only the resources that changed, "recreate" deletes its namespace first
+REDEPLOY_MODE = os.getenv("SANDBOX_REDEPLOY_MODE", "in-place")
+MANIFEST_HASH_ANNOTATION = "genai-studio/manifest-hash"
+# Time a resource that has to be recreated gets to be deleted before it is applied again
+RECREATE_TIMEOUT = float(os.getenv("SANDBOX_RECREATE_TIMEOUT", 120))
+CONFIG_HASH_ANNOTATION = "genai-studio/config-hash"
+
+def resource_apis(core_v1_api, apps_v1_api):
+    """(apply, list, delete, read) API functions of every kind a sandbox is made of."""
+    return {
+        "ConfigMap": (core_v1_api.patch_namespaced_config_map, core_v1_api.list_namespaced_config_map, core_v1_api.delete_namespaced_config_map, core_v1_api.read_namespaced_config_map),
+        "Secret": (core_v1_api.patch_namespaced_secret, core_v1_api.list_namespaced_secret, core_v1_api.delete_namespaced_secret, core_v1_api.read_namespaced_secret),
+        "PersistentVolumeClaim": (core_v1_api.patch_namespaced_persistent_volume_claim, core_v1_api.list_namespaced_persistent_volume_claim, core_v1_api.delete_namespaced_persistent_volume_claim, core_v1_api.read_namespaced_persistent_volume_claim),
+        "Service": (core_v1_api.patch_namespaced_service, core_v1_api.list_namespaced_service, core_v1_api.delete_namespaced_service, core_v1_api.read_namespaced_service),
+        "Deployment": (apps_v1_api.patch_namespaced_deployment, apps_v1_api.list_namespaced_deployment, apps_v1_api.delete_namespaced_deployment, apps_v1_api.read_namespaced_deployment),
+    }
+
+def stamp_manifest_hash(manifest):
+    """Annotate the manifest with a hash of its content, which the next redeploy compares against."""
+    metadata = manifest.setdefault("metadata", {})
+    annotations = {key: value for key, value in (metadata.get("annotations") or {}).items() if key != MANIFEST_HASH_ANNOTATION}
+    metadata["annotations"] = annotations
+    content = json.dumps(manifest, sort_keys=True, separators=(",", ":"))
+    manifest_hash = hashlib.sha256(content.encode("utf-8")).hexdigest()[:16]
+    annotations[MANIFEST_HASH_ANNOTATION] = manifest_hash
+    return manifest_hash
+
+def config_references(deployment):
+    """(kind, name) of the ConfigMaps and Secrets the pods of a Deployment manifest read."""
+    pod_spec = deployment["spec"]["template"].get("spec") or {}
+    references = set()
+    for container in (pod_spec.get("containers") or []) + (pod_spec.get("initContainers") or []):
+        for env_from in container.get("envFrom") or []:
+            if "configMapRef" in env_from:
+                references.add(("ConfigMap", env_from["configMapRef"]["name"]))
+            if "secretRef" in env_from:
+                references.add(("Secret", env_from["secretRef"]["name"]))
+        for env in container.get("env") or []:
+            value_from = env.get("valueFrom") or {}
+            if "configMapKeyRef" in value_from:
+                references.add(("ConfigMap", value_from["configMapKeyRef"]["name"]))
+            if "secretKeyRef" in value_from:
+                references.add(("Secret", value_from["secretKeyRef"]["name"]))
+    for volume in pod_spec.get("volumes") or []:
+        if "configMap" in volume:
+            references.add(("ConfigMap", volume["configMap"]["name"]))
+        if "secret" in volume:
+            references.add(("Secret", volume["secret"]["secretName"]))
+    return references
+
+def stamp_config_hashes(manifests):
+    """
+    Annotate the pod template of every Deployment with the hashes of the ConfigMaps and Secrets
+    it reads, so that changing one of them rolls out the Deployment on the next apply.
+    """
+    config_hashes = {
+        (manifest["kind"], manifest["metadata"]["name"]): stamp_manifest_hash(manifest)
+        for manifest in manifests if manifest["kind"] in ("ConfigMap", "Secret")
+    }
+    for manifest in manifests:
+        if manifest["kind"] == "Deployment":
+            hashes = [config_hashes[reference] for reference in sorted(config_references(manifest)) if reference in config_hashes]
+            if hashes:
+                template_metadata = manifest["spec"]["template"].setdefault("metadata", {})
+                annotations = template_metadata.get("annotations") or {}
+                template_metadata["annotations"] = {**annotations, CONFIG_HASH_ANNOTATION: ",".join(hashes)}
+
+def list_live_manifest_hashes(apis, namespace_name):
+    """(kind, name) -> manifest hash of the resources a previous deploy applied in the namespace."""
+    live = {}
+    for kind, (_, list_func, _, _) in apis.items():
+        for obj in list_func(namespace=namespace_name).items:
+            annotations = obj.metadata.annotations or {}
+            if MANIFEST_HASH_ANNOTATION in annotations:
+                live[(kind, obj.metadata.name)] = annotations[MANIFEST_HASH_ANNOTATION]
+    return live
+
+def is_immutable_field_error(e):
+    """Whether an apply was rejected because it changes a field that cannot be updated in place (e.g. a selector)."""
+    body = e.body.decode("utf-8", errors="replace") if isinstance(e.body, bytes) else e.body or ""
+    return e.status == 422 and "immutable" in body
+
+def recreate_resource(apis, namespace_name, manifest, error):
+    """
+    Replace a live resource whose update was rejected with the immutable-field error; raises
+    that error if the resource does not exist or cannot be replaced.
+    """
+    kind = manifest["kind"]
+    name = manifest["metadata"]["name"]
+    apply_func, _, delete_func, read_func = apis[kind]
+    print(f"{kind} '{name}' cannot be updated in place, recreating it: {error.reason}")
+    try:
+        # Background: the object itself goes away at once, its pods are collected afterwards
+        delete_func(name=name, namespace=namespace_name, body=client.V1DeleteOptions(propagation_policy="Background"))
+        # Applying while the object is still terminating (e.g. a PVC held by pvc-protection) would update
+        # the object being deleted, which then disappears after all
+        deadline = time.monotonic() + RECREATE_TIMEOUT
+        while True:
+            try:
+                read_func(name=name, namespace=namespace_name)
+            except ApiException as e:
+                if e.status == 404:
+                    break
+                raise
+            if time.monotonic() > deadline:
+                print(f"{kind} '{name}' still exists {RECREATE_TIMEOUT:.0f}s after its deletion")
+                raise error
+            time.sleep(1)
+        apply_func(name=name, namespace=namespace_name, body=manifest, field_manager=FIELD_MANAGER, force=True,
+                   _content_type="application/apply-patch+yaml")
+    except ApiException as e:
+        if e is not error:
+            print(f"Recreating {kind} '{name}' failed: {e}")
+        raise error
+
+def apply_manifest(apis, namespace_name, manifest):
+    """Server-side apply one resource; returns its deployment status entry and the error, if any."""
+    kind = manifest["kind"]
+    name = manifest["metadata"]["name"]
+    apply_func = apis[kind][0]
+    start = time.time()
+    error = None
+    try:
+        try:
+            apply_func(name=name, namespace=namespace_name, body=manifest, field_manager=FIELD_MANAGER, force=True,
+                       _content_type="application/apply-patch+yaml")
+        except ApiException as e:
+            if not is_immutable_field_error(e):
+                raise
+            recreate_resource(apis, namespace_name, manifest, e)
+        status = "Deployed"
+        # for debug
+        # print(f"Manifest for '{kind}' named '{name}' deployed in namespace '{namespace_name}'")
+    except ApiException as e:
+        print(f"Exception when calling Kubernetes API: {e}")
+        status = f"Failed: {e}"
+        error = e
+    return {"kind": kind, "name": name, "status": status, "duration_ms": round((time.time() - start) * 1000, 1)}, error
+
+def apply_manifests(core_v1_api, apps_v1_api, namespace_name, manifests, executor, live=None):
+    """
+    Apply the manifests tier by tier (APPLY_TIERS), the resources of a tier concurrently on executor.
+
+    For a redeploy, live holds the manifest hashes of the resources already in the namespace
+    (list_live_manifest_hashes): unchanged resources are left alone, so their pods keep running,
+    and resources that are no longer in the manifests are deleted.
+
+    Returns the deployment status of every resource with its apply time; raises the first
+    ApiException once the tier it happened in has finished.
+    """
+    apis = resource_apis(core_v1_api, apps_v1_api)
+    live = live or {}
+
+    deployment_status = []
+    tiers = [[] for _ in APPLY_TIERS]
+    wanted = set()
+    manifests = [manifest for manifest in manifests if manifest is not None]  # Skip empty documents
+    stamp_config_hashes(manifests)
+    for manifest in manifests:
+        tier = next((i for i, kinds in enumerate(APPLY_TIERS) if manifest["kind"] in kinds), None)
+        if tier is None:
+            deployment_status.append({
+                "kind": manifest["kind"],
+                "name": manifest['metadata']['name'],
+                "status": "Unsupported kind"
+            })
+            continue
+        key = (manifest["kind"], manifest["metadata"]["name"])
+        wanted.add(key)
+        if live.get(key) == stamp_manifest_hash(manifest):
+            deployment_status.append({"kind": key[0], "name": key[1], "status": "Unchanged"})
+        else:
+            tiers[tier].append(manifest)
+
+    for kinds, tier in zip(APPLY_TIERS, tiers):
+        start = time.time()
+        futures = [executor.submit(apply_manifest, apis, namespace_name, manifest) for manifest in tier]
+        errors = []
+        for future in futures:
+            status, error = future.result()
+            deployment_status.append(status)
+            if error is not None:
+                errors.append(error)
+        print(f"Applied {len(tier)} {'/'.join(kinds)} resources in namespace '{namespace_name}' in {time.time() - start:.2f}s")
+        if errors:
+            raise errors[0]
+
+    # Remove what the previous deploy had and this one does not, dependents first
+    tier_of = {kind: i for i, kinds in enumerate(APPLY_TIERS) for kind in kinds}
+    for kind, name in sorted(set(live) - wanted, key=lambda key: -tier_of[key[0]]):
+        try:
+            apis[kind][2](name=name, namespace=namespace_name)
+            deployment_status.append({"kind": kind, "name": name, "status": "Deleted"})
+        except ApiException as e:
+            if e.status != 404:
+                print(f"Exception when deleting {kind} '{name}': {e}")
+                deployment_status.append({"kind": kind, "name": name, "status": f"Failed to delete: {e}"})
+
+    return deployment_status
 
 def deploy_manifest_in_namespace(core_v1_api, apps_v1_api, proj_info):
     
@@ -25,19 +237,28 @@ def deploy_manifest_in_namespace(core_v1_api, apps_v1_api, proj_info):
     yaml_docs_deploy = yaml.safe_load_all(manifest_string)
     
     # Check if the namespace exists
+    live = None
     try:
         existing_namespace = core_v1_api.read_namespace(name=namespace_name)
-        print(f"Namespace '{namespace_name}' already exists - deleting first")
-        
-        # Delete the existing namespace first
-        try:
-            core_v1_api.delete_namespace(name=namespace_name, body=client.V1DeleteOptions())
-            print(f"Namespace '{namespace_name}' is being deleted.")
-        except ApiException as delete_e:
-            print(f"Error deleting existing namespace: {delete_e}")
+        if REDEPLOY_MODE == "in-place" and existing_namespace.status.phase != "Terminating":
+            # Only update what changed, unchanged model servers keep running with their weights loaded
+            print(f"Namespace '{namespace_name}' already exists - updating it in place")
+            live = list_live_manifest_hashes(resource_apis(core_v1_api, apps_v1_api), namespace_name)
+        else:
+            if existing_namespace.status.phase == "Terminating":
+                print(f"Namespace '{namespace_name}' is still terminating")
+            else:
+                print(f"Namespace '{namespace_name}' already exists - deleting first")
+
+                # Delete the existing namespace first
+                try:
+                    core_v1_api.delete_namespace(name=namespace_name, body=client.V1DeleteOptions())
+                    print(f"Namespace '{namespace_name}' is being deleted.")
+                except ApiException as delete_e:
+                    print(f"Error deleting existing namespace: {delete_e}")
         
-        # Return status indicating deletion is in progress
-        return {"status": "Deleting existing namespace", "namespace": namespace_name}
+            # Return status indicating deletion is in progress
+            return {"status": "Deleting existing namespace", "namespace": namespace_name}
         
     except ApiException as e:        
         if e.status == 404:
@@ -51,52 +272,11 @@ def deploy_manifest_in_namespace(core_v1_api, apps_v1_api, proj_info):
             print(f"exception: {e}")
             raise
     
-    # Import the dashboard
-    dashboard_response = import_grafana_dashboards(namespace_name)
-
-    # Initialize the deployment status list
-    deployment_status = []
-
-    # Iterate over each document and deploy it
-    for manifest in yaml_docs_deploy:
-        if manifest is None:  # Skip empty documents
-            continue
-        try:
-            name = manifest["metadata"]["name"]
-            kind = manifest["kind"]
-            if kind == "ConfigMap":
-                core_v1_api.create_namespaced_config_map(namespace=namespace_name, body=manifest)
-            elif kind == "Service":
-                core_v1_api.create_namespaced_service(namespace=namespace_name, body=manifest)
-            elif kind == "Deployment":
-                apps_v1_api.create_namespaced_deployment(namespace=namespace_name, body=manifest)
-            elif kind == "Secret":
-                core_v1_api.create_namespaced_secret(namespace=namespace_name, body=manifest)
-            elif kind == "PersistentVolumeClaim":
-                core_v1_api.create_namespaced_persistent_volume_claim(namespace=namespace_name, body=manifest)
-            else:
-                deployment_status.append({
-                    "kind": kind,
-                    "name": manifest['metadata']['name'],
-                    "status": "Unsupported kind"
-                })
-                continue
-            deployment_status.append({
-                "kind": kind,
-                "name": manifest['metadata']['name'],
-                "status": "Deployed"
-            })
-            # for debug
-            # print(f"Manifest for '{kind}' named '{manifest['metadata']['name']}' deployed in namespace '{namespace_name}'")
-            # print(f"Manifest content: {yaml.dump(manifest, default_flow_style=False)}")
-        except ApiException as e:
-            print(f"Exception when calling Kubernetes API: {e}")
-            deployment_status.append({
-                "kind": kind,
-                "name": manifest['metadata']['name'],
-                "status": f"Failed: {e}"
-            })
-            raise
+    with concurrent.futures.ThreadPoolExecutor(max_workers=APPLY_WORKERS) as executor:
+        # Import the dashboard while the resources are applied
+        dashboard_future = executor.submit(import_grafana_dashboards, namespace_name)
+        deployment_status = apply_manifests(core_v1_api, apps_v1_api, namespace_name, yaml_docs_deploy, executor, live)
+        dashboard_response = dashboard_future.result()
 
     return {"status": "Getting Ready", "deployment_msg": deployment_status, "dashboard_msg": dashboard_response}
 
@@ -117,7 +297,22 @@ def delete_namespace(core_v1_api, proj_id):
         print(f"Exception when deleting namespace: {e}")
         return {"status": "Error", "msg": f"Exception when deleting namespace: {e}"}
 
-def check_ns_status(namespace_id, status_type, core_v1_api, apps_v1_api, proj_info=None):
+def sandbox_ready_response(namespace_id):
+    namespace_name = f"sandbox-{namespace_id}"
+
+    sandbox_app_url = f"/?ns={namespace_name}"
+    sandbox_grafana_url = f"/grafana/d/{namespace_id}"
+    sandbox_tracer_url = f"/tracer/{namespace_name}"
+    sandbox_debuglogs_url = f"/debuglogs/{namespace_name}"
+
+    return {f"status": "Ready", "sandbox_app_url": sandbox_app_url, "sandbox_grafana_url": sandbox_grafana_url, "sandbox_tracer_url": sandbox_tracer_url, "sandbox_debuglogs_url": sandbox_debuglogs_url}
+
+def check_ns_status(namespace_id, status_type, core_v1_api, apps_v1_api, proj_info=None, progress=None):
+    """
+    Block until the sandbox namespace reaches the status that follows status_type and return it.
+    While "Getting Ready", progress (if given) is called with the readiness of every resource
+    each time it changes.
+    """
 
     namespace_name = f"sandbox-{namespace_id}"
 
@@ -140,38 +335,38 @@ def check_ns_status(namespace_id, status_type, core_v1_api, apps_v1_api, proj_in
 
     elif status_type == "Getting Ready":
 
-        # List all deployments and services for checking
-        deployments = apps_v1_api.list_namespaced_deployment(namespace=namespace_name)
-        services = core_v1_api.list_namespaced_service(namespace=namespace_name)
-        
-        # Wait for all pods to be ready (this will fail fast if any pod fails)
-        print(f"Checking all pods in namespace: {namespace_name}")
-        if not wait_for_namespace_ready(namespace_name, core_v1_api):
-            print(f"One or more pods failed to become ready in namespace {namespace_name} - returning Error status")
-            return {"status": "Error", "failed_component": "pods"}
-
-        # Wait for all deployments to be ready
-        for deployment in deployments.items:
-            deployment_name = deployment.metadata.name
-            print(f"Checking deployment: {deployment_name}")
-            if not wait_for_deployment(namespace_name, deployment_name, apps_v1_api):
-                print(f"Deployment {deployment_name} failed to become ready - returning Error status")
-                return {"status": "Error", "failed_deployment": deployment_name}
-
-        # Wait for all services to be ready
-        for service in services.items:
-            service_name = service.metadata.name
-            print(f"Checking service: {service_name}")
-            if not wait_for_service(namespace_name, service_name, core_v1_api):
-                print(f"Service {service_name} failed to become ready - returning Error status")
-                return {"status": "Error", "failed_service": service_name}
-
-        sandbox_app_url = f"/?ns={namespace_name}"
-        sandbox_grafana_url = f"/grafana/d/{namespace_id}"
-        sandbox_tracer_url = f"/tracer/{namespace_name}"
-        sandbox_debuglogs_url = f"/debuglogs/{namespace_name}"
-
-        return {f"status": "Ready", "sandbox_app_url": sandbox_app_url, "sandbox_grafana_url": sandbox_grafana_url, "sandbox_tracer_url": sandbox_tracer_url, "sandbox_debuglogs_url": sandbox_debuglogs_url}
+        # Evaluate pods, deployments and services together on every poll instead of waiting for them one by one
+        print(f"Checking all pods, deployments and services in namespace: {namespace_name}")
+        deadline = time.time() + SANDBOX_READY_TIMEOUT
+        last_progress = None
+        with concurrent.futures.ThreadPoolExecutor(max_workers=4) as executor:
+            while True:
+                try:
+                    pods = executor.submit(core_v1_api.list_namespaced_pod, namespace=namespace_name)
+                    deployments = executor.submit(apps_v1_api.list_namespaced_deployment, namespace=namespace_name)
+                    services = executor.submit(core_v1_api.list_namespaced_service, namespace=namespace_name)
+                    replica_sets = executor.submit(apps_v1_api.list_namespaced_replica_set, namespace=namespace_name)
+                    state, resource_progress = evaluate_readiness(
+                        pods.result().items, deployments.result().items, services.result().items, replica_sets.result().items
+                    )
+                except ApiException as e:
+                    print(f"Exception when listing resources in namespace {namespace_name}: {e}")
+                    return {"status": "Error", "msg": f"API Exception: {e}"}
+
+                if state == "Failed":
+                    report_failed_pods(namespace_name, resource_progress)
+                    return {"status": "Error", "failed_component": "pods", "progress": resource_progress}
+                if state == "Ready":
+                    break
+                if progress and resource_progress != last_progress:
+                    progress({"status": "Getting Ready", "progress": resource_progress})
+                    last_progress = resource_progress
+                if time.time() > deadline:
+                    print(f"Namespace {namespace_name} did not become ready in time: {resource_progress}")
+                    return {"status": "Error", "msg": "Sandbox did not become ready in time", "progress": resource_progress}
+                time.sleep(READY_POLL_INTERVAL)
+
+        return sandbox_ready_response(namespace_id)
 
     elif status_type == "Stopping":
 
@@ -0,0 +1,201 @@
+import asyncio
+import threading
+import time
+from collections import defaultdict
+
+from kubernetes import client, watch
+from kubernetes.client.rest import ApiException
+
+from app.services.namespace_service import SANDBOX_READY_TIMEOUT, sandbox_ready_response
+from app.utils.namespace_utils import evaluate_readiness, report_failed_pods
+
+SANDBOX_PREFIX = "sandbox-"
+# Delay before a failed watch is listed and started again
+WATCH_RETRY = 5
+# Server-side timeout of a watch request, after which it is resumed from the last resource version
+WATCH_TIMEOUT = 300
+NAMESPACE_DELETE_TIMEOUT = 300
+# Without a synced cache after this long (e.g. no list/watch permission), clients fall back to polling,
+# and later clients right away until the cache has synced after all
+WATCH_SYNC_TIMEOUT = 30
+KINDS = ("namespaces", "pods", "deployments", "services", "replicasets")
+
+class NamespaceStatusCache:
+    """
+    Pods, deployments, services and replica sets of the sandbox namespaces, and the sandbox
+    namespaces themselves, kept up to date by one list + watch per kind for the whole cluster.
+
+    The /ws/sandbox-status clients wait on the cache for the status they are interested in
+    and are woken up when something changes in their namespace, instead of each polling the
+    API from its own thread.
+    """
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.started = False
+        self.synced = set()  # kinds whose initial list is in the cache
+        self.sync_timed_out = False
+        self.objects = {kind: defaultdict(dict) for kind in KINDS[1:]}
+        self.namespaces = set()
+        self.subscribers = defaultdict(set)  # namespace -> {(loop, asyncio.Event)}
+
+    def start(self):
+        with self.lock:
+            if self.started:
+                return
+            self.started = True
+        core_v1_api = client.CoreV1Api()
+        apps_v1_api = client.AppsV1Api()
+        for kind, list_func in (
+            ("namespaces", core_v1_api.list_namespace),
+            ("pods", core_v1_api.list_pod_for_all_namespaces),
+            ("deployments", apps_v1_api.list_deployment_for_all_namespaces),
+            ("services", core_v1_api.list_service_for_all_namespaces),
+            ("replicasets", apps_v1_api.list_replica_set_for_all_namespaces),
+        ):
+            threading.Thread(target=self.run_watch, args=(kind, list_func), name=f"watch-{kind}", daemon=True).start()
+
+    def run_watch(self, kind, list_func):
+        while True:
+            try:
+                resource_version = self.relist(kind, list_func)
+                while True:
+                    for item in watch.Watch().stream(list_func, resource_version=resource_version, timeout_seconds=WATCH_TIMEOUT):
+                        resource_version = item["object"].metadata.resource_version
+                        self.apply(kind, item["type"], item["object"])
+            except ApiException as e:
+                # 410: the resource version is too old, list again
+                if e.status != 410:
+                    print(f"Watch of {kind} failed: {e}")
+                    time.sleep(WATCH_RETRY)
+            except Exception as e:
+                print(f"Watch of {kind} failed: {e}")
+                time.sleep(WATCH_RETRY)
+
+    def relist(self, kind, list_func):
+        items = list_func()
+        with self.lock:
+            if kind == "namespaces":
+                self.namespaces = {ns.metadata.name for ns in items.items if ns.metadata.name.startswith(SANDBOX_PREFIX)}
+            else:
+                store = defaultdict(dict)
+                for obj in items.items:
+                    if obj.metadata.namespace.startswith(SANDBOX_PREFIX):
+                        store[obj.metadata.namespace][obj.metadata.name] = obj
+                self.objects[kind] = store
+            self.synced.add(kind)
+            namespaces = list(self.subscribers)
+        for namespace in namespaces:
+            self.notify(namespace)
+        return items.metadata.resource_version
+
+    def apply(self, kind, event_type, obj):
+        namespace = obj.metadata.name if kind == "namespaces" else obj.metadata.namespace
+        if not namespace.startswith(SANDBOX_PREFIX):
+            return
+        with self.lock:
+            if kind == "namespaces":
+                if event_type == "DELETED":
+                    self.namespaces.discard(namespace)
+                else:
+                    self.namespaces.add(namespace)
+            elif event_type == "DELETED":
+                self.objects[kind][namespace].pop(obj.metadata.name, None)
+            else:
+                self.objects[kind][namespace][obj.metadata.name] = obj
+        self.notify(namespace)
+
+    def notify(self, namespace):
+        with self.lock:
+            subscribers = list(self.subscribers.get(namespace, ()))
+        for loop, changed in subscribers:
+            loop.call_soon_threadsafe(changed.set)
+
+    async def wait_synced(self, timeout=WATCH_SYNC_TIMEOUT):
+        """
+        Start the watches if needed and wait for their initial lists; False if they did not arrive
+        in time. Once they have not, False right away until they do.
+        """
+        self.start()
+        deadline = time.monotonic() + timeout
+        while len(self.synced) < len(KINDS):
+            if self.sync_timed_out or time.monotonic() > deadline:
+                if not self.sync_timed_out:
+                    print(f"Sandbox status watches not synced after {timeout}s ({', '.join(sorted(self.synced))} synced), polling instead")
+                self.sync_timed_out = True
+                return False
+            await asyncio.sleep(0.2)
+        return True
+
+    def evaluate(self, namespace_id, status_type):
+        """
+        The final response for status_type if the namespace has reached it. While waiting, None,
+        or for "Getting Ready" a progress message with the readiness of every resource.
+        """
+        namespace_name = f"{SANDBOX_PREFIX}{namespace_id}"
+        with self.lock:
+            if len(self.synced) < len(KINDS):
+                return None
+            if status_type == "Deleting existing namespace":
+                if namespace_name not in self.namespaces:
+                    print(f"Namespace {namespace_name} successfully deleted, ready to redeploy")
+                    return {"status": "Ready for redeployment"}
+                return None
+            if status_type == "Stopping":
+                if namespace_name not in self.namespaces:
+                    print(f"Namespace {namespace_name} deleted")
+                    return {"status": "Not Running"}
+                return None
+            pods = list(self.objects["pods"][namespace_name].values())
+            deployments = list(self.objects["deployments"][namespace_name].values())
+            services = list(self.objects["services"][namespace_name].values())
+            replica_sets = list(self.objects["replicasets"][namespace_name].values())
+
+        state, resource_progress = evaluate_readiness(pods, deployments, services, replica_sets)
+        if state == "Failed":
+            report_failed_pods(namespace_name, resource_progress)
+            return {"status": "Error", "failed_component": "pods", "progress": resource_progress}
+        if state == "Ready":
+            return sandbox_ready_response(namespace_id)
+        return {"status": "Getting Ready", "progress": resource_progress}
+
+    async def wait_for_status(self, namespace_id, status_type, progress=None):
+        """
+        Async counterpart of check_ns_status, answered from the cache. While "Getting Ready",
+        the coroutine function progress (if given) is awaited with every change of the readiness.
+        """
+        if status_type not in ("Deleting existing namespace", "Getting Ready", "Stopping"):
+            return None
+        namespace_name = f"{SANDBOX_PREFIX}{namespace_id}"
+        subscriber = (asyncio.get_running_loop(), asyncio.Event())
+        with self.lock:
+            self.subscribers[namespace_name].add(subscriber)
+        timeout = SANDBOX_READY_TIMEOUT if status_type == "Getting Ready" else NAMESPACE_DELETE_TIMEOUT
+        deadline = time.monotonic() + timeout
+        last_response = None
+        try:
+            while True:
+                subscriber[1].clear()
+                response = self.evaluate(namespace_id, status_type)
+                if response is not None and response["status"] != "Getting Ready":
+                    return response
+                if response is not None:
+                    if progress and response != last_response:
+                        await progress(response)
+                    last_response = response
+                try:
+                    await asyncio.wait_for(subscriber[1].wait(), deadline - time.monotonic())
+                except asyncio.TimeoutError:
+                    if status_type == "Getting Ready":
+                        print(f"Namespace {namespace_name} did not become ready in time")
+                        return {"status": "Error", "msg": "Sandbox did not become ready in time", "progress": (last_response or {}).get("progress")}
+                    print(f"Namespace {namespace_name} deletion timed out")
+                    if status_type == "Stopping":
+                        return {"status": "Error"}
+                    return {"status": "Error", "msg": "Namespace deletion timed out"}
+        finally:
+            with self.lock:
+                self.subscribers[namespace_name].discard(subscriber)
+                if not self.subscribers[namespace_name]:
+                    del self.subscribers[namespace_name]
+
+sandbox_status_cache = NamespaceStatusCache()
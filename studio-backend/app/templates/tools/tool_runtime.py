@@ -0,0 +1,269 @@
+# Copyright (C) 2024 Intel Corporation
+# SPDX-License-Identifier: Apache-2.0
+
+# Shared HTTP clients of the agent tools in this directory. The agent loads the tool files by
+# path, so they add their own directory to sys.path before importing this module.
+
+import asyncio
+import os
+import threading
+import time
+import weakref
+from collections import OrderedDict
+
+import aiohttp
+import requests
+import yaml
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+try:
+    from prometheus_client import Counter
+except ImportError:
+    Counter = None
+
+TOOL_CONNECT_TIMEOUT = float(os.getenv("TOOL_CONNECT_TIMEOUT", 10))
+TOOL_TIMEOUT = float(os.getenv("TOOL_TIMEOUT", 300))
+TOOL_RETRIES = int(os.getenv("TOOL_RETRIES", 2))
+TOOL_POOL_SIZE = int(os.getenv("TOOL_POOL_SIZE", 16))
+# only answers that say the request was not processed, a 504 may still be running the tool
+RETRY_STATUSES = (502, 503)
+# budget of a single tool call when several are dispatched together
+TOOL_CALL_TIMEOUT = float(os.getenv("TOOL_CALL_TIMEOUT", TOOL_TIMEOUT))
+# identical tool calls are answered from the cache for this long, unless the tool sets its own "cache"
+# in the tools yaml. The cache is shared by all conversations of the agent process and its results may
+# go stale, so it is off (0) unless enabled.
+TOOL_CACHE_TTL = float(os.getenv("TOOL_CACHE_TTL", 0))
+TOOL_CACHE_MAXSIZE = int(os.getenv("TOOL_CACHE_MAXSIZE", 256))
+# in-cluster services are never reached through the http proxy
+PROXIES = {"http": ""}
+
+_session = None
+_session_lock = threading.Lock()
+_async_sessions = weakref.WeakKeyDictionary()  # event loop -> aiohttp session
+_loop = None
+_loop_lock = threading.Lock()
+_MISS = object()
+_tool_caches = {}  # tool name -> ToolCallCache, None when caching is disabled for the tool
+_tool_caches_lock = threading.Lock()
+_tool_cache_config = None
+
+if Counter is not None:
+    # exported on the agent's /metrics next to its own metrics
+    _cache_hits = Counter("agent_tool_cache_hits", "Tool calls answered from the tool call cache", ["tool"])
+    _cache_misses = Counter("agent_tool_cache_misses", "Tool calls that missed the tool call cache", ["tool"])
+
+
+def get_session():
+    """Process-wide requests session, keeping connections to the tool endpoints alive."""
+    global _session
+    if _session is None:
+        with _session_lock:
+            if _session is None:
+                # POSTs are retried only when they did not reach the tool: connect errors and 502/503,
+                # never after a read timeout
+                retry = Retry(
+                    total=TOOL_RETRIES,
+                    connect=TOOL_RETRIES,
+                    read=0,
+                    other=0,
+                    status=TOOL_RETRIES,
+                    backoff_factor=0.5,
+                    status_forcelist=RETRY_STATUSES,
+                    allowed_methods=None,
+                )
+                adapter = HTTPAdapter(pool_connections=TOOL_POOL_SIZE, pool_maxsize=TOOL_POOL_SIZE, max_retries=retry)
+                session = requests.Session()
+                session.mount("http://", adapter)
+                session.mount("https://", adapter)
+                _session = session
+    return _session
+
+
+def post_json(url, payload):
+    response = get_session().post(url, json=payload, proxies=PROXIES, timeout=(TOOL_CONNECT_TIMEOUT, TOOL_TIMEOUT))
+    return response.json()
+
+
+def get_async_session():
+    """aiohttp session of the running event loop, for agents calling the async tool variants."""
+    loop = asyncio.get_running_loop()
+    session = _async_sessions.get(loop)
+    if session is None or session.closed:
+        session = aiohttp.ClientSession(
+            connector=aiohttp.TCPConnector(limit=TOOL_POOL_SIZE),
+            timeout=aiohttp.ClientTimeout(total=TOOL_TIMEOUT, sock_connect=TOOL_CONNECT_TIMEOUT),
+        )
+        _async_sessions[loop] = session
+    return session
+
+
+async def apost_json(url, payload):
+    for attempt in range(TOOL_RETRIES + 1):
+        try:
+            async with get_async_session().post(url, json=payload) as response:
+                if response.status not in RETRY_STATUSES or attempt == TOOL_RETRIES:
+                    return await response.json(content_type=None)
+        except aiohttp.ClientConnectorError:
+            # the connection could not be opened, so the tool did not run
+            if attempt == TOOL_RETRIES:
+                raise
+        await asyncio.sleep(0.5 * 2**attempt)
+
+
+class ToolError(Exception):
+    """A failed tool call: the agent gets the message as the tool's answer, the cache keeps nothing."""
+
+
+def join_documents(docs, key=None):
+    """Build the tool context from retrieved documents, one per line."""
+    return "\n".join(doc[key] if key else doc for doc in docs)
+
+
+def normalize_args(kwargs):
+    """Hashable form of tool arguments, ignoring differences in whitespace."""
+    return tuple(sorted((k, " ".join(v.split()) if isinstance(v, str) else v) for k, v in kwargs.items()))
+
+
+class ToolCallCache:
+    """Bounded cache of tool results with a TTL, keyed on tool name + normalized arguments."""
+
+    def __init__(self, maxsize=TOOL_CACHE_MAXSIZE, ttl=TOOL_CACHE_TTL):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            value = self._lookup(key)
+            if value is _MISS:
+                self.misses += 1
+            else:
+                self.hits += 1
+        if Counter is not None:
+            (_cache_misses if value is _MISS else _cache_hits).labels(tool=key[0]).inc()
+        return value
+
+    def _lookup(self, key):
+        entry = self._entries.get(key)
+        if entry is None:
+            return _MISS
+        expires, value = entry
+        if expires < time.monotonic():
+            del self._entries[key]
+            return _MISS
+        self._entries.move_to_end(key)
+        return value
+
+    def put(self, key, value):
+        with self._lock:
+            self._entries[key] = (time.monotonic() + self.ttl, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+
+
+def load_tool_cache_config(path=None):
+    """The "cache" settings of the tools in the agent's tools yaml (the ``tools`` env var), by tool name."""
+    path = path or os.getenv("tools")
+    if not path or not os.path.exists(path):
+        return {}
+    with open(path, "r") as f:
+        tools = yaml.safe_load(f) or {}
+    return {name: setting["cache"] for name, setting in tools.items() if isinstance(setting, dict) and "cache" in setting}
+
+
+def tool_cache(name):
+    """The cache of tool ``name``, configured by its ``cache: {ttl, maxsize}`` entry; None if its ttl is 0."""
+    global _tool_cache_config
+    with _tool_caches_lock:
+        if name not in _tool_caches:
+            if _tool_cache_config is None:
+                _tool_cache_config = load_tool_cache_config()
+            config = _tool_cache_config.get(name) or {}
+            ttl = float(config.get("ttl", TOOL_CACHE_TTL))
+            maxsize = int(config.get("maxsize", TOOL_CACHE_MAXSIZE))
+            _tool_caches[name] = ToolCallCache(maxsize=maxsize, ttl=ttl) if ttl > 0 else None
+        return _tool_caches[name]
+
+
+def cache_stats():
+    """Hits and misses of every tool cache, e.g. for logging at the end of an agent run."""
+    return {name: {"hits": cache.hits, "misses": cache.misses} for name, cache in _tool_caches.items() if cache}
+
+
+def cached_call(name, fn, kwargs):
+    """Call the sync tool implementation ``fn`` through the cache of tool ``name``."""
+    cache = tool_cache(name)
+    if cache is None:
+        try:
+            return fn(**kwargs)
+        except ToolError as e:
+            return str(e)
+    key = (name, normalize_args(kwargs))
+    value = cache.get(key)
+    if value is _MISS:
+        try:
+            value = fn(**kwargs)
+        except ToolError as e:
+            return str(e)
+        cache.put(key, value)
+    return value
+
+
+async def acached_call(name, fn, kwargs):
+    """Async counterpart of cached_call."""
+    cache = tool_cache(name)
+    if cache is None:
+        try:
+            return await fn(**kwargs)
+        except ToolError as e:
+            return str(e)
+    key = (name, normalize_args(kwargs))
+    value = cache.get(key)
+    if value is _MISS:
+        try:
+            value = await fn(**kwargs)
+        except ToolError as e:
+            return str(e)
+        cache.put(key, value)
+    return value
+
+
+async def run_tool_calls(calls, timeout=TOOL_CALL_TIMEOUT):
+    """Run independent ``(name, async_fn, kwargs)`` tool calls concurrently and return their results in order.
+
+    Identical calls run once. A call that fails or exceeds ``timeout`` yields an error message
+    for the agent instead of failing the others.
+    """
+
+    async def run_one(name, fn, kwargs):
+        try:
+            return await asyncio.wait_for(fn(**kwargs), timeout)
+        except asyncio.TimeoutError:
+            return f"{name} did not answer within {timeout:g}s."
+        except Exception as e:
+            return f"{name} failed: {e}"
+
+    tasks = {}
+    keys = []
+    for name, fn, kwargs in calls:
+        key = (name, normalize_args(kwargs))
+        keys.append(key)
+        if key not in tasks:
+            tasks[key] = asyncio.ensure_future(run_one(name, fn, kwargs))
+    await asyncio.gather(*tasks.values())
+    return [tasks[key].result() for key in keys]
+
+
+def run_sync(coro):
+    """Run a coroutine from a sync tool on a background event loop that keeps its aiohttp sessions."""
+    global _loop
+    with _loop_lock:
+        if _loop is None:
+            _loop = asyncio.new_event_loop()
+            threading.Thread(target=_loop.run_forever, name="tool-runtime-loop", daemon=True).start()
+    return asyncio.run_coroutine_threadsafe(coro, _loop).result()
@@ -2,7 +2,10 @@
  # SPDX-License-Identifier: Apache-2.0
  
 import os
-import requests
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+from tool_runtime import acached_call, apost_json, cached_call, post_json, run_sync, run_tool_calls
 
 
 def search_knowledge_base(query: str) -> str:
@@ -10,14 +13,13 @@ def search_knowledge_base(query: str) -> str:
 
     Returns text related to the query.
     """
+    return cached_call("search_knowledge_base", _search_knowledge_base, {"query": query})
+
+
+def _search_knowledge_base(query):
     url = os.environ.get("WORKER_AGENT_URL")
     print(url)
-    proxies = {"http": ""}
-    payload = {
-        "messages": query,
-    }
-    response = requests.post(url, json=payload, proxies=proxies)
-    return response.json()["text"]
+    return post_json(url, {"messages": query})["text"]
 
 
 def search_sql_database(query: str) -> str:
@@ -25,11 +27,48 @@ def search_sql_database(query: str) -> str:
 
     Returns text related to the query.
     """
+    return cached_call("search_sql_database", _search_sql_database, {"query": query})
+
+
+def _search_sql_database(query):
+    url = os.environ.get("SQL_AGENT_URL")
+    print(url)
+    return post_json(url, {"messages": query})["text"]
+
+
+def search_all_sources(query: str) -> str:
+    """Search the knowledge base about music and singers and the SQL database on artists at the same time.
+
+    Returns the text each source found for the query.
+    """
+    knowledge, sql = run_sync(
+        run_tool_calls(
+            [
+                ("search_knowledge_base", asearch_knowledge_base, {"query": query}),
+                ("search_sql_database", asearch_sql_database, {"query": query}),
+            ]
+        )
+    )
+    return f"Knowledge base:\n{knowledge}\n\nSQL database:\n{sql}"
+
+
+async def asearch_knowledge_base(query: str) -> str:
+    """Async variant of search_knowledge_base."""
+    return await acached_call("search_knowledge_base", _asearch_knowledge_base, {"query": query})
+
+
+async def _asearch_knowledge_base(query):
+    url = os.environ.get("WORKER_AGENT_URL")
+    print(url)
+    return (await apost_json(url, {"messages": query}))["text"]
+
+
+async def asearch_sql_database(query: str) -> str:
+    """Async variant of search_sql_database."""
+    return await acached_call("search_sql_database", _asearch_sql_database, {"query": query})
+
+
+async def _asearch_sql_database(query):
     url = os.environ.get("SQL_AGENT_URL")
     print(url)
-    proxies = {"http": ""}
-    payload = {
-        "messages": query,
-    }
-    response = requests.post(url, json=payload, proxies=proxies)
-    return response.json()["text"]
\ No newline at end of file
+    return (await apost_json(url, {"messages": query}))["text"]
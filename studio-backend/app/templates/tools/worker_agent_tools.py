@@ -2,39 +2,37 @@
  # SPDX-License-Identifier: Apache-2.0
  
 import os
-import requests
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+from tool_runtime import ToolError, acached_call, apost_json, cached_call, join_documents, post_json
+
+def parse_retrieval_response(data):
+    if "documents" in data:
+        return join_documents(data["documents"])
+    elif "text" in data:
+        return data["text"]
+    elif "reranked_docs" in data:
+        return join_documents(data["reranked_docs"], key="text")
+    else:
+        # not cached, the next call asks the knowledge base again
+        raise ToolError("Error parsing response from the knowledge base.")
 
 def search_knowledge_base(query: str) -> str:
     """Search the knowledge base for a specific query."""
+    # repeated queries of a reasoning loop are answered from the tool cache
+    return cached_call("search_knowledge_base", _search_knowledge_base, {"query": query})
+
+def _search_knowledge_base(query):
     url = os.environ.get("RETRIEVAL_TOOL_URL")
     print(url)
-    proxies = {"http": ""}
-    payload = {
-        "text": query,
-    }
-    response = requests.post(url, json=payload, proxies=proxies)
-    print(response)
-    if "documents" in response.json():
-        docs = response.json()["documents"]
-        context = ""
-        for i, doc in enumerate(docs):
-            if i == 0:
-                context = doc
-            else:
-                context += "\n" + doc
-        # print(context)
-        return context
-    elif "text" in response.json():
-        return response.json()["text"]
-    elif "reranked_docs" in response.json():
-        docs = response.json()["reranked_docs"]
-        context = ""
-        for i, doc in enumerate(docs):
-            if i == 0:
-                context = doc["text"]
-            else:
-                context += "\n" + doc["text"]
-        # print(context)
-        return context
-    else:
-        return "Error parsing response from the knowledge base."
\ No newline at end of file
+    return parse_retrieval_response(post_json(url, {"text": query}))
+
+async def asearch_knowledge_base(query: str) -> str:
+    """Async variant of search_knowledge_base."""
+    return await acached_call("search_knowledge_base", _asearch_knowledge_base, {"query": query})
+
+async def _asearch_knowledge_base(query):
+    url = os.environ.get("RETRIEVAL_TOOL_URL")
+    print(url)
+    return parse_retrieval_response(await apost_json(url, {"text": query}))
@@ -1,156 +1,164 @@
-import time
-from kubernetes.client.rest import ApiException
+# Revision of a Deployment, and of the ReplicaSet holding each of its pod templates
+REVISION_ANNOTATION = "deployment.kubernetes.io/revision"
 
-def wait_for_namespace_ready(namespace, core_v1_api):
-    success, failed_pods = wait_for_all_pods(namespace, core_v1_api)
-    if not success and failed_pods:
-        print(f"Namespace {namespace} has failed pods:")
-        for failed_pod in failed_pods:
-            print(f"  - {failed_pod['name']}: {failed_pod['reason']}")
-    
-    return success
-
-def wait_for_deployment(namespace, deployment_name, apps_v1_api):
-    while True:
-        try:
-            deployment = apps_v1_api.read_namespaced_deployment(name=deployment_name, namespace=namespace)
-            if deployment.status.available_replicas == deployment.spec.replicas:
-                print(f"Deployment {deployment_name} is ready")
-                return True
-        except ApiException as e:
-            print(f"Exception when reading deployment {deployment_name}: {e}")
-            return False
-        time.sleep(5)
-
-def wait_for_service(namespace, service_name, core_v1_api):
-    while True:
-        try:
-            service = core_v1_api.read_namespaced_service(name=service_name, namespace=namespace)
-            if service.spec.cluster_ip:
-                print(f"Service {service_name} is ready")
-                return True
-        except ApiException as e:
-            print(f"Exception when reading service {service_name}: {e}")
-            return False
-        time.sleep(5)
+def classify_pods(pods):
+    """
+    Sort the pods of a namespace into failed pods (dicts with name, phase and reason) and the
+    names of the pods that are not ready yet.
 
-def wait_for_all_pods(namespace, core_v1_api):
-    print(f"Starting to wait for all pods in namespace {namespace}")
-    while True:
-        try:
-            pods = core_v1_api.list_namespaced_pod(namespace=namespace)
-            
-            if not pods.items:
-                print(f"No pods found in namespace {namespace}")
-                return True, [], []
-            
-            failed_pods = []
-            pending_pods = []
-            
-            for pod in pods.items:
-                pod_name = pod.metadata.name
-                # print(f"Pod {pod_name} - Phase: {pod.status.phase}")
-                
-                # Check for terminal failed states first
-                if pod.status.phase in ["Failed", "Unknown"]:
-                    print(f"Pod {pod_name} is in a terminal failed state: {pod.status.phase}")
-                    failed_pods.append({
-                        'name': pod_name,
-                        'phase': pod.status.phase,
-                        'reason': 'Pod phase is terminal failure'
-                    })
-                    continue
-                
-                # Check container statuses for failure conditions
-                pod_failed = False
-                if pod.status.container_statuses:
-                    for i, container_status in enumerate(pod.status.container_statuses):
-                        container_name = container_status.name if container_status.name else f"container-{i}"
-                        # print(f"Pod {pod_name} container {container_name} - Ready: {container_status.ready}")
-                        
-                        if container_status.state.waiting:
-                            waiting_reason = container_status.state.waiting.reason
-                            # print(f"Pod {pod_name} container {container_name} is waiting: {waiting_reason}")
-                            
-                            # Only fail on waiting states that indicate permanent failures
-                            if waiting_reason in [
-                                "ErrImagePull", "ImagePullBackOff", "InvalidImageName", 
-                                "CreateContainerConfigError", "CreateContainerError"]:
-                                print(f"Pod {pod_name} is in a failed state: {waiting_reason}")
-                                failed_pods.append({
-                                    'name': pod_name,
-                                    'phase': pod.status.phase,
-                                    'reason': f'Container {container_name} waiting: {waiting_reason}'
-                                })
-                                pod_failed = True
-                                break
-                            elif waiting_reason == "CrashLoopBackOff":
-                                # For CrashLoopBackOff, check restart count
-                                restart_count = container_status.restart_count
-                                print(f"Pod {pod_name} container {container_name} in CrashLoopBackOff (restarts: {restart_count})")
-                                # Fail faster on CrashLoopBackOff - if we have 2 or more restarts, it's likely a persistent issue
-                                if restart_count >= 2:
-                                    print(f"Pod {pod_name} has multiple restarts ({restart_count}), marking as failed")
-                                    failed_pods.append({
-                                        'name': pod_name,
-                                        'phase': pod.status.phase,
-                                        'reason': f'Container {container_name} CrashLoopBackOff with {restart_count} restarts'
-                                    })
-                                    pod_failed = True
-                                    break
-                            elif waiting_reason in ["PodInitializing", "ContainerCreating"]:
-                                pass
-                                # print(f"Pod {pod_name} container {container_name} is initializing")
-                        elif container_status.state.terminated:
-                            terminated_reason = container_status.state.terminated.reason
-                            exit_code = container_status.state.terminated.exit_code
-                            print(f"Pod {pod_name} container {container_name} terminated: {terminated_reason} (exit code: {exit_code})")
-                            # Only fail on terminated containers if the pod phase is also Failed
-                            # This allows containers that terminated but were restarted by Kubernetes to continue
-                            if terminated_reason in ["Error", "ContainerCannotRun", "DeadlineExceeded"] and pod.status.phase == "Failed":
-                                print(f"Pod {pod_name} container terminated with error and pod is in Failed state: {terminated_reason}")
-                                failed_pods.append({
-                                    'name': pod_name,
-                                    'phase': pod.status.phase,
-                                    'reason': f'Container {container_name} terminated: {terminated_reason}'
-                                })
-                                pod_failed = True
-                                break
-                        elif container_status.state.running:
-                            pass
-                            # print(f"Pod {pod_name} container {container_name} is running")
-                else:
-                    print(f"Pod {pod_name} has no container statuses yet")
-                
-                if pod_failed:
-                    continue
+    Runs on every status evaluation, so it does not log; see report_failed_pods.
+    """
+    failed_pods = []
+    pending_pods = []
+    
+    for pod in pods:
+        pod_name = pod.metadata.name
+        # print(f"Pod {pod_name} - Phase: {pod.status.phase}")
+        
+        # Check for terminal failed states first
+        if pod.status.phase in ["Failed", "Unknown"]:
+            failed_pods.append({
+                'name': pod_name,
+                'phase': pod.status.phase,
+                'reason': 'Pod phase is terminal failure'
+            })
+            continue
+        
+        # Check container statuses for failure conditions
+        pod_failed = False
+        if pod.status.container_statuses:
+            for i, container_status in enumerate(pod.status.container_statuses):
+                container_name = container_status.name if container_status.name else f"container-{i}"
+                # print(f"Pod {pod_name} container {container_name} - Ready: {container_status.ready}")
                 
-                # Check if pod is running and ready
-                if pod.status.phase == "Running":
-                    if pod.status.container_statuses and all(container.ready for container in pod.status.container_statuses):
+                if container_status.state.waiting:
+                    waiting_reason = container_status.state.waiting.reason
+                    # print(f"Pod {pod_name} container {container_name} is waiting: {waiting_reason}")
+                    
+                    # Only fail on waiting states that indicate permanent failures
+                    if waiting_reason in [
+                        "ErrImagePull", "ImagePullBackOff", "InvalidImageName", 
+                        "CreateContainerConfigError", "CreateContainerError"]:
+                        failed_pods.append({
+                            'name': pod_name,
+                            'phase': pod.status.phase,
+                            'reason': f'Container {container_name} waiting: {waiting_reason}'
+                        })
+                        pod_failed = True
+                        break
+                    elif waiting_reason == "CrashLoopBackOff":
+                        # For CrashLoopBackOff, check restart count
+                        restart_count = container_status.restart_count
+                        # Fail faster on CrashLoopBackOff - if we have 2 or more restarts, it's likely a persistent issue
+                        if restart_count >= 2:
+                            failed_pods.append({
+                                'name': pod_name,
+                                'phase': pod.status.phase,
+                                'reason': f'Container {container_name} CrashLoopBackOff with {restart_count} restarts'
+                            })
+                            pod_failed = True
+                            break
+                    elif waiting_reason in ["PodInitializing", "ContainerCreating"]:
                         pass
-                        # print(f"Pod {pod_name} is ready!")
-                    else:
-                        pending_pods.append(pod_name)
-                else:
-                    pending_pods.append(pod_name)
-            
-            # If any pods failed, return immediately
-            if failed_pods:
-                print(f"Found {len(failed_pods)} failed pods:")
-                for failed_pod in failed_pods:
-                    print(f"  - {failed_pod['name']}: {failed_pod['reason']}")
-                return False, failed_pods
-            
-            # If all pods are ready, return success
-            if not pending_pods:
-                print(f"All pods in namespace {namespace} are ready!")
-                return True, []
-            
-            print(f"Waiting for {len(pending_pods)} pods to be ready: {pending_pods}")
-            
-        except ApiException as e:
-            print(f"Exception when listing pods in namespace {namespace}: {e}")
-            return False, [{'name': 'unknown', 'phase': 'unknown', 'reason': f'API Exception: {e}'}], []
+                        # print(f"Pod {pod_name} container {container_name} is initializing")
+                elif container_status.state.terminated:
+                    terminated_reason = container_status.state.terminated.reason
+                    exit_code = container_status.state.terminated.exit_code
+                    # Only fail on terminated containers if the pod phase is also Failed
+                    # This allows containers that terminated but were restarted by Kubernetes to continue
+                    if terminated_reason in ["Error", "ContainerCannotRun", "DeadlineExceeded"] and pod.status.phase == "Failed":
+                        failed_pods.append({
+                            'name': pod_name,
+                            'phase': pod.status.phase,
+                            'reason': f'Container {container_name} terminated: {terminated_reason} (exit code: {exit_code})'
+                        })
+                        pod_failed = True
+                        break
+                elif container_status.state.running:
+                    pass
+                    # print(f"Pod {pod_name} container {container_name} is running")
         
-        time.sleep(5)
\ No newline at end of file
+        if pod_failed:
+            continue
+        
+        # Check if pod is running and ready
+        if pod.status.phase == "Running":
+            if pod.status.container_statuses and all(container.ready for container in pod.status.container_statuses):
+                pass
+                # print(f"Pod {pod_name} is ready!")
+            else:
+                pending_pods.append(pod_name)
+        else:
+            pending_pods.append(pod_name)
+
+    return failed_pods, pending_pods
+
+def current_pods(pods, deployments, replica_sets):
+    """
+    The pods that do not belong to an outdated ReplicaSet of their Deployment.
+
+    During a rolling update the pods of the previous revision keep running until their
+    replacements are ready, so a redeploy fixing a crashing service would otherwise fail on the
+    old pod. Until the controller has observed a new template, all pods of the Deployment are outdated.
+    """
+    revisions = {}
+    for deployment in deployments:
+        observed = (deployment.status.observed_generation or 0) >= (deployment.metadata.generation or 0)
+        revisions[deployment.metadata.name] = (deployment.metadata.annotations or {}).get(REVISION_ANNOTATION) if observed else None
+    outdated = set()
+    for replica_set in replica_sets:
+        for owner in replica_set.metadata.owner_references or []:
+            if owner.kind == "Deployment" and owner.name in revisions:
+                revision = (replica_set.metadata.annotations or {}).get(REVISION_ANNOTATION)
+                if revisions[owner.name] is None or revision != revisions[owner.name]:
+                    outdated.add(replica_set.metadata.name)
+    return [
+        pod for pod in pods
+        if not any(owner.kind == "ReplicaSet" and owner.name in outdated for owner in pod.metadata.owner_references or [])
+    ]
+
+def evaluate_readiness(pods, deployments, services, replica_sets=()):
+    """
+    Evaluate the readiness of all pods, deployments and services of a sandbox as one condition set.
+    Returns (state, progress): state is "Ready", "Pending" or "Failed", and progress maps
+    "<kind>/<name>" to the readiness of every resource, to report to the status websocket.
+    Pods of outdated ReplicaSets (see current_pods) are left out.
+    """
+    pods = current_pods(pods, deployments, replica_sets)
+    failed_pods, pending_pods = classify_pods(pods)
+
+    progress = {}
+    for pod in pods:
+        progress[f"pod/{pod.metadata.name}"] = "Ready"
+    for pod_name in pending_pods:
+        progress[f"pod/{pod_name}"] = "Pending"
+    for failed_pod in failed_pods:
+        progress[f"pod/{failed_pod['name']}"] = f"Failed: {failed_pod['reason']}"
+    deployments_ready = True
+    for deployment in deployments:
+        available = deployment.status.available_replicas or 0
+        progress[f"deployment/{deployment.metadata.name}"] = f"{available}/{deployment.spec.replicas}"
+        # After an in-place redeploy the old pods stay available until the rollout has finished
+        rolled_out = (
+            (deployment.status.observed_generation or 0) >= (deployment.metadata.generation or 0)
+            and (deployment.status.updated_replicas or 0) == deployment.spec.replicas
+        )
+        deployments_ready = deployments_ready and available == deployment.spec.replicas and rolled_out
+    services_ready = True
+    for service in services:
+        progress[f"service/{service.metadata.name}"] = "Ready" if service.spec.cluster_ip else "Pending"
+        services_ready = services_ready and bool(service.spec.cluster_ip)
+
+    if failed_pods:
+        return "Failed", progress
+    # No deployments yet means the sandbox has not been created, or a watch has not caught up with it
+    if pending_pods or not deployments or not deployments_ready or not services_ready:
+        return "Pending", progress
+    return "Ready", progress
+
+def report_failed_pods(namespace, progress):
+    """Print why the pods of a sandbox failed, once, with its final Error status."""
+    print(f"One or more pods failed to become ready in namespace {namespace} - returning Error status")
+    for resource, readiness in progress.items():
+        if resource.startswith("pod/") and readiness.startswith("Failed"):
+            print(f"  - {resource}: {readiness}")
@@ -49,6 +49,44 @@ def detect_default_ui_type(proj_info_json):
 
     return default_type
 
+# Values of these keys hold {} that would clash with .format()
+MANIFEST_VERBATIM_KEYS = ("default.conf", "workflow-info.json")
+MANIFEST_PORT_KEYS = ('port', 'targetPort', 'containerPort')
+
+# Replace the placeholders in one string value of a manifest template
+def fill_manifest_value(key, value, variables):
+    # Replace ${REGISTRY} and ${TAG} with the value from environment variables
+    value = value.replace("${REGISTRY}", os.getenv("REGISTRY", "opea"))
+    value = value.replace("${TAG}", os.getenv("TAG", "latest"))
+    value = value.replace("${HTTP_PROXY}", os.getenv("SBX_HTTP_PROXY", ""))
+    
+    # Enhanced NO_PROXY handling - extract service hostnames from variables
+    base_no_proxy = os.getenv("SBX_NO_PROXY", "")
+    if "${NO_PROXY}" in value and variables:
+        service_hostnames = []
+        # Extract hostnames from all services in variables
+        for var_key, var_value in variables.items():
+            if var_key.endswith('_endpoint') and isinstance(var_value, str):
+                service_hostnames.append(var_value)
+        
+        if service_hostnames:
+            enhanced_no_proxy = f"{base_no_proxy},{','.join(service_hostnames)}" if base_no_proxy else ','.join(service_hostnames)
+            value = value.replace("${NO_PROXY}", enhanced_no_proxy)
+        else:
+            value = value.replace("${NO_PROXY}", base_no_proxy)
+    else:
+        value = value.replace("${NO_PROXY}", base_no_proxy)
+    # Attempt to replace placeholders in the string
+    formatted_value = value.format(**variables)
+    # If the key is a port-related field and the formatted value is a digit, convert to int
+    if key in MANIFEST_PORT_KEYS and formatted_value.isdigit():
+        return int(formatted_value)
+    return formatted_value
+
+# Whether fill_manifest_value can change the string value of key
+def is_manifest_slot(key, value):
+    return "{" in value or "}" in value or (key in MANIFEST_PORT_KEYS and value.isdigit())
+
 # Recursive function to replace placeholders in manifest templates
 def replace_manifest_placeholders(obj, variables):
     # print("placeholders_utils.py: replace_manifest_placeholders", obj, variables)
@@ -56,37 +94,10 @@ def replace_manifest_placeholders(obj, variables):
         for key, value in obj.items():
             # print("placeholders_utils.py: replace_manifest_placeholders", key, value)
             # Skip nginx.conf as it contains {} that will clashe with .format()
-            if key == "default.conf" or key == "workflow-info.json":
+            if key in MANIFEST_VERBATIM_KEYS:
                 continue
             if isinstance(value, str):
-                # Replace ${REGISTRY} and ${TAG} with the value from environment variables
-                value = value.replace("${REGISTRY}", os.getenv("REGISTRY", "opea"))
-                value = value.replace("${TAG}", os.getenv("TAG", "latest"))
-                value = value.replace("${HTTP_PROXY}", os.getenv("SBX_HTTP_PROXY", ""))
-                
-                # Enhanced NO_PROXY handling - extract service hostnames from variables
-                base_no_proxy = os.getenv("SBX_NO_PROXY", "")
-                if "${NO_PROXY}" in value and variables:
-                    service_hostnames = []
-                    # Extract hostnames from all services in variables
-                    for var_key, var_value in variables.items():
-                        if var_key.endswith('_endpoint') and isinstance(var_value, str):
-                            service_hostnames.append(var_value)
-                    
-                    if service_hostnames:
-                        enhanced_no_proxy = f"{base_no_proxy},{','.join(service_hostnames)}" if base_no_proxy else ','.join(service_hostnames)
-                        value = value.replace("${NO_PROXY}", enhanced_no_proxy)
-                    else:
-                        value = value.replace("${NO_PROXY}", base_no_proxy)
-                else:
-                    value = value.replace("${NO_PROXY}", base_no_proxy)
-                # Attempt to replace placeholders in the string
-                formatted_value = value.format(**variables)
-                # If the key is a port-related field and the formatted value is a digit, convert to int
-                if key in ['port', 'targetPort', 'containerPort'] and formatted_value.isdigit():
-                    obj[key] = int(formatted_value)
-                else:
-                    obj[key] = formatted_value
+                obj[key] = fill_manifest_value(key, value, variables)
             else:
                 # Recursively call the function for nested structures
                 obj[key] = replace_manifest_placeholders(value, variables)
@@ -138,23 +149,37 @@ def replace_dynamic_manifest_placeholder(value_str, service_info, proj_info_json
     # print(final_config)
     return final_config
 
+COMPOSE_PLACEHOLDER_PATTERN = re.compile(r'\{\{(.*?)\}\}')
+
+# Replace the {{}} placeholders in a compose template key
+def fill_compose_key(key, variables):
+    return COMPOSE_PLACEHOLDER_PATTERN.sub(lambda m: str(variables.get(m.group(1), m.group(0))), key)
+
+# Replace the placeholders in one string of a compose template
+def fill_compose_string(value, variables):
+    # Replace {{}} placeholders in strings
+    value = fill_compose_key(value, variables)
+    value = value.replace("${REGISTRY}", os.getenv("REGISTRY", "opea"))
+    value = value.replace("${TAG}", os.getenv("TAG", "latest"))
+    return value
+
+# Whether fill_compose_key / fill_compose_string can change the string
+def is_compose_slot(value):
+    return "{{" in value or "${" in value
+
 # Recursive function to replace placeholders in nested dictionaries and lists
 def replace_compose_placeholders(obj, variables):
     if isinstance(obj, dict):
         new_obj = {}
         for key, value in obj.items():
             # Replace placeholders in the key
-            new_key = re.sub(r'\{\{(.*?)\}\}', lambda m: str(variables.get(m.group(1), m.group(0))), key)
+            new_key = fill_compose_key(key, variables)
             new_obj[new_key] = replace_compose_placeholders(value, variables)
         return new_obj
     elif isinstance(obj, list):
         return [replace_compose_placeholders(value, variables) for value in obj]
     elif isinstance(obj, str):
-        # Replace {{}} placeholders in strings
-        value = re.sub(r'\{\{(.*?)\}\}', lambda m: str(variables.get(m.group(1), m.group(0))), obj)
-        value = value.replace("${REGISTRY}", os.getenv("REGISTRY", "opea"))
-        value = value.replace("${TAG}", os.getenv("TAG", "latest"))
-        return value
+        return fill_compose_string(obj, variables)
     return obj
 
 def replace_dynamic_compose_placeholder(value_str, service_info, proj_info_json):
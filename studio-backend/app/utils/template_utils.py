@@ -0,0 +1,127 @@
+import copy
+import os
+import re
+import threading
+import yaml
+from functools import partial
+
+from app.utils.exporter_utils import TEMPLATES_DIR, manifest_map, compose_map
+from app.utils.placeholders_utils import (
+    ordered_load_all, MANIFEST_VERBATIM_KEYS, fill_manifest_value, is_manifest_slot,
+    fill_compose_key, fill_compose_string, is_compose_slot,
+)
+
+# Placeholders replace_dynamic_*_placeholder substitutes in the template text before it is parsed
+DYNAMIC_PLACEHOLDER_PATTERN = re.compile(r'__[A-Z][A-Z0-9_]*__')
+# HEALTHCHECK_ENDPOINT used by the wait-for-remote-service init containers of the manifests
+HEALTHCHECK_ENDPOINT_PATTERN = re.compile(r'HEALTHCHECK_ENDPOINT:\s*"([^"]+)"')
+
+# Compiling a template node gives a function that builds a fresh copy of the node for the given
+# variables. Only the strings that can change (slots) are filled, the rest is copied as parsed.
+
+def constant(value, variables):
+    return value
+
+def compile_manifest_node(node, verbatim=False):
+    """Compiled counterpart of replace_manifest_placeholders for one parsed manifest node."""
+    if isinstance(node, dict):
+        node_type = type(node)
+        entries = []
+        for key, value in node.items():
+            if verbatim or key in MANIFEST_VERBATIM_KEYS:
+                entries.append((key, compile_manifest_node(value, verbatim=True)))
+            elif isinstance(value, str) and is_manifest_slot(key, value):
+                entries.append((key, partial(fill_manifest_value, key, value)))
+            else:
+                entries.append((key, compile_manifest_node(value, verbatim)))
+        return lambda variables: node_type((key, render(variables)) for key, render in entries)
+    if isinstance(node, list):
+        items = [compile_manifest_node(value, verbatim) for value in node]
+        return lambda variables: [render(variables) for render in items]
+    # Strings in lists are not filled by replace_manifest_placeholders either
+    return partial(constant, node)
+
+def compile_compose_node(node):
+    """Compiled counterpart of replace_compose_placeholders for one parsed compose node."""
+    if isinstance(node, dict):
+        entries = []
+        for key, value in node.items():
+            render_key = partial(fill_compose_key, key) if isinstance(key, str) and is_compose_slot(key) else partial(constant, key)
+            entries.append((render_key, compile_compose_node(value)))
+        return lambda variables: {render_key(variables): render(variables) for render_key, render in entries}
+    if isinstance(node, list):
+        items = [compile_compose_node(value) for value in node]
+        return lambda variables: [render(variables) for render in items]
+    if isinstance(node, str) and is_compose_slot(node):
+        return partial(fill_compose_string, node)
+    return partial(constant, node)
+
+class ServiceTemplate:
+    """
+    A template file of microsvc-manifests, microsvc-composes or app, read and parsed once.
+
+    Templates with dynamic placeholders (e.g. __BACKEND_PROJECT_INFO_JSON_PLACEHOLDER__ of the
+    app templates) only become valid yaml once those are replaced for a workflow, so they are
+    not parsed here: their text goes through replace_dynamic_*_placeholder and is parsed per
+    render. Any other template that does not parse fails the load.
+    """
+    def __init__(self, path, compile_node):
+        self.path = path
+        with open(os.path.join(TEMPLATES_DIR, path), "r") as f:
+            self.text = f.read()
+        self.dynamic = DYNAMIC_PLACEHOLDER_PATTERN.search(self.text) is not None
+        match = HEALTHCHECK_ENDPOINT_PATTERN.search(self.text)
+        self.healthcheck_endpoint = match.group(1) if match else None
+        self.documents = None
+        if not self.dynamic:
+            self.documents = tuple(compile_node(doc) for doc in ordered_load_all(self.text, yaml.SafeLoader))
+
+    def render(self, variables):
+        return [render(variables) for render in self.documents]
+
+class TemplateRegistry:
+    """The manifest and compose templates of every service type, preparsed at startup."""
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.manifests = None
+        self.composes = None
+
+    def load(self):
+        manifests = {path: ServiceTemplate(path, compile_manifest_node) for path in set(manifest_map.values())}
+        composes = {path: ServiceTemplate(path, compile_compose_node) for path in set(compose_map.values())}
+        with self.lock:
+            self.manifests = {service_type: manifests[path] for service_type, path in manifest_map.items()}
+            self.composes = {service_type: composes[path] for service_type, path in compose_map.items()}
+        print(f"Loaded {len(manifests)} manifest and {len(composes)} compose templates")
+
+    def manifest(self, service_type):
+        if self.manifests is None:
+            self.load()
+        return self.manifests[service_type]
+
+    def compose(self, service_type):
+        if self.composes is None:
+            self.load()
+        return self.composes[service_type]
+
+template_registry = TemplateRegistry()
+
+def add_healthcheck_endpoints(proj_info_json, opea_services):
+    """Return a copy of proj_info_json where each OPEA node carries the HEALTHCHECK_ENDPOINT
+    of its manifest, so that app-backend can probe the same dependency at runtime."""
+    proj_info_copy = copy.deepcopy(proj_info_json)
+    for node_name, node_info in proj_info_copy['nodes'].items():
+        service_info = opea_services['services'].get(node_name)
+        if not service_info or service_info['service_type'] not in manifest_map:
+            continue
+        healthcheck_endpoint = template_registry.manifest(service_info['service_type']).healthcheck_endpoint
+        if not healthcheck_endpoint:
+            continue
+        try:
+            healthcheck_endpoint = healthcheck_endpoint.format(**service_info)
+        except KeyError:
+            continue
+        # Skip dependencies that are not deployed in the sandbox (e.g. OpenAI as LLM engine)
+        if 'NA' not in healthcheck_endpoint.split(':'):
+            node_info['healthcheck_endpoint'] = healthcheck_endpoint
+    return proj_info_copy
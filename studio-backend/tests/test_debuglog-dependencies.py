@@ -0,0 +1,52 @@
+# Copyright (C) 2024 Intel Corporation
+# SPDX-License-Identifier: Apache-2.0
+
+import re
+from types import SimpleNamespace
+
+import pytest
+from app.routers.debuglog_router import ServiceIndex
+
+SERVICE_NAMES = ["tei", "tei-0", "redis-vector-db", "llm-uservice", "tgi-service-m"]
+
+TEXTS = [
+    "http://tei-0:80",
+    "tei",
+    "tei_endpoint",
+    "TEI_EMBEDDING_ENDPOINT=http://tei-0.sandbox-1.svc.cluster.local:80",
+    "redis://redis-vector-db:6379",
+    "redis-vector-db-0",
+    "my-llm-uservice:9000,tgi-service-m:80",
+    "tgi-service",
+    '{"dependent_services": ["tei", "llm-uservice"]}',
+    "",
+]
+
+
+def named(name, **fields):
+    return SimpleNamespace(metadata=SimpleNamespace(name=name, labels=fields.pop("labels", None)), **fields)
+
+
+SERVICE_INDEX = ServiceIndex(
+    SimpleNamespace(items=[named(f"{name}-pod", labels={"app": name}) for name in SERVICE_NAMES]),
+    SimpleNamespace(items=[named(name, spec=SimpleNamespace(selector={"app": name})) for name in SERVICE_NAMES]
+                    + [named("headless", spec=SimpleNamespace(selector=None))]),
+)
+
+
+@pytest.mark.parametrize("text", TEXTS)
+def test_referenced_services_match_whole_words(text):
+    expected = {name for name in SERVICE_NAMES if re.search(r'\b' + re.escape(name) + r'\b', text)}
+
+    assert set(SERVICE_INDEX.referenced_services(text)) == expected
+
+
+def test_service_inside_a_longer_word_is_not_referenced():
+    # The old substring check matched tei here
+    assert SERVICE_INDEX.referenced_services("tei_endpoint") == []
+    assert SERVICE_INDEX.referenced_services("http://tei-0:80") == ["tei", "tei-0"]
+
+
+def test_service_pods_follow_selectors():
+    assert SERVICE_INDEX.service_pods["redis-vector-db"] == ["redis-vector-db-pod"]
+    assert "headless" not in SERVICE_INDEX.service_pods
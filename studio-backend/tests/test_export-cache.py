@@ -0,0 +1,52 @@
+# Copyright (C) 2024 Intel Corporation
+# SPDX-License-Identifier: Apache-2.0
+
+from collections import OrderedDict
+
+import pytest
+from app.services import exporter_service
+from app.services.exporter_service import cached_export, export_cache_key
+
+PROJ_INFO = {"id": "workflow-0", "nodes": {"chat_input_0": {"name": "chat_input", "params": {}}}}
+
+
+@pytest.fixture
+def export_cache(monkeypatch):
+    cache = OrderedDict()
+    monkeypatch.setattr(exporter_service, "_export_cache", cache)
+    return cache
+
+
+def test_export_cache_key_depends_on_content_not_order():
+    key = export_cache_key("manifest", PROJ_INFO, True)
+
+    assert export_cache_key("manifest", dict(reversed(list(PROJ_INFO.items()))), True) == key
+    assert export_cache_key("compose", PROJ_INFO) != key
+    assert export_cache_key("manifest", PROJ_INFO, False) != key
+    assert export_cache_key("manifest", {**PROJ_INFO, "id": "workflow-1"}, True) != key
+
+
+def test_env_var_change_invalidates_cache(export_cache, monkeypatch):
+    calls = []
+    render = lambda: calls.append("manifest") or "manifest"
+
+    monkeypatch.setenv("REGISTRY", "registry-a.example.com")
+    assert cached_export(export_cache_key("manifest", PROJ_INFO, True), render) == "manifest"
+    assert cached_export(export_cache_key("manifest", PROJ_INFO, True), render) == "manifest"
+    monkeypatch.setenv("REGISTRY", "registry-b.example.com")
+    cached_export(export_cache_key("manifest", PROJ_INFO, True), render)
+
+    assert len(calls) == 2
+
+
+def test_cache_evicts_least_recently_used(export_cache, monkeypatch):
+    monkeypatch.setattr(exporter_service, "EXPORT_CACHE_SIZE", 2)
+    keys = [export_cache_key("compose", {**PROJ_INFO, "id": f"workflow-{i}"}) for i in range(3)]
+
+    cached_export(keys[0], lambda: "compose-0")
+    cached_export(keys[1], lambda: "compose-1")
+    # workflow-0 is exported again, so workflow-1 is the least recently used
+    cached_export(keys[0], lambda: "stale")
+    cached_export(keys[2], lambda: "compose-2")
+
+    assert list(export_cache.items()) == [(keys[0], "compose-0"), (keys[2], "compose-2")]
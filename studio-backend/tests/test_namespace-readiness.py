@@ -0,0 +1,60 @@
+# Copyright (C) 2024 Intel Corporation
+# SPDX-License-Identifier: Apache-2.0
+
+from types import SimpleNamespace
+
+from app.utils.namespace_utils import REVISION_ANNOTATION, evaluate_readiness
+
+
+def owned_by(kind, name):
+    return [SimpleNamespace(kind=kind, name=name)]
+
+
+def deployment(revision, generation=2, observed_generation=2):
+    return SimpleNamespace(
+        metadata=SimpleNamespace(name="llm-uservice", generation=generation, annotations={REVISION_ANNOTATION: revision}),
+        spec=SimpleNamespace(replicas=1),
+        status=SimpleNamespace(observed_generation=observed_generation, available_replicas=1, updated_replicas=0),
+    )
+
+
+def replica_set(name, revision):
+    return SimpleNamespace(metadata=SimpleNamespace(
+        name=name, annotations={REVISION_ANNOTATION: revision}, owner_references=owned_by("Deployment", "llm-uservice"),
+    ))
+
+
+def pod(name, replica_set_name, waiting_reason=None, restart_count=0):
+    state = SimpleNamespace(waiting=SimpleNamespace(reason=waiting_reason) if waiting_reason else None, terminated=None, running=None)
+    container = SimpleNamespace(name="server", ready=waiting_reason is None, state=state, restart_count=restart_count)
+    return SimpleNamespace(
+        metadata=SimpleNamespace(name=name, owner_references=owned_by("ReplicaSet", replica_set_name)),
+        status=SimpleNamespace(phase="Running", container_statuses=[container]),
+    )
+
+
+CRASHING_OLD_POD = pod("llm-uservice-old-x", "llm-uservice-old", "CrashLoopBackOff", restart_count=5)
+REPLICA_SETS = [replica_set("llm-uservice-old", "1"), replica_set("llm-uservice-new", "2")]
+
+
+def test_crashing_pod_of_the_current_revision_fails():
+    state, progress = evaluate_readiness([CRASHING_OLD_POD], [deployment("1", 1, 1)], [], REPLICA_SETS[:1])
+
+    assert state == "Failed"
+    assert progress["pod/llm-uservice-old-x"].startswith("Failed")
+
+
+def test_rollout_not_observed_yet_ignores_the_old_pods():
+    state, progress = evaluate_readiness([CRASHING_OLD_POD], [deployment("1", generation=2, observed_generation=1)], [], REPLICA_SETS[:1])
+
+    assert state == "Pending"
+    assert "pod/llm-uservice-old-x" not in progress
+
+
+def test_rollout_ignores_the_pods_of_previous_revisions():
+    pods = [CRASHING_OLD_POD, pod("llm-uservice-new-x", "llm-uservice-new", "ContainerCreating")]
+
+    state, progress = evaluate_readiness(pods, [deployment("2")], [], REPLICA_SETS)
+
+    assert state == "Pending"
+    assert progress == {"pod/llm-uservice-new-x": "Pending", "deployment/llm-uservice": "1/1"}
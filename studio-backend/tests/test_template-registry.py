@@ -0,0 +1,67 @@
+# Copyright (C) 2024 Intel Corporation
+# SPDX-License-Identifier: Apache-2.0
+
+import json
+import os
+
+import pytest
+import yaml
+from app.services.workflow_info_service import WorkflowInfo
+from app.utils.exporter_utils import TEMPLATES_DIR, process_opea_services
+from app.utils.placeholders_utils import ordered_load_all, replace_compose_placeholders, replace_manifest_placeholders
+from app.utils import template_utils
+from app.utils.template_utils import ServiceTemplate, TemplateRegistry, compile_compose_node
+
+SAMPLE_WORKFLOWS_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))), "sample-workflows")
+
+
+def sample_services():
+    """Service infos of every service of the sample workflows, as the exporters get them."""
+    services = []
+    for file_name in sorted(os.listdir(SAMPLE_WORKFLOWS_DIR)):
+        with open(os.path.join(SAMPLE_WORKFLOWS_DIR, file_name), "r") as f:
+            flow_data = json.load(f)
+        pipeline = {
+            "id": file_name,
+            "name": file_name,
+            "flowData": {"nodes": [node["data"] for node in flow_data["nodes"]], "edges": flow_data["edges"]},
+        }
+        proj_info = json.loads(WorkflowInfo(pipeline).export_to_json())
+        for service_name, service_info in process_opea_services(proj_info)["services"].items():
+            services.append(pytest.param(service_info, id=f"{file_name}:{service_name}"))
+    return services
+
+
+registry = TemplateRegistry()
+registry.load()
+
+
+def dump(documents):
+    return yaml.safe_dump_all(documents, default_flow_style=False, width=float("inf"), allow_unicode=True, sort_keys=False)
+
+
+def replaced(template, replace_placeholders, service_info):
+    """What the exporters rendered before the registry: parse the template file and replace in place."""
+    with open(os.path.join(TEMPLATES_DIR, template.path), "r") as f:
+        return [replace_placeholders(doc, service_info) for doc in ordered_load_all(f.read(), yaml.SafeLoader)]
+
+
+@pytest.mark.parametrize("service_info", sample_services())
+def test_registry_renders_like_replace_placeholders(service_info):
+    manifest = registry.manifest(service_info["service_type"])
+    compose = registry.compose(service_info["service_type"])
+
+    if manifest.documents is not None:
+        assert dump(manifest.render(service_info)) == dump(replaced(manifest, replace_manifest_placeholders, service_info))
+    if compose.documents is not None:
+        assert dump(compose.render(service_info)) == dump(replaced(compose, replace_compose_placeholders, service_info))
+
+
+def test_only_placeholder_templates_skip_parsing(tmp_path, monkeypatch):
+    monkeypatch.setattr(template_utils, "TEMPLATES_DIR", str(tmp_path))
+    (tmp_path / "dynamic.yaml").write_text("command:\n  __AGENT_ENDPOINTS__\n  - [unclosed\n")
+    (tmp_path / "broken.yaml").write_text("command:\n  - [unclosed\n")
+
+    assert ServiceTemplate("dynamic.yaml", compile_compose_node).dynamic
+    with pytest.raises(yaml.YAMLError):
+        ServiceTemplate("broken.yaml", compile_compose_node)
@@ -0,0 +1,99 @@
+# Copyright (C) 2024 Intel Corporation
+# SPDX-License-Identifier: Apache-2.0
+
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "app", "templates", "tools"))
+import tool_runtime  # noqa: E402
+from tool_runtime import ToolCallCache, normalize_args  # noqa: E402
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr(tool_runtime.time, "monotonic", lambda: now[0])
+    return now
+
+
+def key(query):
+    return ("search_knowledge_base", normalize_args({"query": query}))
+
+
+def test_cache_hit_ignores_whitespace(clock):
+    cache = ToolCallCache(maxsize=4, ttl=60)
+    cache.put(key("what is  OPEA"), "answer")
+
+    assert cache.get(key(" what is OPEA ")) == "answer"
+    assert (cache.hits, cache.misses) == (1, 0)
+
+
+def test_cache_entries_expire_after_ttl(clock):
+    cache = ToolCallCache(maxsize=4, ttl=60)
+    cache.put(key("q"), "answer")
+
+    clock[0] += 59
+    assert cache.get(key("q")) == "answer"
+    clock[0] += 2
+    assert cache.get(key("q")) is tool_runtime._MISS
+    assert (cache.hits, cache.misses) == (1, 1)
+
+
+def test_cache_evicts_least_recently_used(clock):
+    cache = ToolCallCache(maxsize=2, ttl=60)
+    cache.put(key("a"), "A")
+    cache.put(key("b"), "B")
+    # a is used again, so b is the least recently used entry
+    cache.get(key("a"))
+    cache.put(key("c"), "C")
+
+    assert cache.get(key("b")) is tool_runtime._MISS
+    assert cache.get(key("a")) == "A"
+    assert cache.get(key("c")) == "C"
+
+
+def test_tool_cache_is_off_by_default(monkeypatch):
+    monkeypatch.setattr(tool_runtime, "_tool_caches", {})
+    monkeypatch.setattr(tool_runtime, "_tool_cache_config", {})
+    calls = []
+
+    def search(query):
+        calls.append(query)
+        return query.upper()
+
+    assert tool_runtime.cached_call("search_sql_database", search, {"query": "q"}) == "Q"
+    assert tool_runtime.cached_call("search_sql_database", search, {"query": "q"}) == "Q"
+    assert calls == ["q", "q"]
+
+
+def test_tool_cache_config(monkeypatch):
+    monkeypatch.setattr(tool_runtime, "_tool_caches", {})
+    monkeypatch.setattr(tool_runtime, "_tool_cache_config", {"search_knowledge_base": {"ttl": 300, "maxsize": 8}})
+    calls = []
+
+    def search(query):
+        calls.append(query)
+        return query.upper()
+
+    assert tool_runtime.cached_call("search_knowledge_base", search, {"query": "q"}) == "Q"
+    assert tool_runtime.cached_call("search_knowledge_base", search, {"query": "q "}) == "Q"
+    assert calls == ["q"]
+    assert tool_runtime.tool_cache("search_knowledge_base").maxsize == 8
+
+
+def test_failed_calls_are_not_cached(monkeypatch):
+    monkeypatch.setattr(tool_runtime, "_tool_caches", {})
+    monkeypatch.setattr(tool_runtime, "_tool_cache_config", {"search_knowledge_base": {"ttl": 300}})
+    answers = [tool_runtime.ToolError("Error parsing response from the knowledge base."), "docs"]
+
+    def search(query):
+        answer = answers.pop(0)
+        if isinstance(answer, Exception):
+            raise answer
+        return answer
+
+    assert tool_runtime.cached_call("search_knowledge_base", search, {"query": "q"}) == "Error parsing response from the knowledge base."
+    assert tool_runtime.cached_call("search_knowledge_base", search, {"query": "q"}) == "docs"
+    assert tool_runtime.cached_call("search_knowledge_base", search, {"query": "q"}) == "docs"
@@ -6,6 +6,7 @@ const config = {
     borderRadius: 12,
     studio_server_url: import.meta.env.VITE_STUDIO_SERVER_URL || '',
     sandbox_status_endpoint: import.meta.env.VITE_SANDBOX_STATUS_ENDPOINT || 'studio-backend/ws/sandbox-status',
+    sandbox_podlogs_endpoint: import.meta.env.VITE_SANDBOX_PODLOGS_ENDPOINT || 'studio-backend/ws/podlogs',
     sandbox_tracer_list_endpoint: import.meta.env.VITE_SANDBOX_TRACER_LIST || 'studio-backend/trace-ids',
     sandbox_tracer_tree_endpoint: import.meta.env.VITE_SANDBOX_TRACER_TREE || 'studio-backend/trace-tree',
 }
@@ -22,6 +22,13 @@ import { tableCellClasses } from "@mui/material/TableCell";
 import chatflowsApi from '@/api/chatflows';
 import useApi from '@/hooks/useApi';
 import ViewHeader from '@/layout/MainLayout/ViewHeader'
+import config from '@/config'
+
+// Live log lines kept per pod, and the delay before a closed live stream reconnects
+const MAX_LIVE_LOG_LINES = 1000;
+const LIVE_STREAM_RETRY_MS = 5000;
+// Pod status and dependencies change along with pod events, the snapshot is refreshed this long after them
+const SNAPSHOT_REFRESH_DELAY_MS = 2000;
 
 const StyledTableCell = styled(TableCell)(({ theme }) => ({
     borderColor: theme.palette.grey[900] + 25,
@@ -46,9 +53,13 @@ export default function PodLogsView() {
     const [selectedPodLogs, setSelectedPodLogs] = useState(null);
     const [selectedPodEvents, setSelectedPodEvents] = useState(null);
     const [workflowName, setWorkflowName] = useState('');
+    const [liveLogs, setLiveLogs] = useState({});
 
     const logsRef = useRef(null);
     const eventsRef = useRef(null);
+    // Resume tokens of the live stream, so a reconnect only receives what is new
+    const resumeTokens = useRef({ since_time: {}, resource_version: null });
+    const refreshTimer = useRef(null);
 
     const { ns } = useParams();
     console.log("ns: ", ns);
@@ -69,18 +80,77 @@ export default function PodLogsView() {
         }
     };
 
+    const scheduleSnapshotRefresh = (ns) => {
+        if (refreshTimer.current) return;
+        refreshTimer.current = setTimeout(() => {
+            refreshTimer.current = null;
+            fetchPodsData(ns);
+        }, SNAPSHOT_REFRESH_DELAY_MS);
+    };
+
     useEffect(() => {
         if (ns) {
+            resumeTokens.current = { since_time: {}, resource_version: null };
+            setLiveLogs({});
             fetchPodsData(ns);
         }
+        return () => {
+            clearTimeout(refreshTimer.current);
+            refreshTimer.current = null;
+        };
     }, [ns]);
 
+    // New log lines and events are pushed over /ws/podlogs instead of polling the whole snapshot
     useEffect(() => {
         if (!autoRefresh || !ns) return;
-        const interval = setInterval(() => {
-            fetchPodsData(ns);
-        }, 5000);
-        return () => clearInterval(interval);
+        let ws = null;
+        let retry = null;
+        let stopped = false;
+        const connect = () => {
+            ws = new WebSocket(`${config.studio_server_url}/${config.sandbox_podlogs_endpoint}/${ns}`);
+            ws.onopen = () => {
+                ws.send(JSON.stringify(resumeTokens.current));
+            };
+            ws.onmessage = (message) => {
+                const batch = JSON.parse(message.data);
+                Object.assign(resumeTokens.current.since_time, batch.since_time);
+                if (batch.resource_version) {
+                    resumeTokens.current.resource_version = batch.resource_version;
+                }
+                if (Object.keys(batch.logs).length > 0) {
+                    setLiveLogs(prev => {
+                        const next = { ...prev };
+                        for (const [podName, lines] of Object.entries(batch.logs)) {
+                            next[podName] = [...(prev[podName] || []), ...lines].slice(-MAX_LIVE_LOG_LINES);
+                        }
+                        return next;
+                    });
+                }
+                if (Object.keys(batch.events).length > 0) {
+                    setPodsData(prev => ({
+                        ...prev,
+                        pods: prev.pods.map(pod => batch.events[pod.name]
+                            ? { ...pod, events: [...pod.events, ...batch.events[pod.name]] }
+                            : pod)
+                    }));
+                    scheduleSnapshotRefresh(ns);
+                }
+                if (batch.unfollowed.length > 0) {
+                    console.log("Pods without live logs:", batch.unfollowed);
+                }
+            };
+            ws.onclose = () => {
+                if (!stopped) {
+                    retry = setTimeout(connect, LIVE_STREAM_RETRY_MS);
+                }
+            };
+        };
+        connect();
+        return () => {
+            stopped = true;
+            clearTimeout(retry);
+            ws?.close();
+        };
     }, [autoRefresh, ns]);
 
     useEffect(() => {
@@ -124,6 +194,9 @@ export default function PodLogsView() {
         setSelectedPodEvents(podName);
     };
 
+    // The live stream starts with the last lines of every pod, so it replaces the snapshot logs
+    const podLogs = (pod) => liveLogs[pod.name] || pod.logs;
+
     const selectedLogPod = podsData.pods.find(p => p.name === selectedPodLogs);
     const selectedEventPod = podsData.pods.find(p => p.name === selectedPodEvents);
 
@@ -190,7 +263,7 @@ export default function PodLogsView() {
                                     )}
                                 </StyledTableCell>
                                 <StyledTableCell>
-                                    {pod.logs && pod.logs.length > 0 && (
+                                    {podLogs(pod) && podLogs(pod).length > 0 && (
                                         <Button variant="outlined" size="small" onClick={() => handleExpandLogs(pod.name)}>Details</Button>
                                     )}
                                 </StyledTableCell>
@@ -213,7 +286,7 @@ export default function PodLogsView() {
                         <Divider sx={{ my: 1 }} />
                         <Box sx={{ flex: 1, overflow: 'auto', mb: 2 }} ref={logsRef}>
                             <pre style={{ whiteSpace: 'pre-wrap', wordWrap: 'break-word', margin: 0 }}>
-                                {selectedLogPod?.logs?.join('\n') || 'No logs available'}
+                                {(selectedLogPod && podLogs(selectedLogPod)?.join('\n')) || 'No logs available'}
                             </pre>
                         </Box>
                         <Box textAlign="right">